@@ -0,0 +1,98 @@
+from repository import ATOMIC_FIELDS
+
+
+class ConflictError(Exception):
+    pass
+
+
+# Read-modify-write of a user's atomic fields (see repository.ATOMIC_FIELDS).
+# change(values) edits a copy of the current values and returns a result, or
+# None to leave the user untouched; the edit is applied with repo.cas_user
+# and retried on the refreshed values if another worker got there first.
+# Returns change()'s result, or None.
+def update_user(repo, uid, change, retries=100):
+    u = repo.users[uid]
+    for _ in range(retries):
+        expected = {f: getattr(u, f) for f in ATOMIC_FIELDS}
+        values = dict(expected)
+        result = change(values)
+        if result is None:
+            return None
+        if repo.cas_user(uid, expected, values):
+            return result
+    raise ConflictError(f"User {uid}: gave up after {retries} conflicting updates")
+
+
+# Daily counters belong to the day in last_reset (a day ordinal, see
+# records.day_ordinal) and restart on the first write of a later day
+def roll_day(values, day):
+    if values["last_reset"] == day:
+        return False
+    values["videos_today"] = 0
+    values["extra_videos_today"] = 0
+    values["last_reset"] = day
+    return True
+
+
+# Reserve one video. plan_limit is the premium plan's daily limit, or None for
+# free users, who may go past free_limit on credits: each extra video needs
+# half a credit, charged on every second one. Returns (field, charged, rolled)
+# for release_video, or None once the limit is reached.
+def reserve_video(values, day, plan_limit, free_limit):
+    rolled = roll_day(values, day)
+    if plan_limit is not None:
+        if values["videos_today"] >= plan_limit:
+            return None
+        field = "videos_today"
+    elif values["videos_today"] < free_limit:
+        field = "videos_today"
+    elif values["extra_videos_today"] + 1 > values["credits"] * 2:
+        return None
+    else:
+        field = "extra_videos_today"
+    values[field] += 1
+    charged = field == "extra_videos_today" and values[field] % 2 == 0 and values["credits"] > 0
+    if charged:
+        values["credits"] -= 1
+    return field, charged, rolled
+
+# Undo a reservation whose video was not delivered (no-op once the day moved on)
+def release_video(values, day, reservation):
+    field, charged, _ = reservation
+    if values["last_reset"] != day or values[field] == 0:
+        return None
+    values[field] -= 1
+    if charged:
+        values["credits"] += 1
+    return True
+
+
+def add_credits(values, n):
+    values["credits"] += n
+    return values["credits"]
+
+def spend_credits(values, n):
+    if values["credits"] < n:
+        return None
+    values["credits"] -= n
+    return values["credits"]
+
+# Reward the referrer: returns the new referral count
+def reward_referral(values):
+    values["credits"] += 1
+    values["referrals"] += 1
+    return values["referrals"]
+
+# Mark a referred user as counted, once
+def claim_referral(values):
+    if values["referred_by"] is None or values["referred_by"] == "counted":
+        return None
+    ref = values["referred_by"]
+    values["referred_by"] = "counted"
+    return ref
+
+def set_referrer(values, ref):
+    if values["referred_by"] is not None:
+        return None
+    values["referred_by"] = ref
+    return ref
@@ -0,0 +1,203 @@
+import os
+import gzip
+import json
+import queue
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# Structured action log: JSON Lines records written by a background thread.
+# log() only enqueues a tuple, so handlers never touch the file. The writer
+# drains the queue in batches (one write + flush per batch) and rotates the
+# file when it passes max_bytes or the day changes; rotated files are gzipped
+# and only the newest `backups` are kept. close() drains and joins.
+# An optional LogIndex is fed each batch's offsets and told about rotations.
+class ActionLog:
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, daily=True, backups=14, compress=True, index=None):
+        self.path = path
+        self.index = index
+        self.max_bytes = max_bytes
+        self.daily = daily
+        self.backups = backups
+        self.compress = compress
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+        self._day = None
+        self.records = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+
+    # ts is an ISO 8601 string; its first 10 chars are the (local) day
+    def log(self, ts, action, uid=None, details=""):
+        self._queue.put((ts, action, uid, details))
+
+    # Writer thread
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="action-log", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout=10.0):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        if self._day is None and self._file.tell():
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(max(0, self._file.tell() - 4096))
+                    last = f.read().splitlines()[-1]
+                self._day = json.loads(last)["ts"][:10]
+            except Exception:
+                pass  # legacy or torn tail: rotate on the next day change
+
+    # Index whatever the current file holds beyond what the index has seen
+    # (first run with an index, or a crash between a write and its index commit)
+    def _catch_up(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        done = self.index.indexed_size(self.path)
+        if done > size:
+            self.index.drop(self.path)
+            done = 0
+        if done == size:
+            return
+        entries = []
+        with open(self.path, "rb") as f:
+            f.seek(done)
+            pos = done
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn tail; the next append completes it
+                try:
+                    r = json.loads(line)
+                    entries.append((pos, _epoch(r["ts"]), r["uid"], r["action"]))
+                except (ValueError, KeyError, TypeError):
+                    pass
+                pos += len(line)
+        self.index.add(self.path, entries, pos)
+
+    def _run(self):
+        if self.index is not None:
+            try:
+                self.index.open()
+                self._catch_up()
+            except Exception as e:
+                logger.error(f"Action log index unavailable: {e}")
+                self.index = None
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopping = True
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Action log write failed: {e}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.index is not None:
+            self.index.close()
+
+    def _write(self, batch):
+        if self._file is None:
+            self._open()
+        lines = []
+        for ts, action, uid, details in batch:
+            day = ts[:10]
+            if self.daily and self._day is not None and day != self._day:
+                self._flush(lines)
+                lines = []
+                self._rotate()
+            self._day = day
+            line = json.dumps({"ts": ts, "action": action, "uid": uid, "details": details}, ensure_ascii=False)
+            lines.append((line.encode() + b"\n", ts, uid, action))
+        self._flush(lines)
+        self.records += len(batch)
+        self.batches += 1
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _flush(self, lines):
+        if not lines:
+            return
+        pos = self._file.tell()
+        self._file.write(b"".join(line for line, _, _, _ in lines))
+        self._file.flush()
+        if self.index is not None:
+            entries = []
+            for line, ts, uid, action in lines:
+                entries.append((pos, _epoch(ts), uid, action))
+                pos += len(line)
+            try:
+                self.index.add(self.path, entries, pos)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Action log index write failed: {e}")
+
+    # Rotation
+    def rotated(self):
+        directory = os.path.dirname(self.path)
+        prefix = os.path.basename(self.path) + "."
+        names = [n for n in os.listdir(directory or ".")
+                 if n.startswith(prefix) and (n[len(prefix):][:1].isdigit() or n[len(prefix):].startswith("undated"))]
+        return sorted((os.path.join(directory, n) for n in names), key=os.path.getmtime)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if os.path.getsize(self.path):
+            self._archive()
+        self._open()
+
+    def _archive(self):
+        base = f"{self.path}.{self._day or 'undated'}"
+        n = 0
+        target = base
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            n += 1
+            target = f"{base}.{n}"
+        os.replace(self.path, target)
+        if self.compress:
+            with open(target, "rb") as src, gzip.open(target + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+            target += ".gz"
+        self.rotations += 1
+        if self.index is not None:
+            self.index.rename(self.path, target)
+        for old in self.rotated()[:-self.backups] if self.backups else []:
+            os.remove(old)
+            if self.index is not None:
+                self.index.drop(old)
+
+    def metrics(self):
+        return {
+            "queued": self._queue.qsize(),
+            "records": self.records,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+
+def _epoch(ts):
+    return int(datetime.fromisoformat(ts).timestamp())
@@ -0,0 +1,124 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+TOTALS = ("users", "premium", "credits", "referrals", "favorites")
+DAILY = ("dau", "videos", "new_users", "referrals")
+
+
+# Running totals for /stats, updated in O(1) at each mutation point instead of
+# walking every user. Per-day event counters (DAU, videos sent, new users,
+# referrals) roll into a compact daily series when the day changes; the series
+# and the current day's state are persisted so restarts keep the trend.
+# check() compares the counters with a from-scratch recount.
+class Aggregates:
+    def __init__(self, path, clock, keep_days=365):
+        self.path = path
+        self.clock = clock                  # returns today's date
+        self.keep_days = keep_days
+        self.totals = dict.fromkeys(TOTALS, 0)
+        self.day = None
+        self.today = dict.fromkeys(DAILY, 0)
+        self.active = set()                 # uids seen today
+        self.series = []                    # [day iso, dau, videos, new_users, referrals, users, premium]
+        self.dirty = False
+
+    # Totals
+    def build(self, users, premium, totals):
+        self.totals.update(users=users, premium=premium, credits=totals["credits"],
+                           referrals=totals["referrals"], favorites=totals["favorites"])
+
+    def add(self, field, delta=1):
+        self.totals[field] += delta
+
+    # Today's counters
+    def _roll(self):
+        day = self.clock()
+        if day == self.day:
+            return
+        if self.day is not None:
+            self.series.append([self.day.isoformat(), *(self.today[k] for k in DAILY),
+                                self.totals["users"], self.totals["premium"]])
+            del self.series[:-self.keep_days]
+        self.day = day
+        self.today = dict.fromkeys(DAILY, 0)
+        self.active = set()
+        self.dirty = True
+
+    def event(self, name, n=1):
+        self._roll()
+        self.today[name] += n
+        self.dirty = True
+
+    def seen(self, uid):
+        self._roll()
+        if uid not in self.active:
+            self.active.add(uid)
+            self.today["dau"] += 1
+            self.dirty = True
+
+    def videos_today(self):
+        self._roll()
+        return self.today["videos"]
+
+    # Last `days` daily rows (oldest first), today included as a partial day
+    def trend(self, days=7):
+        self._roll()
+        rows = [dict(zip(("day",) + DAILY + ("users", "premium"), row)) for row in self.series[-(days - 1):]] if days > 1 else []
+        rows.append({"day": self.day.isoformat(), **self.today,
+                     "users": self.totals["users"], "premium": self.totals["premium"]})
+        return rows
+
+    # Consistency: expected holds the same keys as totals plus "videos"
+    def check(self, expected, repair=True):
+        mismatches = []
+        for field in TOTALS:
+            if self.totals[field] != expected[field]:
+                mismatches.append((field, self.totals[field], expected[field]))
+                if repair:
+                    self.totals[field] = expected[field]
+        if self.videos_today() != expected["videos"]:
+            mismatches.append(("videos", self.today["videos"], expected["videos"]))
+            if repair:
+                self.today["videos"] = expected["videos"]
+        return mismatches
+
+    # Persistence
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.series = data["series"]
+            self.day = date.fromisoformat(data["day"]) if data["day"] else None
+            self.today = {k: data["today"].get(k, 0) for k in DAILY}
+            self.active = set(data["active"])
+        except Exception as e:
+            logger.error(f"Error loading aggregates: {e}")
+
+    def _write(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = {
+            "day": self.day.isoformat() if self.day else None,
+            "today": dict(self.today),
+            "active": list(self.active),
+            "series": self.series[:],
+        }
+        try:
+            await asyncio.to_thread(self._write, data)
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Error saving aggregates: {e}")
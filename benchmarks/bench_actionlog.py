@@ -0,0 +1,63 @@
+# Benchmark: action log throughput, the old open-append-close log_action vs
+# the queued ActionLog writer. "caller us" is the time a handler spends per
+# event; "events/s" includes draining the queue to disk.
+# Usage: python benchmarks/bench_actionlog.py [--events 200000] [--threads 1 4]
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actionlog import ActionLog
+
+TS = "2026-10-18T12:00:00+05:30"
+
+
+def old_log_action(path, action, uid=None, details=""):
+    with open(path, "a") as f:
+        f.write(f"{TS} - {action} - User: {uid} - {details}\n")
+
+
+def drive(emit, events, threads):
+    per = events // threads
+
+    def work(offset):
+        for i in range(offset, offset + per):
+            emit("Video Sent", i, str(i % 5000))
+
+    workers = [threading.Thread(target=work, args=(t * per,)) for t in range(threads)]
+    t = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - t, per * threads
+
+
+def run(events, thread_counts):
+    print(f"{'impl':>10} {'threads':>8} {'caller us':>10} {'events/s':>12} {'rotations':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for threads in thread_counts:
+            path = os.path.join(tmp, f"old_{threads}.txt")
+            elapsed, n = drive(lambda a, u, d: old_log_action(path, a, u, d), events, threads)
+            print(f"{'old':>10} {threads:>8} {elapsed / n * 1e6:>10.2f} {n / elapsed:>12,.0f} {'-':>10}")
+
+            log = ActionLog(os.path.join(tmp, f"new_{threads}.jsonl"), max_bytes=4 * 1024 * 1024, backups=3)
+            log.start()
+            t = time.perf_counter()
+            caller, n = drive(lambda a, u, d: log.log(TS, a, u, d), events, threads)
+            log.close(timeout=600)
+            total = time.perf_counter() - t
+            assert log.records == n, (log.records, n)
+            print(f"{'ActionLog':>10} {threads:>8} {caller / n * 1e6:>10.2f} {n / total:>12,.0f} {log.rotations:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+    run(args.events, args.threads)
@@ -0,0 +1,144 @@
+# Benchmark: "Get Video" pick via channel history scan vs the in-process catalog.
+# Then scans that fail part way (a network error on a history page), cold and
+# warm: the catalog must keep what it had and found, and a retry must reach
+# every video. Exits non-zero if not.
+# Usage: python benchmarks/bench_catalog.py [--videos N] [--page-latency SECONDS]
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import VideoCatalog
+from sampler import UnseenSampler
+
+
+class FakeMessage:
+    def __init__(self, mid, video):
+        self.id = mid
+        self.video = video
+
+
+# Stand-in for Client.get_chat_history: pages of 100 messages, newest first
+class FakeHistoryClient:
+    def __init__(self, messages, page_latency, fail_at_page=None):
+        self.messages = sorted(messages, key=lambda x: x.id, reverse=True)
+        self.page_latency = page_latency
+        self.fail_at_page = fail_at_page  # raise on this page of the next scan
+        self.calls = 0
+
+    async def get_chat_history(self, chat_id, limit=0):
+        total = len(self.messages) if not limit else min(limit, len(self.messages))
+        for page, start in enumerate(range(0, total, 100)):
+            if page == self.fail_at_page:
+                self.fail_at_page = None
+                raise ConnectionError("injected network error")
+            self.calls += 1
+            await asyncio.sleep(self.page_latency)
+            for msg in self.messages[start:min(start + 100, total)]:
+                yield msg
+
+
+async def scan_pick(client, seen):
+    vids = []
+    async for msg in client.get_chat_history(0, limit=1000):
+        if msg.video and msg.id not in seen:
+            vids.append(msg)
+    return random.choice(vids).id if vids else None
+
+
+async def run(videos, page_latency, requests):
+    messages = [FakeMessage(i, video=(i % 5 != 0)) for i in range(1, videos + 1)]
+    client = FakeHistoryClient(messages, page_latency)
+    seen = set(random.sample(range(1, videos + 1), min(50, videos)))
+
+    t = time.perf_counter()
+    for _ in range(requests):
+        await scan_pick(client, seen)
+    scan = (time.perf_counter() - t) / requests
+    scan_calls = client.calls / requests
+
+    path = "bench_catalog.json"
+    catalog = VideoCatalog(path)
+    client.calls = 0
+    t = time.perf_counter()
+    await catalog.sync(client, 0)
+    cold = time.perf_counter() - t
+    cold_calls = client.calls
+
+    warm_catalog = VideoCatalog(path)
+    client.calls = 0
+    t = time.perf_counter()
+    await warm_catalog.sync(client, 0)
+    warm = time.perf_counter() - t
+    warm_calls = client.calls
+    os.remove(path)
+
+    sampler = UnseenSampler()
+    t = time.perf_counter()
+    for _ in range(requests):
+        seen.add(sampler.draw(catalog, seen))
+    pick = (time.perf_counter() - t) / requests
+
+    print(f"videos={videos} page_latency={page_latency * 1000:.0f}ms requests={requests}")
+    print(f"history scan per request : {scan * 1000:10.3f} ms  ({scan_calls:.0f} API pages)")
+    print(f"catalog pick per request : {pick * 1000:10.3f} ms  (0 API pages)")
+    print(f"catalog cold start sync  : {cold * 1000:10.3f} ms  ({cold_calls} API pages, once)")
+    print(f"catalog warm start sync  : {warm * 1000:10.3f} ms  ({warm_calls} API pages, once)")
+
+
+async def check_failed_sync(videos):
+    path = "bench_catalog_failed.json"
+    failures = []
+    messages = [FakeMessage(i, video=(i % 5 != 0)) for i in range(1, videos + 1)]
+    want = {m.id for m in messages if m.video}
+    try:
+        # Cold: fails after 3 pages, keeps the videos found, retry finds the rest
+        client = FakeHistoryClient(messages, 0, fail_at_page=3)
+        catalog = VideoCatalog(path)
+        try:
+            await catalog.sync(client, 0)
+            failures.append("cold scan did not fail")
+        except ConnectionError:
+            pass
+        if len(catalog) != sum(1 for m in messages[-300:] if m.video) or catalog.synced_id != 0:
+            failures.append(f"cold: {len(catalog)} videos / synced_id {catalog.synced_id} after the failure")
+        await catalog.sync(client, 0)
+        if set(catalog) != want:
+            failures.append(f"cold: {len(catalog)} of {len(want)} videos after the retry")
+
+        # Warm: 250 new posts since the last sync, the third page fails; the
+        # loaded catalog stays and the retry reaches the posts the scan missed
+        newer = [FakeMessage(i, video=True) for i in range(videos + 1, videos + 251)]
+        client = FakeHistoryClient(messages + newer, 0, fail_at_page=2)
+        catalog = VideoCatalog(path)
+        try:
+            await catalog.sync(client, 0)
+            failures.append("warm scan did not fail")
+        except ConnectionError:
+            pass
+        if set(catalog) != want | {m.id for m in newer[-200:]} or catalog.synced_id != videos:
+            failures.append(f"warm: {len(catalog)} videos / synced_id {catalog.synced_id} after the failure")
+        await catalog.sync(client, 0)
+        if set(catalog) != want | {m.id for m in newer}:
+            failures.append(f"warm: {len(catalog)} of {len(want) + len(newer)} videos after the retry")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"failed scans: {'ok' if not failures else 'FAILED'}")
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=5000)
+    parser.add_argument("--page-latency", type=float, default=0.02)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.videos, args.page_latency, args.requests))
+    sys.exit(0 if asyncio.run(check_failed_sync(args.videos)) else 1)
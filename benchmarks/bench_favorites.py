@@ -0,0 +1,78 @@
+# Benchmark: favorites as a list (old add_favorite / rewatch checks, first-10
+# view) vs Favorites, per favorites-list size: adding with the duplicate
+# check, membership checks, and reading a page deep into the list (list
+# slice vs cursor page). Also the memory of an empty and a small set.
+# Usage: python benchmarks/bench_favorites.py [--sizes 10 100 1000 10000] [--ops 20000]
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from favorites import Favorites
+
+PAGE = 8
+
+
+def timed(fn, ops):
+    t = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t) / ops * 1e6
+
+
+def list_ops(n, probes, ops):
+    favs = []
+    def add():
+        for vid in range(n):
+            if vid not in favs:
+                favs.append(vid)
+    add_us = timed(add, n)
+    contains_us = timed(lambda: [vid in favs for vid in probes], ops)
+    page_us = timed(lambda: [favs[n // 2:n // 2 + PAGE] for _ in range(ops)], ops)
+    return add_us, contains_us, page_us
+
+
+def favorites_ops(n, probes, ops):
+    favs = Favorites()
+    def add():
+        for vid in range(n):
+            favs.add(vid)
+    add_us = timed(add, n)
+    contains_us = timed(lambda: [vid in favs for vid in probes], ops)
+    page_us = timed(lambda: [favs.page(n // 2, PAGE) for _ in range(ops)], ops)
+    if favs.page(n // 2, PAGE)[1] != list(range(n))[n // 2:n // 2 + PAGE]:
+        raise SystemExit("Favorites page differs from the list slice")
+    return add_us, contains_us, page_us
+
+
+def memory(factory, users, size):
+    tracemalloc.start()
+    store = [factory(range(size)) for _ in range(users)]
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return mem / users
+
+
+def run(sizes, ops):
+    rng = random.Random(3)
+    print(f"{'size':>7} {'kind':>10} {'add us':>8} {'in us':>8} {'page us':>8}")
+    for n in sizes:
+        probes = [rng.randrange(2 * n) for _ in range(ops)]
+        for kind, fn in (("list", list_ops), ("Favorites", favorites_ops)):
+            add_us, contains_us, page_us = fn(n, probes, ops)
+            print(f"{n:>7} {kind:>10} {add_us:8.3f} {contains_us:8.3f} {page_us:8.3f}")
+    print(f"\n{'favorites':>9} {'list B/user':>12} {'Favorites B/user':>17}")
+    for size in (0, 3, 20):
+        print(f"{size:>9} {memory(list, 100000, size):12.0f} {memory(Favorites, 100000, size):17.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--ops", type=int, default=20000)
+    args = parser.parse_args()
+    run(args.sizes, args.ops)
@@ -0,0 +1,60 @@
+# Benchmark: per-mutation persistence latency vs user count, full-file
+# json.dump rewrite (old save_data) vs a Journal append.
+# Usage: python benchmarks/bench_journal.py [--users 1000 10000 100000]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import Journal
+from seenset import SeenSet
+
+
+def synthetic_user(uid):
+    return {
+        "videos_today": uid % 5, "extra_videos_today": 0,
+        "last_reset": "2026-10-18", "credits": uid % 7, "referrals": uid % 11,
+        "referred_by": None, "seen_videos": SeenSet(range(100, 100 + uid % 40)).encode(),
+        "favorite_videos": [], "joined": "2026-01-01T10:00:00+05:30",
+        "notifications": True, "language": "en"
+    }
+
+
+def run(populations, mutations):
+    print(f"{'users':>9} {'full rewrite ms':>16} {'journal append ms':>18} {'compaction ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        snap = os.path.join(tmp, "bot_data.json")
+        for users in populations:
+            data = {"users": {uid: synthetic_user(uid) for uid in range(users)}, "premium": {}, "feedback": {}}
+
+            reps = max(1, min(mutations, 2000000 // users))
+            t = time.perf_counter()
+            for _ in range(reps):
+                with open(snap, "w") as f:
+                    json.dump(data, f)
+            full = (time.perf_counter() - t) / reps
+
+            journal = Journal(snap, os.path.join(tmp, "bot_data.journal"), compact_every=10**9)
+            t = time.perf_counter()
+            for i in range(mutations):
+                uid = i % users
+                journal.append("users", uid, data["users"][uid])
+            append = (time.perf_counter() - t) / mutations
+
+            t = time.perf_counter()
+            journal.compact(data)
+            compact = time.perf_counter() - t
+            journal.close()
+            print(f"{users:>9} {full * 1000:16.3f} {append * 1000:18.4f} {compact * 1000:14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--mutations", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.users, args.mutations)
@@ -0,0 +1,108 @@
+# Benchmark: leaderboard top 10 + caller rank via full sorts (old handler)
+# vs ReferralIndex, plus the cost of a referral update. Then the cross-worker
+# path: an index built at startup that only learns of users registered by
+# other workers through set() (zero or more referrals), mixed with updates to
+# users it knows with none, must end equal to a fresh build. Exits non-zero
+# if not.
+# Usage: python benchmarks/bench_leaderboard.py [--users 1000000]
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import ReferralIndex
+
+
+def sorted_query(users, uid):
+    top = sorted(users.items(), key=lambda x: x[1]["referrals"], reverse=True)[:10]
+    pos = next((i + 1 for i, (k, v) in enumerate(sorted(users.items(), key=lambda x: x[1]["referrals"], reverse=True)) if k == uid), None)
+    return top, pos
+
+
+def run(n, queries):
+    rng = random.Random(7)
+    # Most users never refer anyone; a few refer a lot
+    users = {uid: {"referrals": int(rng.paretovariate(1.2)) - 1 if rng.random() < 0.1 else 0} for uid in range(n)}
+
+    t = time.perf_counter()
+    index = ReferralIndex()
+    index.build((uid, u["referrals"]) for uid, u in users.items())
+    build = time.perf_counter() - t
+
+    sample = [rng.randrange(n) for _ in range(queries)]
+    t = time.perf_counter()
+    for uid in sample[:3]:
+        expected_top, _ = sorted_query(users, uid)
+    naive = (time.perf_counter() - t) / 3
+
+    t = time.perf_counter()
+    for uid in sample:
+        top = index.top(10)
+        index.rank(users[uid]["referrals"])
+    fast = (time.perf_counter() - t) / queries
+
+    assert [r for _, r in top] == [u["referrals"] for _, u in expected_top]
+    pairs = [(uid, users[uid]["referrals"]) for uid in range(min(n, 20000))]
+    incremental, bulk = ReferralIndex(), ReferralIndex()
+    for uid, referrals in pairs:
+        incremental.add(uid, referrals)
+    bulk.build(pairs)
+    assert (incremental.tree, incremental.values) == (bulk.tree, bulk.values)
+    uid = sample[0]
+    greater = sum(1 for u in users.values() if u["referrals"] > users[uid]["referrals"])
+    assert index.rank(users[uid]["referrals"]) == greater + 1
+
+    t = time.perf_counter()
+    for uid in sample:
+        old = users[uid]["referrals"]
+        users[uid]["referrals"] += 1
+        index.set(uid, old + 1)
+    update = (time.perf_counter() - t) / queries
+
+    print(f"users={n}")
+    print(f"index build (startup)      : {build * 1000:12.1f} ms")
+    print(f"sorted top10 + rank / query: {naive * 1000:12.1f} ms")
+    print(f"index  top10 + rank / query: {fast * 1000:12.4f} ms")
+    print(f"index  referral update     : {update * 1000:12.4f} ms")
+
+
+# Ties keep insertion order in the buckets, so members are compared as sets
+def state(index):
+    return (index.total, index.freq, index.tree, index.values, index.counts,
+            {value: set(bucket) for value, bucket in index.buckets.items()}, [r for _, r in index.top(50)])
+
+
+def check_cross_worker(n):
+    rng = random.Random(11)
+    truth = {uid: rng.choice((0, 0, 0, 1, 2, 5)) for uid in range(n)}
+    index = ReferralIndex()
+    index.build(truth.items())
+    for step in range(4 * n):
+        uid = rng.randrange(2 * n)  # half of these were registered by another worker
+        if uid not in truth:
+            truth[uid] = 0
+            if rng.random() < 0.5:
+                continue  # not seen by this worker yet
+        if rng.random() < 0.3:
+            truth[uid] += 1  # a referral rewarded here or by another worker
+        index.set(uid, truth[uid])
+    for uid in truth:  # every user seen once at last (e.g. /start)
+        index.set(uid, truth[uid])
+    want = ReferralIndex()
+    want.build(truth.items())
+    ok = (state(index) == state(want) and len(index) == len(truth)
+          and index.rank(0) == sum(1 for r in truth.values() if r > 0) + 1)
+    print(f"cross-worker set()         : {'ok' if ok else 'FAILED'} ({len(truth)} users, {index.total} indexed)")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.users, args.queries)
+    sys.exit(0 if check_cross_worker(20000) else 1)
@@ -0,0 +1,102 @@
+# Memory benchmark: in-memory user and premium records, the old dict records
+# (datetime / date values, language on every user) vs the slotted records in
+# records.py (ints for dates, language in a side table). Both variants share
+# the same seen_videos and favorites contents, so the difference is the record
+# itself. Also checks that the stored form is unchanged.
+# Usage: python benchmarks/bench_records.py [--users 100000 1000000] [--premium-share 0.05]
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seenset import SeenSet
+from records import User, Premium, day_ordinal
+from repository import encode_user, decode_user
+
+TZ = timezone(timedelta(hours=5, minutes=30))
+START = datetime(2026, 1, 1, tzinfo=TZ)
+PLANS = ("silver", "gold", "platinum")
+
+
+def dict_user(rng, uid):
+    joined = START + timedelta(seconds=rng.randrange(200 * 86400))
+    return {
+        "videos_today": rng.randrange(5), "extra_videos_today": 0,
+        "last_reset": (joined + timedelta(days=rng.randrange(90))).date(),
+        "credits": rng.randrange(20), "referrals": rng.randrange(5), "referred_by": None,
+        "seen_videos": SeenSet(range(100, 100 + rng.randrange(8))), "favorite_videos": [],
+        "joined": joined, "notifications": True, "language": "hi" if uid % 50 == 0 else "en",
+    }
+
+
+def record_user(rng, uid, languages):
+    joined = START + timedelta(seconds=rng.randrange(200 * 86400))
+    u = User(
+        last_reset=day_ordinal((joined + timedelta(days=rng.randrange(90))).date()),
+        joined=int(joined.timestamp()), videos_today=rng.randrange(5), credits=rng.randrange(20),
+        referrals=rng.randrange(5), seen_videos=SeenSet(range(100, 100 + rng.randrange(8))),
+    )
+    if uid % 50 == 0:
+        languages[uid] = "hi"
+    return u
+
+
+def dict_premium(rng):
+    return {"plan": rng.choice(PLANS), "expiry": START + timedelta(seconds=rng.randrange(30 * 86400))}
+
+
+def record_premium(rng):
+    return Premium(rng.choice(PLANS), int((START + timedelta(seconds=rng.randrange(30 * 86400))).timestamp()))
+
+
+def measure(users, premium_share, kind):
+    rng = random.Random(7)
+    languages = {}
+    tracemalloc.start()
+    store = {}
+    for uid in range(users):
+        store[uid] = dict_user(rng, uid) if kind == "dict" else record_user(rng, uid, languages)
+    user_mem = tracemalloc.get_traced_memory()[0]
+    premium = {}
+    for uid in range(int(users * premium_share)):
+        premium[uid] = dict_premium(rng) if kind == "dict" else record_premium(rng)
+    premium_mem = tracemalloc.get_traced_memory()[0] - user_mem
+    tracemalloc.stop()
+    return user_mem, premium_mem, len(premium)
+
+
+def check_roundtrip():
+    languages = {}
+    raw = {
+        "videos_today": 2, "extra_videos_today": 1, "last_reset": "2026-10-18", "credits": 4,
+        "referrals": 3, "referred_by": "counted", "seen_videos": SeenSet([5, 9]).encode(),
+        "favorite_videos": [9], "joined": "2026-01-01T10:00:00+05:30", "notifications": False,
+        "language": "hi",
+    }
+    again = encode_user(1, decode_user(1, raw, languages), languages)
+    if again != {**raw, "joined": "2026-01-01T04:30:00+00:00"}:
+        raise SystemExit(f"Stored form changed: {again}")
+
+
+def run(populations, premium_share):
+    check_roundtrip()
+    print(f"{'users':>9} {'kind':>6} {'users MB':>9} {'B/user':>7} {'premium MB':>11} {'B/entry':>8}")
+    for users in populations:
+        results = {kind: measure(users, premium_share, kind) for kind in ("dict", "record")}
+        for kind, (user_mem, premium_mem, entries) in results.items():
+            print(f"{users:>9} {kind:>6} {user_mem / 1024 / 1024:9.1f} {user_mem / users:7.0f} "
+                  f"{premium_mem / 1024 / 1024:11.2f} {premium_mem / max(1, entries):8.0f}")
+        saved = 1 - results["record"][0] / results["dict"][0]
+        print(f"{'':>9} users: {saved:.0%} less memory")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--premium-share", type=float, default=0.05, help="fraction of users with premium")
+    args = parser.parse_args()
+    run(args.users, args.premium_share)
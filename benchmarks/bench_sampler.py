@@ -0,0 +1,99 @@
+# Benchmark: filter-then-random.choice vs UnseenSampler per "Get Video" pick,
+# from a fresh user up to one who has seen almost the whole catalog. Then the
+# memory of per-user samplers kept in a plain dict vs the bounded SamplerCache,
+# and a check that draws whose delivery failed (put_back) are offered again.
+# Usage: python benchmarks/bench_sampler.py [--videos N] [--users 1000] [--user-draws 200] [--capacity 100]
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import VideoCatalog
+from sampler import UnseenSampler, SamplerCache
+
+
+def filter_choice(catalog, seen):
+    vids = [v for v in catalog if v not in seen]
+    return random.choice(vids) if vids else None
+
+
+def run(videos, draws):
+    catalog = VideoCatalog(os.devnull)
+    for vid in range(1, videos + 1):
+        catalog.add(vid)
+    print(f"videos={videos} draws per point={draws}")
+    print(f"{'seen %':>8} {'filter+choice us':>18} {'sampler us':>12}")
+    for frac in (0.0, 0.5, 0.9, 0.99):
+        base = set(random.sample(range(1, videos + 1), int(videos * frac)))
+
+        seen = set(base)
+        t = time.perf_counter()
+        for _ in range(draws):
+            seen.add(filter_choice(catalog, seen))
+        naive = (time.perf_counter() - t) / draws
+
+        # A warm sampler: the user reached this point through the sampler itself
+        seen = set()
+        sampler = UnseenSampler()
+        for _ in range(len(base)):
+            seen.add(sampler.draw(catalog, seen))
+        t = time.perf_counter()
+        for _ in range(draws):
+            seen.add(sampler.draw(catalog, seen))
+        fast = (time.perf_counter() - t) / draws
+        print(f"{frac * 100:8.0f} {naive * 1e6:18.2f} {fast * 1e6:12.2f}")
+
+
+def sampler_memory(catalog, users, draws, capacity):
+    print(f"\n{users} users x {draws} draws")
+    for kind in ("dict", "SamplerCache"):
+        tracemalloc.start()
+        samplers = {} if kind == "dict" else SamplerCache(capacity)
+        for uid in range(users):
+            sampler = samplers.setdefault(uid, UnseenSampler()) if kind == "dict" else samplers.get(uid)
+            seen = set()
+            for _ in range(draws):
+                seen.add(sampler.draw(catalog, seen))
+        mem = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{kind:>13} ({len(samplers)} kept): {mem / 1024 / 1024:.1f} MB")
+
+
+# Every third delivery fails and is put back; the user must still get every
+# video exactly once
+def check_put_back(catalog):
+    sampler = UnseenSampler()
+    seen = set()
+    attempts = 0
+    while True:
+        vid = sampler.draw(catalog, seen)
+        if vid is None:
+            break
+        attempts += 1
+        if attempts % 3 == 0:
+            sampler.put_back(catalog, vid)
+        else:
+            seen.add(vid)
+    if seen != set(catalog):
+        raise SystemExit(f"put_back lost videos: {len(catalog) - len(seen)} never offered again")
+    print(f"put_back: all {len(seen)} videos delivered after {attempts - len(seen)} failed deliveries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--draws", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--user-draws", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=100, help="SamplerCache capacity")
+    args = parser.parse_args()
+    run(args.videos, args.draws)
+    catalog = VideoCatalog(os.devnull)
+    for vid in range(1, args.videos + 1):
+        catalog.add(vid)
+    sampler_memory(catalog, args.users, args.user_draws, args.capacity)
+    check_put_back(catalog)
@@ -0,0 +1,59 @@
+# Memory benchmark: per-user seen_videos as set() vs SeenSet, in memory and
+# as serialised in bot_data.json, for synthetic user populations.
+# Usage: python benchmarks/bench_seenset.py [--users 100000 1000000] [--videos N] [--kinds set SeenSet]
+import os
+import sys
+import json
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seenset import SeenSet
+
+
+# Most users watch a handful of videos; a long tail binges the catalog
+def synthetic_seen(rng, videos):
+    r = rng.random()
+    if r < 0.80:
+        n = rng.randint(1, 10)
+    elif r < 0.98:
+        n = rng.randint(10, 100)
+    else:
+        n = rng.randint(100, videos // 5)
+    first = videos // 10  # channel message ids start well above 1
+    return rng.sample(range(first, first + videos), n)
+
+
+def measure(users, videos, kind):
+    rng = random.Random(42)
+    tracemalloc.start()
+    store = {}
+    for uid in range(users):
+        ids = synthetic_seen(rng, videos)
+        store[uid] = set(ids) if kind == "set" else SeenSet(sorted(ids))
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    disk = 0
+    for s in store.values():
+        disk += len(json.dumps(list(s) if kind == "set" else s.encode()))
+    return mem, disk
+
+
+def run(populations, videos, kinds):
+    print(f"videos in channel={videos}")
+    print(f"{'users':>9} {'kind':>8} {'heap MB':>10} {'JSON MB':>10}")
+    for users in populations:
+        for kind in kinds:
+            mem, disk = measure(users, videos, kind)
+            print(f"{users:>9} {kind:>8} {mem / 2**20:10.1f} {disk / 2**20:10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--videos", type=int, default=5000)
+    parser.add_argument("--kinds", nargs="+", default=["set", "SeenSet"])
+    args = parser.parse_args()
+    run(args.users, args.videos, args.kinds)
@@ -0,0 +1,219 @@
+# Benchmark: several worker processes updating one SQLite store, the shared
+# mode main.py runs with WORKERS > 1. Every worker reserves videos for the
+# same users (free limit plus credit-paid extras) and rewards referrals to one
+# hot user, all through accounting.update_user. The final rows must match a
+# sequential run exactly: no video past the limits, no credit spent twice, no
+# referral lost. Each worker also keeps its own referral leaderboard
+# (leaderboard.ReferralIndex, built from the store at startup like main.py)
+# and sets the hot user's count from the value each reward read under the
+# CAS; the index must take counts other workers moved on without complaint
+# and end on that value. Then one update is made on an event loop while
+# another connection holds the write lock (a worker's batch or checkpoint):
+# it must back off (repository.retry_busy) without stalling the loop and land
+# once the lock is released. --unsafe runs the same load on per-process caches written
+# back in batches (the single-process mode) to show the lost updates.
+# Exits non-zero if the shared run is not exact.
+# Usage: python benchmarks/bench_shared_store.py [--workers 4] [--users 50] [--attempts 20] [--referrals 200]
+#        [--lock-seconds 1] [--unsafe]
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import threading
+import tempfile
+import multiprocessing
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import User
+from repository import SqliteRepository, ATOMIC_FIELDS, LOOP_LOCK_WAIT, retry_busy
+from accounting import update_user, reserve_video, reward_referral
+from leaderboard import ReferralIndex
+
+FREE_LIMIT = 5
+CREDITS = 3
+HOT = 0
+DAY = date(2026, 10, 18).toordinal()
+
+
+def new_user():
+    return User(last_reset=DAY - 1, joined=1767225600, credits=CREDITS)
+
+
+def worker(path, shared, users, attempts, referrals, results):
+    results.put(asyncio.run(work(path, shared, users, attempts, referrals)))
+
+
+# Updates go through retry_busy as in main.py: with the loop's short lock
+# wait, a write that meets another worker's lock is retried, not failed
+async def work(path, shared, users, attempts, referrals):
+    repo = SqliteRepository(path, shared=shared)
+    index = ReferralIndex()
+    index.build(repo.referral_counts())
+    granted = 0
+    count = None
+    index_error = None
+    t = time.perf_counter()
+    for i in range(attempts):
+        for uid in users:
+            if await retry_busy(update_user, repo, uid, lambda c: reserve_video(c, DAY, None, FREE_LIMIT)) is not None:
+                granted += 1
+            if not shared:
+                repo.write_batch(repo.prepare_batch(users=[uid]))
+        for _ in range(referrals // attempts):
+            count = await retry_busy(update_user, repo, HOT, reward_referral)
+            try:
+                index.set(HOT, count)
+            except Exception as e:
+                index_error = index_error or repr(e)
+            if not shared:
+                repo.write_batch(repo.prepare_batch(users=[HOT]))
+    elapsed = time.perf_counter() - t
+    if index_error is None and count is not None and (index.counts.get(HOT) != count or index.rank(count) != 1):
+        index_error = f"index holds {index.counts.get(HOT)} (rank {index.rank(count)}), last read {count}"
+    busy = repo.busy
+    repo.close()
+    return granted, elapsed, repo.cas_conflicts, index_error, busy
+
+
+def expected_state(attempts):
+    user = new_user()
+    values = {f: getattr(user, f) for f in ATOMIC_FIELDS}
+    granted = 0
+    for _ in range(attempts):
+        if reserve_video(values, DAY, None, FREE_LIMIT) is not None:
+            granted += 1
+    return values, granted
+
+
+def run(workers, users, attempts, referrals, shared):
+    directory = tempfile.mkdtemp(prefix="shared-store-")
+    path = os.path.join(directory, "bot_data.db")
+    try:
+        repo = SqliteRepository(path)
+        uids = list(range(1, users + 1))
+        for uid in [HOT] + uids:
+            repo.put_user(uid, new_user())
+        repo.close()
+
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(path, shared, uids, attempts, referrals, results))
+                 for _ in range(workers)]
+        t = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        outcomes = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - t
+
+        granted = sum(o[0] for o in outcomes)
+        conflicts = sum(o[2] for o in outcomes)
+        busy = sum(o[4] for o in outcomes)
+        ops = workers * (users * attempts + referrals // attempts * attempts)
+        print(f"{'shared' if shared else 'unsafe'}: {workers} workers, {ops} updates in {elapsed:.2f}s "
+              f"({ops / elapsed:.0f}/s), {conflicts} CAS retries, {busy} busy retries")
+
+        repo = SqliteRepository(path)
+        want, want_granted = expected_state(workers * attempts)
+        failures = []
+        if granted != users * want_granted:
+            failures.append(f"granted {granted} videos, expected {users * want_granted}")
+        wrong = 0
+        for uid in uids:
+            u = repo.get_user(uid)
+            got = {f: getattr(u, f) for f in ATOMIC_FIELDS}
+            wrong += got != want
+        if wrong:
+            failures.append(f"{wrong} of {users} users have counters or credits different from a sequential run")
+        hot = repo.get_user(HOT)
+        want_refs = workers * (referrals // attempts) * attempts
+        if hot.referrals != want_refs or hot.credits != CREDITS + want_refs:
+            failures.append(f"hot user has {hot.referrals} referrals / {hot.credits} credits, "
+                            f"expected {want_refs} / {CREDITS + want_refs}")
+        repo.close()
+        if shared:
+            failures += [f"leaderboard: {o[3]}" for o in outcomes if o[3]]
+        for failure in failures:
+            print(f"  FAIL: {failure}")
+        if not failures:
+            print(f"  exact: {want_granted} videos per user, {want_refs} referrals on the hot user")
+        return not failures
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_locked(hold):
+    directory = tempfile.mkdtemp(prefix="shared-store-")
+    path = os.path.join(directory, "bot_data.db")
+    try:
+        repo = SqliteRepository(path)
+        repo.put_user(HOT, new_user())
+        repo.close()
+        repo = SqliteRepository(path, shared=True)
+        repo.users[HOT]
+        holder = sqlite3.connect(path, check_same_thread=False)
+        holder.execute("BEGIN IMMEDIATE")
+        threading.Timer(hold, holder.rollback).start()
+
+        async def update():
+            lag = 0
+            done = False
+
+            async def ticker():
+                nonlocal lag
+                while not done:
+                    t = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lag = max(lag, time.perf_counter() - t - 0.01)
+
+            task = asyncio.create_task(ticker())
+            t = time.perf_counter()
+            await retry_busy(update_user, repo, HOT, reward_referral)
+            waited = time.perf_counter() - t
+            done = True
+            await task
+            return waited, lag
+
+        waited, lag = asyncio.run(update())
+        print(f"locked: update landed after {waited:.2f}s behind a {hold:.1f}s lock, "
+              f"{repo.busy} busy attempts, loop lag at most {lag * 1000:.0f} ms")
+        failures = []
+        if lag > 4 * LOOP_LOCK_WAIT:
+            failures.append(f"loop stalled {lag * 1000:.0f} ms while the lock was held")
+        if waited < hold * 0.9:
+            failures.append("update went through while another connection held the lock")
+        if repo.get_user(HOT).referrals != 1:
+            failures.append(f"hot user has {repo.get_user(HOT).referrals} referrals, expected 1")
+        repo.close()
+        holder.close()
+        for failure in failures:
+            print(f"  FAIL: {failure}")
+        return not failures
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=20, help="video requests per user per worker")
+    parser.add_argument("--referrals", type=int, default=200, help="referral rewards per worker")
+    parser.add_argument("--lock-seconds", type=float, default=1.0, help="how long the lock is held in the locked case")
+    parser.add_argument("--unsafe", action="store_true", help="also run without shared mode")
+    args = parser.parse_args()
+    ok = run(args.workers, args.users, args.attempts, args.referrals, shared=True)
+    ok = run_locked(args.lock_seconds) and ok
+    if args.unsafe:
+        run(args.workers, args.users, args.attempts, args.referrals, shared=False)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# Benchmark: cold start of the JSON backend, JSON snapshot (every user parsed
+# and decoded up front) vs the memory-mapped binary snapshot (users decoded on
+# first access). Each start runs in a fresh process and does what load_data()
+# does: load, leaderboard build, totals; then the first access of --touch
+# random users (what load_user does for returning users). RSS is peak RSS of
+# that process (VmHWM). Then the format switch on a small store: converting
+# retires bot_data.json, the JSON format refuses the newer binary snapshot,
+# the SQLite import reads the binary one, and to-json converts back. Last,
+# a journal compaction through PersistenceService with every user decoded
+# (the most encoding it can take) while a ticker measures event loop lag,
+# against encoding the whole snapshot in one go.
+# Exits non-zero if any of that goes wrong or the lag passes --max-lag-ms.
+# Usage: python benchmarks/bench_snapshot.py [--users 100000 1000000] [--touch 1000] [--lag-users 100000]
+#        [--max-lag-ms 100]
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from journal import Journal
+from seenset import SeenSet
+from repository import JsonRepository, SqliteRepository
+from leaderboard import ReferralIndex
+from persistence import PersistenceService
+
+
+def synthetic_user(uid):
+    return {
+        "videos_today": uid % 5, "extra_videos_today": uid % 3,
+        "last_reset": "2026-10-18", "credits": uid % 7, "referrals": uid % 11,
+        "referred_by": None, "seen_videos": SeenSet(range(100, 100 + uid % 40)).encode(),
+        "favorite_videos": list(range(uid % 4)), "joined": "2026-01-01T10:00:00+05:30",
+        "notifications": True, "language": "en"
+    }
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def open_repo(directory, fmt="binary"):
+    return JsonRepository(os.path.join(directory, "bot_data.json"), os.path.join(directory, "bot_data.journal"),
+                          binary_path=os.path.join(directory, "bot_data.snap"), snapshot_format=fmt)
+
+
+def write_json(directory, users):
+    data = {"users": {uid: synthetic_user(uid) for uid in range(users)}, "premium": {}, "feedback": {}}
+    Journal(os.path.join(directory, "bot_data.json"), os.path.join(directory, "bot_data.journal")).compact(data)
+
+
+def child(directory, fmt, touch):
+    repo = open_repo(directory, fmt)
+    t = time.perf_counter()
+    repo.load()
+    loaded = time.perf_counter() - t
+    ReferralIndex().build(repo.referral_counts())
+    totals = repo.user_totals()
+    users = repo.count_users()
+    startup = time.perf_counter() - t
+    uids = random.Random(1).sample(range(users), touch)
+    t = time.perf_counter()
+    for uid in uids:
+        repo.users[uid].seen_videos
+    first_access = (time.perf_counter() - t) / touch
+    print(json.dumps({
+        "load_s": loaded, "startup_s": startup, "first_access_us": first_access * 1e6,
+        "rss_mb": peak_rss_mb(), "credits": totals["credits"],
+    }))
+
+
+def start(directory, fmt, touch):
+    out = subprocess.run([sys.executable, __file__, "--child", directory, fmt, "--touch", str(touch)],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+
+def run(populations, touch):
+    print(f"{'users':>9} {'format':>7} {'file MB':>8} {'load s':>8} {'startup s':>10} {'1st access us':>14} {'RSS MB':>8}")
+    for users in populations:
+        with tempfile.TemporaryDirectory() as tmp:
+            dirs = {fmt: os.path.join(tmp, fmt) for fmt in ("json", "binary")}
+            os.mkdir(dirs["json"])
+            write_json(dirs["json"], users)
+            shutil.copytree(dirs["json"], dirs["binary"])
+            t = time.perf_counter()
+            repo = open_repo(dirs["binary"])
+            repo.load()
+            repo.snapshot()
+            del repo
+            convert = time.perf_counter() - t
+            results = {fmt: start(dirs[fmt], fmt, touch) for fmt in ("json", "binary")}
+            if results["json"]["credits"] != results["binary"]["credits"]:
+                raise SystemExit("Totals differ between the JSON and binary snapshot")
+            for fmt, path in (("json", "bot_data.json"), ("binary", "bot_data.snap")):
+                r = results[fmt]
+                size = os.path.getsize(os.path.join(dirs[fmt], path)) / 1024 / 1024
+                print(f"{users:>9} {fmt:>7} {size:8.1f} {r['load_s']:8.2f} {r['startup_s']:10.2f} "
+                      f"{r['first_access_us']:14.1f} {r['rss_mb']:8.0f}")
+            print(f"{'':>9} JSON -> binary conversion {convert:.1f}s")
+
+
+def check_migration(users):
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        write_json(tmp, users)
+        want = open_repo(tmp, "json")
+        want.load()
+        credits = want.user_totals()["credits"]
+        repo = open_repo(tmp)
+        repo.load()
+        repo.users[1].credits += 1  # one journalled change after the conversion
+        repo.put_user(1, repo.users[1])
+        repo.snapshot()
+        repo.users[2].credits += 1  # and one only in the journal
+        repo.put_user(2, repo.users[2])
+        repo.journal.close()
+        credits += 2
+        if os.path.exists(os.path.join(tmp, "bot_data.json")) or not os.path.exists(os.path.join(tmp, "bot_data.json.migrated")):
+            failures.append("bot_data.json was not retired after the conversion")
+        try:
+            open_repo(tmp, "json")
+            failures.append("the JSON format loaded while a newer binary snapshot exists")
+        except ValueError:
+            pass
+        db = SqliteRepository(os.path.join(tmp, "bot_data.db"))
+        imported = db.import_json(os.path.join(tmp, "bot_data.json"), os.path.join(tmp, "bot_data.journal"),
+                                  binary_path=os.path.join(tmp, "bot_data.snap"))[0]
+        if imported != users or db.user_totals()["credits"] != credits:
+            failures.append(f"SQLite import got {imported} users / {db.user_totals()['credits']} credits, "
+                            f"expected {users} / {credits}")
+        db.close()
+        subprocess.run([sys.executable, os.path.join(ROOT, "repository.py"), "to-json",
+                        *(os.path.join(tmp, f) for f in ("bot_data.json", "bot_data.journal", "bot_data.snap"))],
+                       capture_output=True, check=True)
+        back = open_repo(tmp, "json")
+        back.load()
+        if back.count_users() != users or back.user_totals()["credits"] != credits:
+            failures.append(f"to-json gave {back.count_users()} users / {back.user_totals()['credits']} credits")
+        if os.path.exists(os.path.join(tmp, "bot_data.snap")):
+            failures.append("bot_data.snap was not retired by to-json")
+    print(f"\nformat switch ({users} users): {'ok' if not failures else 'FAILED'}")
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    return not failures
+
+
+async def compaction_lag(repo):
+    lag = 0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            t = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - t - 0.001)
+
+    task = asyncio.create_task(ticker())
+    persist = PersistenceService(repo)
+    persist.snapshot()
+    t = time.perf_counter()
+    await persist.flush()
+    elapsed = time.perf_counter() - t
+    done = True
+    await task
+    return elapsed, lag, persist.snapshots
+
+
+def check_compaction_lag(users, max_lag_ms):
+    failures = []
+    print(f"\n{'users':>9} {'format':>7} {'one-go encode ms':>17} {'compaction s':>13} {'max loop lag ms':>16}")
+    for fmt in ("json", "binary"):
+        with tempfile.TemporaryDirectory() as tmp:
+            write_json(tmp, users)
+            repo = open_repo(tmp, fmt)
+            repo.load()
+            if fmt == "binary":
+                repo.snapshot()  # from the converted snapshot, every user decoded
+                repo.load()
+                for uid in range(users):
+                    repo.users[uid]
+            t = time.perf_counter()
+            repo.prepare_snapshot()
+            one_go = time.perf_counter() - t
+            elapsed, lag, snapshots = asyncio.run(compaction_lag(repo))
+            print(f"{users:>9} {fmt:>7} {one_go * 1000:17.0f} {elapsed:13.2f} {lag * 1000:16.1f}")
+            if snapshots != 1:
+                failures.append(f"{fmt}: the compaction was not written")
+            if lag * 1000 > max_lag_ms:
+                failures.append(f"{fmt}: the loop stalled {lag * 1000:.0f} ms during compaction (limit {max_lag_ms} ms)")
+            repo.journal.close()
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--touch", type=int, default=1000, help="users accessed after startup")
+    parser.add_argument("--lag-users", type=int, default=100000, help="users in the compaction lag check")
+    parser.add_argument("--max-lag-ms", type=float, default=100, help="loop lag allowed during compaction")
+    parser.add_argument("--child", nargs=2, metavar=("DIR", "FORMAT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child, args.touch)
+    else:
+        run(args.users, args.touch)
+        ok = check_migration(2000)
+        ok = check_compaction_lag(args.lag_users, args.max_lag_ms) and ok
+        sys.exit(0 if ok else 1)
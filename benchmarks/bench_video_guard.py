@@ -0,0 +1,195 @@
+# Check: concurrent "Get Video" taps through the real handlers. main.py is
+# imported with the load test's FakeClient (see loadtest.py) and every user
+# hammers 🎬 Get Video through `router` several times at once, round after
+# round, while some deliveries fail (a network error on copy_message). Users
+# come in three kinds: free, free with credits (extras past the free limit,
+# half a credit each) and premium. Exits non-zero unless, for every user, the
+# final videos_today / extra_videos_today / credits are what a sequential run
+# of accounting.reserve_video gives for the videos the fake Telegram actually
+# delivered, no user got fewer videos than their limit allows (given enough
+# successful attempts), no two deliveries to one user overlapped and nothing
+# is left in flight.
+# Then a burst of taps goes through KeyedLimiter on its own.
+# Needs the bot's own requirements (pyrogram, pytz, flask); no network.
+# Usage: python benchmarks/bench_video_guard.py [--users 300] [--rounds 40] [--dup 3] [--fail-rate 0.1]
+#        [--credits 4] [--backend json|sqlite]
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import FakeClient, dispatch, import_bot, FIRST_UID
+from accounting import reserve_video, add_credits
+
+
+# copy_message fails with a network error at `fail_rate`; deliveries are
+# counted per chat, and a chat with two copies in flight at once is recorded
+class FlakyClient(FakeClient):
+    def __init__(self, fail_rate, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_rate = fail_rate
+        self.delivered = Counter()
+        self.failed = Counter()
+        self.sending = set()
+        self.overlaps = 0
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        if chat_id in self.sending:
+            self.overlaps += 1
+        self.sending.add(chat_id)
+        try:
+            await self._call("copy_message")
+            if self.random.random() < self.fail_rate:
+                self.failed[chat_id] += 1
+                raise ConnectionError("injected network error")
+            self.delivered[chat_id] += 1
+            return self._message(chat_id)
+        finally:
+            self.sending.discard(chat_id)
+
+
+async def populate(bot, users, credits):
+    kinds = {}
+    for i in range(users):
+        uid = FIRST_UID + i
+        await bot.load_user(uid)
+        kind = ("free", "credits", "premium")[i % 3]
+        if kind == "credits":
+            await bot.update_counters(uid, lambda c: add_credits(c, credits))  # as /addcredits does
+        elif kind == "premium":
+            await bot.grant_premium(uid, "silver", 7)
+        kinds[uid] = kind
+    return kinds
+
+
+async def hammer(bot, client, kinds, rounds, dup):
+    errors = Counter()
+
+    async def tap(uid):
+        try:
+            await dispatch(bot, client, bot.router, uid, "🎬 Get Video")
+        except Exception as e:
+            errors[type(e).__name__] += 1
+
+    for _ in range(rounds):
+        jobs = [tap(uid) for uid in kinds for _ in range(dup)]
+        random.shuffle(jobs)
+        await asyncio.gather(*jobs)
+    return errors
+
+
+# Sequential reference: the state after `delivered` videos, one at a time,
+# and how many videos the user's limits allow in all
+def expected(bot, kind, delivered, credits):
+    plan_limit = bot.PLAN_LIMITS["silver"] if kind == "premium" else None
+    values = {"videos_today": 0, "extra_videos_today": 0, "last_reset": bot.EPOCH.day,
+              "credits": credits if kind == "credits" else 0}
+    want = None
+    limit = 0
+    while reserve_video(values, bot.EPOCH.day, plan_limit, bot.FREE_DAILY_LIMIT) is not None:
+        limit += 1
+        if limit == delivered:
+            want = dict(values)
+    if delivered == 0:
+        want = {"videos_today": 0, "extra_videos_today": 0, "credits": credits if kind == "credits" else 0}
+    if want is not None:
+        del want["last_reset"]
+    return want, limit
+
+
+async def check_handlers(bot, args):
+    client = FlakyClient(args.fail_rate, args.latency_ms / 1000, args.latency_ms / 2000, 0, 0,
+                         bot.FloodWait, args.videos)
+    bot.app = client
+    bot.load_data()
+    bot.PERSIST.start()
+    bot.ACTIONS.start()
+    bot.OUTBOUND.start()
+    failures = []
+    try:
+        await bot.CATALOG.sync(client, bot.VIDEO_CHANNEL_ID)
+        kinds = await populate(bot, args.users, args.credits)
+        t = time.perf_counter()
+        errors = await hammer(bot, client, kinds, args.rounds, args.dup)
+        elapsed = time.perf_counter() - t
+        taps = args.users * args.rounds * args.dup
+        print(f"handlers  : {taps} taps in {elapsed:.2f}s, {sum(client.delivered.values())} delivered, "
+              f"{sum(client.failed.values())} failed deliveries, {bot.VIDEO_INFLIGHT.coalesced} coalesced, "
+              f"errors {dict(errors)}")
+        wrong = Counter()
+        for uid, kind in kinds.items():
+            u = bot.USERS[uid]
+            got = {"videos_today": u.videos_today, "extra_videos_today": u.extra_videos_today, "credits": u.credits}
+            want, limit = expected(bot, kind, client.delivered[uid], args.credits)
+            if got != want or client.delivered[uid] > limit or len(u.seen_videos) != client.delivered[uid]:
+                wrong[kind] += 1
+                if wrong[kind] == 1:
+                    print(f"  {kind} user {uid}: {got}, expected {want} for {client.delivered[uid]} delivered "
+                          f"(limit {limit}, {len(u.seen_videos)} seen)")
+            elif args.rounds - client.failed[uid] > limit and client.delivered[uid] != limit:
+                wrong[kind] += 1  # enough successful attempts, yet refused before the limit
+        for kind in ("free", "credits", "premium"):
+            n = sum(1 for k in kinds.values() if k == kind)
+            print(f"  {kind:8s}: {n - wrong[kind]}/{n} users exact")
+            if wrong[kind]:
+                failures.append(f"{wrong[kind]} {kind} users with counters or credits off")
+        if client.overlaps:
+            failures.append(f"{client.overlaps} deliveries overlapped another one to the same user")
+        if bot.VIDEO_INFLIGHT.active:
+            failures.append(f"{len(bot.VIDEO_INFLIGHT.active)} users still marked in flight")
+        if set(errors) - {"ConnectionError"}:
+            failures.append(f"unexpected handler errors: {dict(errors)}")
+    finally:
+        await bot.OUTBOUND.stop()
+        await bot.PERSIST.stop()
+        bot.REPO.close()
+        bot.ACTIONS.close()
+    return failures
+
+
+# All taps at one instant: exactly `burst` per user get through, one warning each
+def check_limiter(bot, users, per_user):
+    burst = 5
+    limiter = bot.KeyedLimiter(rate=0.001, burst=burst)
+    verdicts = {"allow": 0, "warn": 0, "drop": 0}
+    t = time.perf_counter()
+    for _ in range(per_user):
+        for uid in range(users):
+            verdicts[limiter.check(uid)] += 1
+    us = (time.perf_counter() - t) / (users * per_user) * 1e6
+    print(f"limiter   : {verdicts} ({us:.2f} us/check)")
+    want = {
+        "allow": users * min(burst, per_user),
+        "warn": users if per_user > burst else 0,
+        "drop": users * max(0, per_user - burst - 1),
+    }
+    return [] if verdicts == want else [f"limiter verdicts {verdicts} != {want}"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300, help="a third each free, with credits, premium")
+    parser.add_argument("--rounds", type=int, default=40, help="rounds of taps per user")
+    parser.add_argument("--dup", type=int, default=3, help="simultaneous taps per user per round")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="share of deliveries that fail")
+    parser.add_argument("--credits", type=int, default=4, help="credits of the credit-funded users")
+    parser.add_argument("--videos", type=int, default=2000, help="videos in the fake channel")
+    parser.add_argument("--latency-ms", type=float, default=5, help="mean fake Telegram call latency")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    args = parser.parse_args()
+    bot = import_bot(SimpleNamespace(backend=args.backend, log=False))
+    failures = asyncio.run(check_handlers(bot, args))
+    failures += check_limiter(bot, args.users, args.rounds * args.dup)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+# Offline load test of the real handlers in main.py.
+# main is imported in a scratch directory with its `app` swapped for
+# FakeClient, a local stand-in for the Client methods the bot calls
+# (get_chat_history, copy_message, send_message, get_users, get_chat_member;
+# Message.reply goes through send_message) with configurable latency and
+# injected FloodWait errors. A synthetic user population then drives the
+# handlers open-loop at a fixed request rate; latency is measured from each
+# request's scheduled time, so a backlog shows up in p99 instead of lowering
+# the rate. Results (throughput, p50/p90/p99, RSS, Telegram calls) are written
+# as JSON (by default to benchmarks/results/, which git ignores); --compare
+# prints the change against an earlier result file.
+# Needs the bot's own requirements (pyrogram, pytz, flask); no network.
+# OUTBOUND_RATE, BROADCAST_RATE and the per-user tap limits default to
+# effectively unlimited here so handler cost is what gets measured; set them
+# in the environment to load-test the production limits.
+# Usage: python benchmarks/loadtest.py [--scenarios start video leaderboard broadcast]
+#        [--users 100000] [--rate 10000] [--duration 10] [--latency-ms 50] [--jitter-ms 20]
+#        [--flood-rate 0.0005] [--flood-seconds 2] [--out FILE] [--compare FILE]
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIRST_UID = 1_000_000
+
+
+class FakeClient:
+    def __init__(self, latency, jitter, flood_rate, flood_seconds, flood_exc, videos, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.flood_exc = flood_exc
+        self.videos = videos
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.floods = 0
+        self._next_id = 1
+
+    async def _call(self, method, floods=False):
+        self.calls[method] += 1
+        if floods and self.flood_rate and self.random.random() < self.flood_rate:
+            self.floods += 1
+            raise self.flood_exc(value=self.flood_seconds)
+        delay = self.random.gauss(self.latency, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _message(self, chat_id):
+        self._next_id += 1
+        return SimpleNamespace(id=self._next_id, chat=SimpleNamespace(id=chat_id))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message", floods=True)
+        return self._message(chat_id)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self._call("copy_message", floods=True)
+        return self._message(chat_id)
+
+    async def get_users(self, user_ids):
+        await self._call("get_users")
+        if not isinstance(user_ids, list):
+            return SimpleNamespace(id=user_ids, first_name=f"User {user_ids}")
+        return [SimpleNamespace(id=uid, first_name=f"User {uid}") for uid in user_ids]
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call("get_chat_member")
+        return SimpleNamespace(user=SimpleNamespace(id=user_id), status="member")
+
+    # Newest first, like Telegram
+    async def get_chat_history(self, chat_id):
+        self.calls["get_chat_history"] += 1
+        for msg_id in range(self.videos, 0, -1):
+            yield SimpleNamespace(id=msg_id, video=True)
+
+
+class FakeMessage:
+    def __init__(self, client, uid, text):
+        self.client = client
+        self.from_user = SimpleNamespace(id=uid, first_name=f"User {uid}", username=None)
+        self.chat = SimpleNamespace(id=uid)
+        self.text = text
+        self.command = text[1:].split() if text.startswith("/") else None
+
+    async def reply(self, text, **kwargs):
+        return await self.client.send_message(self.chat.id, text, **kwargs)
+
+
+def import_bot(args):
+    os.environ.setdefault("API_ID", "1")
+    os.environ.setdefault("API_HASH", "0" * 32)
+    os.environ.setdefault("BOT_TOKEN", "1:loadtest")
+    os.environ.setdefault("STORAGE_BACKEND", args.backend)
+    os.environ.setdefault("OUTBOUND_RATE", "1e9")
+    os.environ.setdefault("BROADCAST_RATE", "1e9")
+    os.environ.setdefault("TAP_RATE", "1e9")
+    os.environ.setdefault("TAP_BURST", "1000000000")
+    os.chdir(tempfile.mkdtemp(prefix="loadtest-"))  # the bot's state files land here
+    import main as bot
+    if not args.log:
+        logging.getLogger().setLevel(logging.WARNING)
+    return bot
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+# Open loop: request i is due at start + i / rate whether or not earlier ones finished
+async def drive(request, rate, duration):
+    total = int(rate * duration)
+    latencies = []
+    errors = Counter()
+    tasks = set()
+
+    async def one(i, due):
+        try:
+            await request(i)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - due)
+
+    start = time.perf_counter()
+    for i in range(total):
+        due = start + i / rate
+        delay = due - time.perf_counter()
+        if delay > 0.001:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(one(i, due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": dict(errors),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+    }
+
+
+async def dispatch(bot, client, handler, uid, text):
+    m = FakeMessage(client, uid, text)
+    await bot.remember_name(client, m)  # group -2 runs first for every update
+    await handler(client, m)
+
+
+async def scenario_start(bot, client, args, population):
+    # New users; every fifth arrives through a referral link
+    def request(i):
+        uid = FIRST_UID + args.users + i
+        text = f"/start {population[i % len(population)]}" if i % 5 == 0 else "/start"
+        return dispatch(bot, client, bot.start, uid, text)
+    return await drive(request, args.rate, args.duration)
+
+
+async def scenario_video(bot, client, args, population):
+    return await drive(lambda i: dispatch(bot, client, bot.router, random.choice(population), "🎬 Get Video"),
+                       args.rate, args.duration)
+
+
+async def scenario_leaderboard(bot, client, args, population):
+    return await drive(lambda i: dispatch(bot, client, bot.router, random.choice(population), "🏆 Leaderboard"),
+                       args.rate, args.duration)
+
+
+# One admin /broadcast to the whole population, timed until the job finishes
+async def scenario_broadcast(bot, client, args, population):
+    sent_before = client.calls["send_message"]
+    start = time.perf_counter()
+    await dispatch(bot, client, bot.bc, bot.ADMIN_ID, "/broadcast Load test broadcast")
+    while bot.BROADCAST.running():
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    status = bot.BROADCAST.status()
+    return {
+        "requests": status["total"],
+        "sent": status["sent"],
+        "failed": status["failed"],
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(status["sent"] / elapsed, 1) if elapsed else None,
+        "send_message_calls": client.calls["send_message"] - sent_before,
+    }
+
+
+SCENARIOS = {
+    "start": scenario_start,
+    "video": scenario_video,
+    "leaderboard": scenario_leaderboard,
+    "broadcast": scenario_broadcast,
+}
+
+
+async def populate(bot, users):
+    population = list(range(FIRST_UID, FIRST_UID + users))
+    rng = random.Random(2)
+    for uid in population:
+        await bot.load_user(uid)
+        bot.USERS[uid].referrals = int(rng.paretovariate(1.5)) - 1
+        bot.save_user(uid)
+    bot.LEADERBOARD.build(bot.REPO.referral_counts())
+    return population
+
+
+async def run(bot, args):
+    client = FakeClient(args.latency_ms / 1000, args.jitter_ms / 1000, args.flood_rate, args.flood_seconds,
+                        bot.FloodWait, args.videos)
+    bot.app = client
+    bot.load_data()
+    bot.LOOPMON.start()
+    bot.PERSIST.start()
+    bot.EPOCH.start()
+    bot.ACTIONS.start()
+    bot.OUTBOUND.start()
+    await bot.CATALOG.sync(client, bot.VIDEO_CHANNEL_ID)
+    t = time.perf_counter()
+    population = await populate(bot, args.users)
+    results = {"populate_s": round(time.perf_counter() - t, 3), "scenarios": {}}
+    try:
+        for name in args.scenarios:
+            calls_before, floods_before = Counter(client.calls), client.floods
+            result = await SCENARIOS[name](bot, client, args, population)
+            result["calls"] = dict(client.calls - calls_before)
+            result["flood_waits"] = client.floods - floods_before
+            result["rss_mb"] = round(rss_mb() or 0, 1)
+            results["scenarios"][name] = result
+            print(f"{name:12s} {result['throughput_rps']} req/s  p50 {result.get('p50_ms')} ms  "
+                  f"p99 {result.get('p99_ms')} ms  errors {result.get('errors', {})}  rss {result['rss_mb']} MB")
+    finally:
+        await bot.LOOPMON.stop()
+        await bot.EPOCH.stop()
+        await bot.BROADCAST.stop()
+        await bot.OUTBOUND.stop()
+        await bot.PERSIST.stop()
+        bot.REPO.close()
+        bot.ACTIONS.close()
+    results["rss_peak_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    results["loop_stalls"] = bot.LOOPMON.stall_count
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(base, new):
+    print(f"\nvs {base.get('commit')} ({base.get('timestamp')}):")
+    for name, result in new["scenarios"].items():
+        old = base.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        parts = []
+        for key in ("throughput_rps", "p50_ms", "p99_ms", "rss_mb"):
+            if old.get(key) and result.get(key) is not None:
+                parts.append(f"{key} {old[key]} -> {result[key]} ({(result[key] - old[key]) / old[key] * 100:+.1f}%)")
+        print(f"  {name:12s} " + ", ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=100000, help="synthetic user population")
+    parser.add_argument("--videos", type=int, default=5000, help="videos in the fake channel")
+    parser.add_argument("--rate", type=float, default=10000, help="requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean fake Telegram call latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--flood-rate", type=float, default=0.0005, help="share of sends that get a FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=2)
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--log", action="store_true", help="keep the bot's INFO logging")
+    parser.add_argument("--out", help="result file (default benchmarks/results/loadtest-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out or os.path.join(ROOT, "benchmarks", "results", f"loadtest-{git_commit()}.json"))
+    base = os.path.abspath(args.compare) if args.compare else None
+
+    bot = import_bot(args)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        **asyncio.run(run(bot, args)),
+    }
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+    if base:
+        with open(base) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+# Background broadcast job: fans out over `concurrency` workers under its own
+# token bucket (a cap on the broadcast's share of the global send budget;
+# FloodWait is handled by the outbound scheduler behind `send`), and
+# checkpoints progress so a restart resumes where it stopped. Recipients that blocked the bot or were
+# deactivated are remembered and skipped by later broadcasts.
+class BroadcastEngine:
+    def __init__(self, path, unreachable_path, send, gone_excs, rate=25, concurrency=16, checkpoint_every=2.0):
+        self.path = path                  # checkpoint file; recipients in path + ".uids"
+        self.unreachable_path = unreachable_path
+        self.send = send                  # async send(uid, text)
+        self.gone_excs = gone_excs
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.unreachable = set()
+        self.job = None
+        self.uids = []
+        self._task = None
+        self._on_done = None
+
+    # Persistence
+    def load(self):
+        try:
+            if os.path.exists(self.unreachable_path):
+                with open(self.unreachable_path, "r") as f:
+                    self.unreachable = set(json.load(f))
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    self.job = json.load(f)
+                with open(self.path + ".uids", "r") as f:
+                    self.uids = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading broadcast state: {e}")
+            self.job = None
+
+    def _write(self, state, unreachable):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+        tmp = self.unreachable_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(unreachable, f)
+        os.replace(tmp, self.unreachable_path)
+
+    async def _checkpoint(self):
+        state = {**self.job, "done": sorted(self.job["done"])}
+        await asyncio.to_thread(self._write, state, list(self.unreachable))
+
+    def _clear(self):
+        for path in (self.path, self.path + ".uids"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # A user who talks to the bot again is reachable again
+    def reachable(self, uid):
+        self.unreachable.discard(uid)
+
+    # Control
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def _write_uids(self, uids):
+        with open(self.path + ".uids", "w") as f:
+            json.dump(uids, f)
+
+    async def start(self, text, uids, on_done=None):
+        if self.running():
+            return False
+        self.uids = [uid for uid in uids if uid not in self.unreachable]
+        await asyncio.to_thread(self._write_uids, self.uids)
+        self.job = {
+            "text": text, "total": len(self.uids), "low_water": 0, "done": [],
+            "sent": 0, "failed": 0, "blocked": 0,
+            "started": time.time(), "sent_at_resume": 0, "resumed": time.time(), "status": "running",
+        }
+        self._launch(on_done)
+        return True
+
+    def resume(self, on_done=None):
+        if self.job is None or self.job.get("status") != "running" or self.running():
+            return False
+        self.job["sent_at_resume"] = self.job["sent"]
+        self.job["resumed"] = time.time()
+        self._launch(on_done)
+        logger.info(f"Resuming broadcast at {self.job['low_water']}/{self.job['total']}")
+        return True
+
+    def _launch(self, on_done):
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            await self._checkpoint()
+
+    # Fan-out
+    async def _run(self):
+        job = self.job
+        done = set(job["done"])
+        job["done"] = done
+        pending = iter(range(job["low_water"], len(self.uids)))
+
+        async def worker():
+            for i in pending:
+                if i in done:
+                    continue
+                await self._deliver(self.uids[i])
+                done.add(i)
+                while job["low_water"] in done:
+                    done.discard(job["low_water"])
+                    job["low_water"] += 1
+
+        async def checkpointer():
+            while True:
+                await asyncio.sleep(self.checkpoint_every)
+                await self._checkpoint()
+
+        saver = asyncio.create_task(checkpointer())
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            saver.cancel()
+        job["status"] = "done"
+        job["finished"] = time.time()
+        await self._checkpoint()
+        self._clear()
+        if self._on_done:
+            await self._on_done(self.status())
+
+    async def _deliver(self, uid):
+        await self.bucket.acquire()
+        try:
+            await self.send(uid, self.job["text"])
+            self.job["sent"] += 1
+        except self.gone_excs:
+            self.unreachable.add(uid)
+            self.job["blocked"] += 1
+        except Exception as e:
+            logger.warning(f"Broadcast to {uid} failed: {e}")
+            self.job["failed"] += 1
+
+    # Live progress
+    def status(self):
+        job = self.job
+        if job is None:
+            return None
+        processed = job["sent"] + job["failed"] + job["blocked"]
+        end = job.get("finished") or time.time()
+        elapsed = max(end - job["resumed"], 1e-9)
+        rate = (job["sent"] - job["sent_at_resume"]) / elapsed
+        remaining = job["total"] - processed
+        return {
+            "status": job["status"] if self.running() or job["status"] == "done" else "paused",
+            "total": job["total"], "processed": processed, "sent": job["sent"],
+            "failed": job["failed"], "blocked": job["blocked"],
+            "rate": rate, "eta_s": remaining / rate if rate > 0 else None,
+            "elapsed_s": end - job["started"], "text": job["text"],
+        }
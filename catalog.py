@@ -0,0 +1,113 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# In-process index of video message ids in the video channel.
+# Built once by scanning the channel, persisted to disk so warm restarts only
+# scan posts newer than the last synced id, and kept current by channel handlers.
+class VideoCatalog:
+    def __init__(self, path):
+        self.path = path
+        # Append-only slots (None once deleted) so samplers can address videos
+        # by a stable index; compaction bumps the generation to reset them.
+        self.slots = []
+        self.pos = {}          # video id -> slot index
+        self.generation = 0
+        self.synced_id = 0     # highest channel message id already scanned
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __contains__(self, vid):
+        return vid in self.pos
+
+    def __iter__(self):
+        return iter(self.pos)
+
+    def add(self, vid):
+        if vid in self.pos:
+            return False
+        self.pos[vid] = len(self.slots)
+        self.slots.append(vid)
+        if vid > self.synced_id:
+            self.synced_id = vid
+        return True
+
+    def remove(self, vid):
+        i = self.pos.pop(vid, None)
+        if i is None:
+            return False
+        self.slots[i] = None
+        if len(self.slots) > 64 and len(self.pos) * 2 < len(self.slots):
+            self.compact()
+        return True
+
+    def compact(self):
+        self.slots = list(self.pos)
+        self.pos = {vid: i for i, vid in enumerate(self.slots)}
+        self.generation += 1
+
+    # Persistence
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            for vid in data.get("ids", []):
+                self.add(int(vid))
+            self.synced_id = max(self.synced_id, int(data.get("synced_id", 0)))
+            return True
+        except Exception as e:
+            logger.error(f"Error loading video catalog: {e}")
+            return False
+
+    def save(self):
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"synced_id": self.synced_id, "ids": list(self.pos)}, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.error(f"Error saving video catalog: {e}")
+
+    # Channel scan: full history on a cold start, only newer posts on a warm one.
+    # If the scan fails part way, the videos found so far are kept but
+    # synced_id goes back to where the scan started, so a retry covers the
+    # posts it did not reach.
+    async def sync(self, client, chat_id):
+        warm = self.load()
+        stop_at = self.synced_id if warm else 0
+        newest = stop_at
+        scanned = added = 0
+        try:
+            async for msg in client.get_chat_history(chat_id):
+                if msg.id <= stop_at:
+                    break
+                scanned += 1
+                newest = max(newest, msg.id)
+                if msg.video and self.add(msg.id):
+                    added += 1
+        except BaseException:
+            self.synced_id = stop_at
+            raise
+        self.synced_id = max(self.synced_id, newest)
+        self.save()
+        logger.info(f"Video catalog synced ({'warm' if warm else 'cold'}): scanned {scanned}, added {added}, total {len(self)}")
+        return added
+
+    # Channel update hooks
+    def on_post(self, msg):
+        changed = self.add(msg.id) if msg.video else self.remove(msg.id)
+        if msg.id > self.synced_id:
+            self.synced_id = msg.id
+            changed = True
+        if changed:
+            self.save()
+
+    def on_deleted(self, ids):
+        if sum(self.remove(vid) for vid in ids):
+            self.save()
@@ -0,0 +1,72 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+# Global day epoch. `today` is computed once and advanced by a task that sleeps
+# until local midnight, so handlers compare a cached date instead of asking
+# pytz. Per-user daily counters carry the day they were written on and read as
+# zero once it is stale; nothing is rewritten at midnight. The "daily reset
+# complete" notice goes to users whose counters predate today, and sending it
+# rolls their counters to today, so the record itself says it was sent.
+class DayEpoch:
+    def __init__(self, tz):
+        self.tz = tz
+        self.today = datetime.now(tz).date()
+        self.day = self.today.toordinal()   # what users' last_reset holds
+        self._callbacks = []
+        self._task = None
+        # Metrics
+        self.ticks = 0
+        self.tick_ms_last = 0.0
+        self.lazy_resets = 0           # stale counters zeroed on their next write
+        self.notices = 0
+
+    def on_tick(self, callback):
+        self._callbacks.append(callback)
+
+    # True for users whose counters predate today and are due the notice
+    def needs_notice(self, last_reset):
+        return last_reset != self.day
+
+    def _tick(self):
+        t = time.perf_counter()
+        previous = self.today
+        self.today = datetime.now(self.tz).date()
+        self.day = self.today.toordinal()
+        self.ticks += 1
+        for callback in self._callbacks:
+            try:
+                callback(previous, self.today)
+            except Exception as e:
+                logger.error(f"Day epoch callback failed: {e}")
+        self.tick_ms_last = (time.perf_counter() - t) * 1000
+
+    async def _run(self):
+        while True:
+            midnight = self.tz.localize(datetime.combine(self.today + timedelta(days=1), datetime.min.time()))
+            delay = (midnight - datetime.now(self.tz)).total_seconds()
+            await asyncio.sleep(max(0.0, delay) + 0.01)
+            if datetime.now(self.tz).date() != self.today:
+                self._tick()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self):
+        return {
+            "day": self.today.isoformat(),
+            "ticks": self.ticks,
+            "tick_ms_last": round(self.tick_ms_last, 3),
+            "lazy_resets": self.lazy_resets,
+            "notices": self.notices,
+        }
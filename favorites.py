@@ -0,0 +1,42 @@
+from itertools import islice
+
+
+# A user's favorite video ids: an insertion-ordered set (dict keys, values
+# unused) with O(1) membership, add and remove. Pages are read with a cursor,
+# the position in insertion order, by walking the keys without copying them.
+# Stored in the data file as a plain list of ids, oldest first.
+class Favorites(dict):
+    __slots__ = ()
+
+    def __init__(self, ids=()):
+        super().__init__(dict.fromkeys(ids))
+
+    def __repr__(self):
+        return f"Favorites({list(self)!r})"
+
+    # False if already there or the set holds `cap` ids (None: no cap)
+    def add(self, vid, cap=None):
+        if vid in self or (cap is not None and len(self) >= cap):
+            return False
+        self[vid] = None
+        return True
+
+    def discard(self, vid):
+        return self.pop(vid, False) is None
+
+    # (cursor, ids, cursor of the previous page or None, of the next or None);
+    # a cursor past the end (ids removed since) falls back to the last page
+    def page(self, cursor, size):
+        n = len(self)
+        cursor = max(0, min(cursor, (n - 1) // size * size if n else 0))
+        ids = list(islice(self, cursor, cursor + size))
+        prev = max(0, cursor - size) if cursor > 0 else None
+        nxt = cursor + size if cursor + size < n else None
+        return cursor, ids, prev, nxt
+
+    def encode(self):
+        return list(self)
+
+    @classmethod
+    def decode(cls, ids):
+        return cls(ids or ())
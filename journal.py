@@ -0,0 +1,107 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMPACT_CHUNK = 1000  # records encoded per step of a compaction
+
+
+# Append-only mutation journal on top of a JSON snapshot.
+# Each line is a per-record upsert {"s": section, "k": key, "v": value}, with
+# v = null meaning delete. Records are whole (idempotent), so replaying a
+# journal over a snapshot it was already compacted into is harmless, and a torn
+# final line from a crash is simply skipped. Compaction writes the snapshot to
+# a temp file, fsyncs and renames it into place before truncating the journal.
+class Journal:
+    SECTIONS = ("users", "premium", "feedback")
+
+    def __init__(self, snapshot_path, journal_path, compact_every=5000, fsync=False):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.entries = 0
+        self._f = None
+
+    # Snapshot + journal replay, in raw (JSON) form. `base` replaces the JSON
+    # snapshot when the caller keeps its snapshot elsewhere.
+    def load(self, base=None):
+        data = {section: dict((base or {}).get(section, {})) for section in self.SECTIONS}
+        if base is None and os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snap = json.load(f)
+            for section in self.SECTIONS:
+                data[section].update(snap.get(section, {}))
+        self.entries = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping torn journal entry")
+                        continue
+                    section = data[op["s"]]
+                    if op["v"] is None:
+                        section.pop(str(op["k"]), None)
+                    else:
+                        section[str(op["k"])] = op["v"]
+                    self.entries += 1
+        return data
+
+    def append(self, section, key, value):
+        self.append_many([(section, key, value)])
+
+    # One write + flush (+ fsync) for a batch of entries
+    def append_many(self, entries):
+        if not entries:
+            return
+        if self._f is None:
+            self._f = open(self.journal_path, "a")
+        self._f.write("".join(
+            json.dumps({"s": section, "k": key, "v": value}, separators=(",", ":")) + "\n"
+            for section, key, value in entries))
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self.entries += len(entries)
+
+    def needs_compaction(self):
+        return self.entries >= self.compact_every
+
+    # Runs in a worker thread: each section is encoded COMPACT_CHUNK records
+    # at a time, so the GIL goes back to the event loop between chunks (a
+    # single json.dump holds it for the whole store). Same JSON as json.dump;
+    # records of the `encoded` sections are JSON text already.
+    def compact(self, data, encoded=()):
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("{")
+            for n, (section, records) in enumerate(data.items()):
+                f.write(f"{', ' if n else ''}{json.dumps(section)}: {{")
+                items = list(records.items())
+                for i in range(0, len(items), COMPACT_CHUNK):
+                    chunk = items[i:i + COMPACT_CHUNK]
+                    if section in encoded:
+                        text = ", ".join(f'"{k}": {v}' for k, v in chunk)
+                    else:
+                        text = json.dumps(dict(chunk))[1:-1]
+                    f.write(f"{', ' if i else ''}{text}")
+                f.write("}")
+            f.write("}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        self.truncate()
+
+    # After the caller has written a snapshot that includes every entry
+    def truncate(self):
+        self.close()
+        open(self.journal_path, "w").close()
+        self.entries = 0
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
@@ -0,0 +1,127 @@
+from bisect import bisect_left, insort
+
+
+# Order-statistics index over referral counts.
+# A Fenwick tree over count values answers "how many users have more
+# referrals than r" in O(log max), and users with at least one referral sit in
+# per-count buckets (insertion ordered) walked from the highest count down for
+# the top N. Ranks are competition ranks: users with equal counts share one.
+# The index keeps every user's current count itself, so set() only needs the
+# new value: with several workers, counts other workers changed since the
+# startup build are simply overwritten by the value read under the CAS, and a
+# user another worker registered is counted once, when first seen.
+class ReferralIndex:
+    def __init__(self):
+        self.size = 64
+        self.freq = [0] * self.size       # users per referral count
+        self.tree = [0] * (self.size + 1)
+        self.total = 0
+        self.buckets = {}                 # count (> 0) -> {uid: None}
+        self.counts = {}                  # uid -> count, every user in the index
+        self.values = []                  # sorted non-empty bucket counts
+
+    def __len__(self):
+        return self.total
+
+    def _grow(self, value):
+        while value >= self.size:
+            self.size *= 2
+        self.freq += [0] * (self.size - len(self.freq))
+        self.tree = [0] * (self.size + 1)
+        for v, count in enumerate(self.freq):
+            if count:
+                self._bump(v, count)
+
+    def _bump(self, value, delta):
+        i = value + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _change(self, value, delta):
+        if value >= self.size:
+            self._grow(value)
+        self.freq[value] += delta
+        self._bump(value, delta)
+
+    def _prefix(self, value):  # users with referrals <= value
+        i = min(value + 1, self.size)
+        s = 0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def _bucket_add(self, uid, value):
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            bucket = self.buckets[value] = {}
+            insort(self.values, value)
+        bucket[uid] = None
+
+    def _bucket_remove(self, uid, value):
+        bucket = self.buckets[value]
+        del bucket[uid]
+        if not bucket:
+            del self.buckets[value]
+            del self.values[bisect_left(self.values, value)]
+
+    # Bulk load from (uid, referrals) pairs in O(n + max) at startup
+    def build(self, counts):
+        self.__init__()
+        freq = {}
+        for uid, referrals in counts:
+            freq[referrals] = freq.get(referrals, 0) + 1
+            self.counts[uid] = referrals
+            if referrals > 0:
+                self._bucket_add(uid, referrals)
+        self.total = sum(freq.values())
+        if freq:
+            while max(freq) >= self.size:
+                self.size *= 2
+        self.freq = [freq.get(v, 0) for v in range(self.size)]
+        self.tree = [0] + self.freq[:]
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    # Updates
+    def add(self, uid, referrals=0):
+        self.set(uid, referrals)
+
+    # New uids (e.g. registered by another worker after our build) join the index
+    def set(self, uid, referrals):
+        old = self.counts.get(uid)
+        if old == referrals:
+            return
+        self.counts[uid] = referrals
+        if old is None:
+            self.total += 1
+        else:
+            self._change(old, -1)
+            if old > 0:
+                self._bucket_remove(uid, old)
+        self._change(referrals, 1)
+        if referrals > 0:
+            self._bucket_add(uid, referrals)
+
+    # Queries
+    def rank(self, referrals):
+        return self.total - self._prefix(referrals) + 1
+
+    def top(self, n, fill=()):
+        out = []
+        for value in reversed(self.values):
+            for uid in self.buckets[value]:
+                out.append((uid, value))
+                if len(out) == n:
+                    return out
+        # Fewer than n referrers: pad with users who have none yet
+        taken = {uid for uid, _ in out}
+        for uid in fill:
+            if len(out) == n:
+                break
+            if uid not in taken:
+                out.append((uid, 0))
+        return out
@@ -0,0 +1,149 @@
+import os
+import gzip
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, size INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS actions (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (file INTEGER NOT NULL, pos INTEGER NOT NULL, ts INTEGER NOT NULL, uid INTEGER, action INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries(ts);
+CREATE INDEX IF NOT EXISTS entries_uid ON entries(uid, ts);
+CREATE INDEX IF NOT EXISTS entries_action ON entries(action, ts);
+"""
+
+
+# On-disk index over the action log (and its rotated files).
+# One row per record: (file, byte offset, epoch ts, uid, action id). The log
+# writer thread feeds it batch by batch and tells it about rotations, so
+# queries by user, action and time range are index lookups that end with a
+# seek per matching line instead of a scan of the history.
+class LogIndex:
+    def __init__(self, path):
+        self.path = path
+        self.db = None  # writer connection, owned by the log thread
+        self._files = {}
+        self._actions = {}
+
+    # Writer side
+    def open(self):
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;" + SCHEMA)
+        self._files = dict(self.db.execute("SELECT name, id FROM files"))
+        self._actions = dict(self.db.execute("SELECT name, id FROM actions"))
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _file_id(self, name):
+        fid = self._files.get(name)
+        if fid is None:
+            fid = self._files[name] = self.db.execute("INSERT INTO files (name) VALUES (?)", (name,)).lastrowid
+        return fid
+
+    def _action_id(self, action):
+        aid = self._actions.get(action)
+        if aid is None:
+            aid = self._actions[action] = self.db.execute("INSERT INTO actions (name) VALUES (?)", (action,)).lastrowid
+        return aid
+
+    def indexed_size(self, name):
+        row = self.db.execute("SELECT size FROM files WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    # entries: (pos, ts, uid, action); size: file size after these records
+    def add(self, name, entries, size):
+        with self.db:
+            fid = self._file_id(name)
+            self.db.executemany(
+                "INSERT INTO entries (file, pos, ts, uid, action) VALUES (?, ?, ?, ?, ?)",
+                [(fid, pos, ts, uid if isinstance(uid, int) else None, self._action_id(action))
+                 for pos, ts, uid, action in entries])
+            self.db.execute("UPDATE files SET size = ? WHERE id = ?", (size, fid))
+
+    def rename(self, old, new):
+        with self.db:
+            fid = self._files.pop(old, None)
+            if fid is not None:
+                self.drop(new)
+                self.db.execute("UPDATE files SET name = ? WHERE id = ?", (new, fid))
+                self._files[new] = fid
+
+    def drop(self, name):
+        with self.db:
+            fid = self._files.pop(name, None)
+            if fid is not None:
+                self.db.execute("DELETE FROM entries WHERE file = ?", (fid,))
+                self.db.execute("DELETE FROM files WHERE id = ?", (fid,))
+
+    # Query side: any thread, own short-lived connection
+    def query(self, uid=None, action=None, since=None, until=None, limit=20):
+        if not os.path.exists(self.path):
+            return []
+        where, args = [], []
+        if uid is not None:
+            where.append("e.uid = ?")
+            args.append(uid)
+        if action is not None:
+            # unary + keeps the planner on the (far more selective) uid index
+            column = "+e.action" if uid is not None else "e.action"
+            where.append(f"{column} = (SELECT id FROM actions WHERE name = ? COLLATE NOCASE)")
+            args.append(action)
+        if since is not None:
+            where.append("e.ts >= ?")
+            args.append(int(since))
+        if until is not None:
+            where.append("e.ts < ?")
+            args.append(int(until))
+        sql = "SELECT f.name, e.pos FROM entries e JOIN files f ON f.id = e.file"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY e.ts DESC, e.rowid DESC LIMIT ?"
+        db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            hits = db.execute(sql, args + [limit]).fetchall()
+        finally:
+            db.close()
+        hits.reverse()
+        return read_lines(hits)
+
+
+# Fetch the lines at (file, offset) pairs, oldest first, one seek each.
+# Rotated .gz files are read with forward seeks in offset order.
+def read_lines(hits):
+    by_file = {}
+    for name, pos in hits:
+        by_file.setdefault(name, []).append(pos)
+    found = {}
+    for name, positions in by_file.items():
+        try:
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(name, "rb") as f:
+                for pos in sorted(positions):
+                    f.seek(pos)
+                    found[(name, pos)] = f.readline().rstrip(b"\n")
+        except OSError as e:
+            logger.warning(f"Log file {name} unavailable: {e}")  # rotated away meanwhile
+    return [found[hit] for hit in hits if hit in found]
+
+
+# Last n lines of a file, reading backwards from the end in blocks
+def tail_lines(path, n, block=8192):
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0:
+        lines = lines[1:]  # first line is partial
+    return lines[-n:]
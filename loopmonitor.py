@@ -0,0 +1,109 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+# Event-loop lag monitor.
+# A task on the loop wakes every `interval` and records how late it woke (the
+# scheduling lag). A watchdog thread watches the same heartbeat from outside:
+# once the loop is `slow_threshold` late it captures the loop thread's stack,
+# i.e. whatever is blocking it, and the task later fills in how long the stall
+# lasted. health() is safe to call from other threads (the Flask probes).
+class LoopMonitor:
+    def __init__(self, interval=0.5, slow_threshold=0.25, keep=20):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.stalls = deque(maxlen=keep)   # {"at", "blocked_s", "stack"}
+        self.stall_count = 0
+        self.lag = 0.0
+        self.lag_max = 0.0
+        self.started = None
+        self.next_beat = None              # monotonic time the sampler is due
+        self.last_update = None            # monotonic time of the last Telegram update
+        self.ready = False
+        self._loop_thread = None
+        self._captured_for = None
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def update_seen(self):
+        self.last_update = time.monotonic()
+
+    # Sampler (event loop)
+    async def _sample(self):
+        while True:
+            due = self.next_beat = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - due)
+            self.lag = lag
+            self.lag_max = max(self.lag_max, lag)
+            if self._captured_for == due and self.stalls:
+                self.stalls[-1]["blocked_s"] = round(lag, 3)
+
+    # Watchdog (own thread)
+    def _watch(self):
+        while not self._stop.wait(self.slow_threshold / 2):
+            due = self.next_beat
+            if due is None or due == self._captured_for:
+                continue
+            blocked = time.monotonic() - due
+            if blocked < self.slow_threshold:
+                continue
+            self._captured_for = due
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = traceback.format_stack(frame)[-15:] if frame is not None else []
+            self.stalls.append({"at": time.time(), "blocked_s": round(blocked, 3), "stack": stack})
+            self.stall_count += 1
+            logger.warning(f"Event loop blocked for {blocked:.2f}s+ in:\n{''.join(stack[-5:])}")
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self.started = time.monotonic()
+        self._task = asyncio.create_task(self._sample())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self.ready = False
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # Probes
+    def current_lag(self):
+        # While the loop is stuck the sampler cannot report; measure from outside
+        due = self.next_beat
+        if due is None:
+            return 0.0
+        return max(self.lag, time.monotonic() - due)
+
+    def health(self, max_lag, max_update_age=0):
+        now = time.monotonic()
+        lag = self.current_lag()
+        update_age = now - (self.last_update or self.started or now)
+        problems = []
+        if self.started is None:
+            problems.append("loop monitor not started")
+        if lag > max_lag:
+            problems.append(f"event loop lag {lag:.2f}s > {max_lag}s")
+        if max_update_age and update_age > max_update_age:
+            problems.append(f"no update for {update_age:.0f}s > {max_update_age}s")
+        return {
+            "ok": not problems,
+            "problems": problems,
+            "lag_s": round(lag, 3),
+            "lag_max_s": round(self.lag_max, 3),
+            "last_update_age_s": round(update_age, 1),
+            "stalls": self.stall_count,
+            "recent_stalls": [{**s, "stack": s["stack"][-5:]} for s in list(self.stalls)[-3:]],
+        }
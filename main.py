@@ -1,24 +1,61 @@
 import os
-import threading
-import random
+import re
+import sys
 import json
+import shlex
+import threading
+import subprocess
 import logging
 import asyncio  # Fixed: Added missing import for asyncio
 from datetime import datetime, timedelta
 import pytz
-from flask import Flask
-from pyrogram import Client, filters
+from flask import Flask, Response, jsonify
+from pyrogram import Client, filters, idle
+from pyrogram.enums import ChatMemberStatus
 from pyrogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from pyrogram.errors import UserNotParticipant, FloodWait
+from pyrogram.errors import UserNotParticipant, FloodWait, MessageIdInvalid, UserIsBlocked, InputUserDeactivated, UserDeactivated, PeerIdInvalid
+from catalog import VideoCatalog
+from sampler import SamplerCache
+from records import User, Premium
+from repository import open_repository, retry_busy
+from accounting import update_user, roll_day, reserve_video, release_video, add_credits, spend_credits, reward_referral, claim_referral, set_referrer
+from persistence import PersistenceService
+from premium_index import PremiumIndex
+from leaderboard import ReferralIndex
+from names import NameCache
+from membership import MembershipCache
+from broadcast import BroadcastEngine
+from actionlog import ActionLog
+from aggregates import Aggregates
+from epoch import DayEpoch
+from metrics import Registry
+from loopmonitor import LoopMonitor
+from profiler import Profiler
+from logindex import LogIndex, tail_lines
+from ratelimit import KeyedLimiter, InFlightGuard
+from outbound import OutboundScheduler, PRIO_INTERACTIVE, PRIO_VIDEO, PRIO_NOTIFY, PRIO_BROADCAST
 
 # Setup logging for better debugging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Workers: with WORKERS > 1 the bot runs as that many processes (a supervisor
+# starts them with WORKER_ID set) sharing one SQLite store
+WORKERS = int(os.getenv("WORKERS", 1))
+WORKER_ID = int(os.getenv("WORKER_ID", 0))
+SHARED_STATE = WORKERS > 1
+
+# Process-local state files get a per-worker name when workers share the store
+def worker_file(path):
+    if not SHARED_STATE:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{WORKER_ID}{ext}"
+
 # Environment variables for the bot
 API_ID = int(os.getenv("API_ID"))
 API_HASH = os.getenv("API_HASH")
-BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_TOKEN = os.getenv(f"BOT_TOKEN_{WORKER_ID}") or os.getenv("BOT_TOKEN")  # workers may run separate bots
 
 # Bot configuration
 BOT_USERNAME = "Video_hub_xbot"
@@ -37,17 +74,126 @@ PLAN_LIMITS = {
     "gold": 50,
     "platinum": 10**9
 }
+FAVORITES_CAP = int(os.getenv("FAVORITES_CAP", 200))  # favorites one user may keep
+FAVORITES_PAGE_SIZE = 8  # videos per page of the favorites browser
 
 # File paths for persistence
 DATA_FILE = "bot_data.json"
-LOG_FILE = "bot_log.txt"
+JOURNAL_FILE = "bot_data.journal"
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", 5000))  # entries between snapshots
+SQLITE_FILE = "bot_data.db"
+SNAPSHOT_FILE = "bot_data.snap"
+SNAPSHOT_FORMAT = os.getenv("SNAPSHOT_FORMAT", "binary")  # json backend: "binary" (memory-mapped, decoded per user) or "json"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")  # "json" or "sqlite" (required with WORKERS > 1)
+PERSIST_INTERVAL = float(os.getenv("PERSIST_INTERVAL", 2))  # seconds between coalesced writes
+PREMIUM_SWEEP_INTERVAL = 60  # seconds between expired-premium sweeps
+CATALOG_RETRY_MAX = 600  # longest wait between retries of a failed channel scan
+PREMIUM_REMINDER_BEFORE = timedelta(hours=24)  # heads-up before expiry; timedelta(0) disables
+NAME_CACHE_TTL = 24 * 3600  # seconds a resolved display name stays fresh
+NAME_CACHE_SIZE = 100000  # LRU capacity
+SAMPLER_CACHE_SIZE = int(os.getenv("SAMPLER_CACHE_SIZE", 5000))  # users whose unseen-video sampler is kept (LRU)
+NAME_CACHE_SAVE_INTERVAL = 300  # seconds between name cache saves
+MEMBERSHIP_TTL = int(os.getenv("MEMBERSHIP_TTL", 600))  # seconds a positive FORCE_CHANNEL check is reused
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))  # messages per second across all workers
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 16))
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", 30))  # messages per second for the whole bot
+OUTBOUND_PER_CHAT_RATE = 1  # messages per second to any one chat...
+OUTBOUND_PER_CHAT_BURST = 3  # ...after a short burst
+TAP_RATE = float(os.getenv("TAP_RATE", 0.5))  # menu taps per second one user may make...
+TAP_BURST = int(os.getenv("TAP_BURST", 5))  # ...after a short burst; the rest are dropped
+LOG_FILE = worker_file("bot_log.jsonl")  # JSON Lines action log
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))  # rotate past this size (and daily)
+LOG_BACKUPS = 30  # rotated, gzipped logs kept
+LOG_INDEX_FILE = worker_file("bot_log.index.db")  # user/action/time index over the action log
+LOG_VIEW_LINES = 20  # records shown by /viewlogs
+CATALOG_FILE = worker_file("video_catalog.json")
+NAME_CACHE_FILE = worker_file("name_cache.json")
+AGGREGATES_FILE = worker_file("aggregates.json")
+AGGREGATES_SAVE_INTERVAL = 300  # seconds between saves of the daily series
+STATS_TREND_DAYS = 7
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"  # Prometheus /metrics on the web app
+LOOP_SAMPLE_INTERVAL = 0.5  # seconds between event-loop lag samples
+SLOW_CALLBACK_THRESHOLD = float(os.getenv("SLOW_CALLBACK_THRESHOLD", 0.25))  # seconds blocked before capturing a stack
+HEALTH_MAX_LAG = float(os.getenv("HEALTH_MAX_LAG", 30))  # /healthz fails past this loop lag (seconds)
+READY_MAX_LAG = float(os.getenv("READY_MAX_LAG", 2))  # /readyz fails past this loop lag (seconds)
+PROFILE_MAX_SECONDS = 300  # longest /profile window
+HEALTH_MAX_UPDATE_AGE = float(os.getenv("HEALTH_MAX_UPDATE_AGE", 0))  # seconds without an update; 0 disables
+BROADCAST_FILE = worker_file("broadcast_job.json")
+UNREACHABLE_FILE = worker_file("unreachable_users.json")
 
 # Global data structures
-app = Client("video_hub", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
-
-USERS = {}
-PREMIUM = {}
-FEEDBACK = {}  # Store user feedback
+app = Client(worker_file("video_hub"), api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+
+# Metrics (families must exist before handlers are decorated)
+METRICS = Registry(enabled=METRICS_ENABLED)
+METRICS.histogram("bot_handler_seconds", "Handler latency in seconds", ("handler",))
+METRICS.histogram("bot_outbound_seconds", "Outgoing Telegram call latency in seconds", ("method",))
+METRICS.counter("bot_outbound_calls_total", "Outgoing Telegram calls", ("method", "outcome"))
+METRICS.histogram("bot_persist_seconds", "Storage write duration in seconds", ("kind",))
+METRICS.counter("bot_persist_records_total", "Records written to storage")
+METRICS.counter("bot_taps_refused_total", "Menu taps refused by the per-user limits", ("reason",))
+
+def instrument(name):
+    return METRICS.timed("bot_handler_seconds", handler=name)
+
+def observe_outbound(method, outcome, seconds):
+    METRICS.inc("bot_outbound_calls_total", (method, outcome))
+    METRICS.observe("bot_outbound_seconds", (method,), seconds)
+
+def observe_persist(kind, seconds, records):
+    METRICS.observe("bot_persist_seconds", (kind,), seconds)
+    METRICS.inc("bot_persist_records_total", (), records)
+
+REPO = open_repository(STORAGE_BACKEND, DATA_FILE, JOURNAL_FILE, SQLITE_FILE, compact_every=JOURNAL_COMPACT_EVERY,
+                       shared=SHARED_STATE, binary_file=SNAPSHOT_FILE, snapshot_format=SNAPSHOT_FORMAT)
+USERS = REPO.users
+PREMIUM = REPO.premium
+PERSIST = PersistenceService(REPO, interval=PERSIST_INTERVAL, observer=observe_persist if METRICS.enabled else None)
+PREMIUM_INDEX = PremiumIndex(remind_before=PREMIUM_REMINDER_BEFORE.total_seconds())
+LEADERBOARD = ReferralIndex()  # Referral order statistics for the leaderboards
+NAMES = NameCache(NAME_CACHE_FILE, ttl=NAME_CACHE_TTL, capacity=NAME_CACHE_SIZE)
+MEMBERSHIP = MembershipCache(lambda uid: app.get_chat_member(FORCE_CHANNEL, uid), UserNotParticipant, ttl=MEMBERSHIP_TTL)
+UNREACHABLE_ERRORS = (UserIsBlocked, InputUserDeactivated, UserDeactivated, PeerIdInvalid)
+OUTBOUND = OutboundScheduler(FloodWait, rate=OUTBOUND_RATE, per_chat_rate=OUTBOUND_PER_CHAT_RATE,
+                             per_chat_burst=OUTBOUND_PER_CHAT_BURST, quiet_excs=UNREACHABLE_ERRORS,
+                             observer=observe_outbound if METRICS.enabled else None)
+BROADCAST = BroadcastEngine(
+    BROADCAST_FILE, UNREACHABLE_FILE,
+    lambda uid, text: OUTBOUND.call(PRIO_BROADCAST, uid, app.send_message, uid, text,
+                                    reply_markup=MAIN_MENU if uid != ADMIN_ID else ADMIN_MENU),
+    UNREACHABLE_ERRORS, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY)
+LOG_INDEX = LogIndex(LOG_INDEX_FILE)
+ACTIONS = ActionLog(LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, index=LOG_INDEX)
+EPOCH = DayEpoch(TIMEZONE)  # current day, advanced once at local midnight
+AGG = Aggregates(AGGREGATES_FILE, clock=lambda: today())  # O(1) totals and daily series for /stats
+BACKGROUND_TASKS = []
+CATALOG = VideoCatalog(CATALOG_FILE)  # Video message ids in VIDEO_CHANNEL_ID
+SAMPLERS = SamplerCache(SAMPLER_CACHE_SIZE)  # Per-user unseen-video samplers (in memory only)
+PROFILER = Profiler()  # on-demand /profile captures; idle costs nothing
+LOOPMON = LoopMonitor(interval=LOOP_SAMPLE_INTERVAL, slow_threshold=SLOW_CALLBACK_THRESHOLD)
+TAPS = KeyedLimiter(TAP_RATE, TAP_BURST)  # per-user menu tap budget
+VIDEO_INFLIGHT = InFlightGuard()  # one send_video per user at a time
+
+# Gauges read at scrape time (from the Flask thread)
+METRICS.gauge("bot_users", "Registered users", lambda: AGG.totals["users"])
+METRICS.gauge("bot_premium_users", "Users with a premium entry", lambda: AGG.totals["premium"])
+METRICS.gauge("bot_floodwait_total", "FloodWait errors received", lambda: OUTBOUND.flood_waits, kind="counter")
+METRICS.gauge("bot_floodwait_seconds_total", "Seconds of FloodWait imposed", lambda: OUTBOUND.flood_wait_s, kind="counter")
+METRICS.gauge("bot_outbound_queue", "Outgoing calls waiting to be sent", lambda: len(OUTBOUND.queue) + len(OUTBOUND.delayed))
+METRICS.gauge("bot_samplers", "Unseen-video samplers kept in memory", lambda: len(SAMPLERS))
+METRICS.gauge("bot_cache_hit_ratio", "Cache hit ratio", lambda: {
+    ("membership",): MEMBERSHIP.hit_ratio(),
+    ("names",): NAMES.hits / (NAMES.hits + NAMES.misses) if NAMES.hits + NAMES.misses else 0.0,
+}, labels=("cache",))
+METRICS.gauge("bot_storage_bytes", "Size of storage files", lambda: {
+    (path,): os.path.getsize(path) for path in (DATA_FILE, JOURNAL_FILE, SNAPSHOT_FILE, SQLITE_FILE) if os.path.exists(path)
+}, labels=("file",))
+METRICS.gauge("bot_loop_lag_seconds", "Event loop scheduling lag", LOOPMON.current_lag)
+METRICS.gauge("bot_loop_lag_max_seconds", "Largest event loop lag seen", lambda: LOOPMON.lag_max)
+METRICS.gauge("bot_loop_stalls_total", "Event loop stalls past the slow-callback threshold", lambda: LOOPMON.stall_count, kind="counter")
+if SHARED_STATE:
+    METRICS.gauge("bot_cas_conflicts_total", "User updates retried after another worker's write", lambda: REPO.cas_conflicts, kind="counter")
+    METRICS.gauge("bot_store_busy_total", "Store writes put off while another worker held the lock", lambda: REPO.busy, kind="counter")
 
 # Flask web server for Render
 web = Flask(__name__)
@@ -56,8 +202,29 @@ web = Flask(__name__)
 def home():
     return "Bot Running Successfully!"
 
+@web.route("/metrics")
+def prometheus_metrics():
+    if not METRICS.enabled:
+        return "Metrics disabled", 404
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+# Liveness: the Pyrogram loop is responsive (and, if configured, still getting updates)
+@web.route("/healthz")
+def healthz():
+    health = LOOPMON.health(HEALTH_MAX_LAG, HEALTH_MAX_UPDATE_AGE)
+    return jsonify(health), 200 if health["ok"] else 503
+
+# Readiness: started up and keeping up
+@web.route("/readyz")
+def readyz():
+    health = LOOPMON.health(READY_MAX_LAG, HEALTH_MAX_UPDATE_AGE)
+    if not LOOPMON.ready:
+        health["ok"] = False
+        health["problems"].insert(0, "not ready")
+    return jsonify(health), 200 if health["ok"] else 503
+
 def run_flask():
-    port = int(os.environ.get("PORT", 5000))
+    port = int(os.environ.get("PORT", 5000)) + WORKER_ID
     web.run(host="0.0.0.0", port=port)
 
 # Time utilities
@@ -65,123 +232,135 @@ def now():
     return datetime.now(TIMEZONE)
 
 def today():
-    return now().date()
+    return EPOCH.today
 
-# Data persistence functions
-def load_data():
-    global USERS, PREMIUM, FEEDBACK
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r") as f:
-                data = json.load(f)
-                USERS = {int(k): v for k, v in data.get("users", {}).items()}
-                PREMIUM = {int(k): v for k, v in data.get("premium", {}).items()}
-                FEEDBACK = {int(k): v for k, v in data.get("feedback", {}).items()}
-                # Convert string dates back to datetime/date objects
-                for u in USERS.values():
-                    if isinstance(u.get("last_reset"), str):
-                        u["last_reset"] = datetime.fromisoformat(u["last_reset"]).date()
-                    if isinstance(u.get("joined"), str):
-                        u["joined"] = datetime.fromisoformat(u["joined"])
-                    u["seen_videos"] = set(u.get("seen_videos", []))
-                    u["favorite_videos"] = u.get("favorite_videos", [])  # Favorites list
-                for p in PREMIUM.values():
-                    if isinstance(p.get("expiry"), str):
-                        p["expiry"] = datetime.fromisoformat(p["expiry"])
-        except Exception as e:
-            logger.error(f"Error loading data: {e}")
+# Local datetime of a stored epoch-seconds value (premium expiry, join time)
+def local_time(ts):
+    return datetime.fromtimestamp(ts, TIMEZONE)
 
-def save_data():
+# Data persistence functions, all through the storage repository (REPO)
+def load_data():
+    global USERS, PREMIUM
     try:
-        data = {
-            "users": {
-                k: {
-                    **v,
-                    "last_reset": v["last_reset"].isoformat(),
-                    "joined": v["joined"].isoformat(),
-                    "seen_videos": list(v["seen_videos"]),
-                    "favorite_videos": v["favorite_videos"]
-                } for k, v in USERS.items()
-            },
-            "premium": {k: {"plan": v["plan"], "expiry": v["expiry"].isoformat()} for k, v in PREMIUM.items()},
-            "feedback": FEEDBACK
-        }
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f)
+        REPO.load()
+        USERS, PREMIUM = REPO.users, REPO.premium
+        PREMIUM_INDEX.rebuild(PREMIUM, now().timestamp())
+        LEADERBOARD.build(REPO.referral_counts())
+        AGG.load()
+        AGG.build(REPO.count_users(), len(PREMIUM), REPO.user_totals())
+        NAMES.load()
+        BROADCAST.load()
     except Exception as e:
-        logger.error(f"Error saving data: {e}")
+        logger.error(f"Error loading data: {e}")
+
+# Saves are coalesced by PERSIST and written off the event loop
+# Full snapshot (JSON: compacts the journal; SQLite: WAL checkpoint)
+def save_data():
+    PERSIST.snapshot()
+
+def save_user(uid):
+    PERSIST.user(uid)
+
+async def save_premium(uid):
+    if SHARED_STATE:
+        await retry_busy(REPO.write_premium, uid)  # other workers read it on their next refresh
+    else:
+        PERSIST.premium_entry(uid)
+
+def save_feedback(uid, text):
+    PERSIST.feedback_entry(uid, text)
 
 # Logging function for actions
 def log_action(action, uid=None, details=""):
-    try:
-        with open(LOG_FILE, "a") as f:
-            f.write(f"{now()} - {action} - User: {uid} - {details}\n")
-        logger.info(f"{action} - User: {uid} - {details}")
-    except Exception as e:
-        logger.error(f"Logging error: {e}")
-
-# User initialization
-def load_user(uid):
-    if uid not in USERS:
-        USERS[uid] = {
-            "videos_today": 0,
-            "extra_videos_today": 0,
-            "last_reset": today(),
-            "credits": 0,
-            "referrals": 0,
-            "referred_by": None,
-            "seen_videos": set(),
-            "favorite_videos": [],
-            "joined": now(),
-            "notifications": True,
-            "language": "en"
-        }
-        save_data()
+    ACTIONS.log(now().isoformat(timespec="seconds"), action, uid, details)  # written by the log thread
+    logger.info(f"{action} - User: {uid} - {details}")
+
+# User initialization. In shared mode the store is read and written on the
+# loop, so these helpers are coroutines: while another worker holds the write
+# lock they back off (repository.retry_busy) instead of blocking the loop.
+async def load_user(uid):
+    if uid in USERS:
+        if SHARED_STATE:
+            await retry_busy(REPO.refresh, uid)
+        return
+    created = await retry_busy(REPO.add_user, uid, User(last_reset=EPOCH.day, joined=int(now().timestamp())))
+    if created:
+        LEADERBOARD.add(uid)
+        AGG.add("users")
+        AGG.event("new_users")
+        save_user(uid)
         log_action("New User Registered", uid)
 
-# Daily reset logic
-def reset_daily(uid):
-    u = USERS[uid]
-    reset_happened = u["last_reset"] != today()
-    if reset_happened:
-        u["videos_today"] = 0
-        u["extra_videos_today"] = 0
-        u["last_reset"] = today()
-        save_data()
-        log_action("Daily Reset Performed", uid)
-    return reset_happened
-
-# Premium check
+# Daily counters (videos_today, extra_videos_today) belong to the day in
+# last_reset; once EPOCH moves past it they read as zero, and the next write
+# zeroes them for real. Nothing is written at midnight.
+def daily(u, field):
+    return getattr(u, field) if u.last_reset == EPOCH.day else 0
+
+# Counters, credits and the referral claim change only through compare-and-set
+# (accounting.update_user), so they stay exact with several workers
+async def update_counters(uid, change):
+    result = await retry_busy(update_user, REPO, uid, change)
+    if result is not None:
+        save_user(uid)
+    return result
+
+# First message of a new day: roll the user's counters to today (one write
+# per user per day, compare-and-set so only one worker wins) and tell them.
+# The roll is the record that the notice went out, so it survives restarts.
+async def daily_notice(uid):
+    if not EPOCH.needs_notice(USERS[uid].last_reset):
+        return False
+    day = EPOCH.day
+    if not await update_counters(uid, lambda c: roll_day(c, day) or None):
+        return False
+    EPOCH.lazy_resets += 1
+    EPOCH.notices += 1
+    return True
+
+def on_day_tick(previous, day):
+    log_action("Daily Reset", details=f"{previous} -> {day}")
+
+EPOCH.on_tick(on_day_tick)
+
+# Premium check: pure lookup; expired entries are removed by premium_sweeper
 def is_premium(uid):
-    if uid in PREMIUM and PREMIUM[uid]["expiry"] > now():
-        return PREMIUM[uid]["plan"]
-    PREMIUM.pop(uid, None)
-    save_data()
+    p = PREMIUM.get(uid)
+    if p is not None and p.expiry > now().timestamp():
+        return p.plan
     return None
 
-# Auto-upgrade based on credits
-def auto_upgrade(uid):
-    u = USERS[uid]
-    c = u["credits"]
-    if c >= PLATINUM_CREDITS:
-        plan = "platinum"
-        cost = PLATINUM_CREDITS
-    elif c >= GOLD_CREDITS:
-        plan = "gold"
-        cost = GOLD_CREDITS
-    elif c >= SILVER_CREDITS:
-        plan = "silver"
-        cost = SILVER_CREDITS
+# Grant or extend premium (an expired, not yet swept entry restarts from now)
+async def grant_premium(uid, plan, days):
+    p = PREMIUM.get(uid)
+    now_ts = int(now().timestamp())
+    if p is not None:
+        p.expiry = max(p.expiry, now_ts) + days * 86400
+        p.plan = sys.intern(plan)
     else:
+        p = PREMIUM[uid] = Premium(plan, now_ts + days * 86400)
+        AGG.add("premium")
+    PREMIUM_INDEX.track(uid, p.expiry)
+    await save_premium(uid)
+
+async def revoke_premium(uid):
+    if PREMIUM.pop(uid, None) is not None:
+        AGG.add("premium", -1)
+        await save_premium(uid)
+
+# Auto-upgrade based on credits
+async def auto_upgrade(uid):
+    def pick(c):
+        for plan, cost in (("platinum", PLATINUM_CREDITS), ("gold", GOLD_CREDITS), ("silver", SILVER_CREDITS)):
+            if spend_credits(c, cost) is not None:
+                return plan, cost
         return None
-    if uid in PREMIUM:
-        PREMIUM[uid]["expiry"] += timedelta(days=7)
-        if PREMIUM[uid]["plan"] != plan:
-            PREMIUM[uid]["plan"] = plan
-    else:
-        PREMIUM[uid] = {"plan": plan, "expiry": now() + timedelta(days=7)}
-    u["credits"] -= cost
-    save_data()
+    upgrade = await update_counters(uid, pick)
+    if upgrade is None:
+        return None
+    plan, cost = upgrade
+    await grant_premium(uid, plan, 7)
+    AGG.add("credits", -cost)
     log_action("Auto-Upgrade Triggered", uid, f"To {plan}")
     return plan
 
@@ -189,7 +368,7 @@ def auto_upgrade(uid):
 def limit_reached_message(uid):
     u = USERS[uid]
     link = f"https://t.me/{BOT_USERNAME}?start={uid}"
-    extra_available = max(0, u["credits"] * 2 - u["extra_videos_today"])
+    extra_available = max(0, u.credits * 2 - daily(u, "extra_videos_today"))
     extra_text = f"\n\nExtra Videos Available with Credits: 🎥 {extra_available}" if extra_available > 0 else ""
     msg = f"""🚫 DAILY LIMIT REACHED{extra_text}
 
@@ -253,46 +432,86 @@ LANGUAGE_BUTTONS = InlineKeyboardMarkup([
     [InlineKeyboardButton("Spanish", callback_data="lang_es")]
 ])
 
+# Video channel handlers keep the catalog current
+@app.on_message(filters.chat(VIDEO_CHANNEL_ID), group=-1)
+async def channel_post(_, m):
+    CATALOG.on_post(m)
+    m.stop_propagation()
+
+@app.on_edited_message(filters.chat(VIDEO_CHANNEL_ID), group=-1)
+async def channel_post_edited(_, m):
+    CATALOG.on_post(m)
+    m.stop_propagation()
+
+@app.on_deleted_messages(filters.chat(VIDEO_CHANNEL_ID), group=-1)
+async def channel_post_deleted(_, messages):
+    CATALOG.on_deleted([msg.id for msg in messages])
+
+# Outgoing messages all go through the outbound scheduler
+async def reply(m, text, **kwargs):
+    return await OUTBOUND.call(PRIO_INTERACTIVE, m.chat.id, m.reply, text, **kwargs)
+
+async def edit(message, text, **kwargs):
+    return await OUTBOUND.call(PRIO_INTERACTIVE, message.chat.id, message.edit_text, text, **kwargs)
+
+async def deliver_video(chat_id, vid):
+    return await OUTBOUND.call(PRIO_VIDEO, chat_id, app.copy_message, chat_id, VIDEO_CHANNEL_ID, vid, protect_content=True)
+
+# Fire-and-forget: the calling handler never waits on (or for) the recipient
+def notify(uid, text, **kwargs):
+    OUTBOUND.defer(PRIO_NOTIFY, uid, app.send_message, uid, text, **kwargs)
+
+# Refresh cached display names from every incoming update (never blocks others)
+@app.on_message(group=-2)
+async def remember_name(_, m):
+    LOOPMON.update_seen()
+    if m.from_user:
+        NAMES.seen(m.from_user)
+        BROADCAST.reachable(m.from_user.id)
+        AGG.seen(m.from_user.id)
+
+@app.on_callback_query(group=-2)
+async def remember_name_cb(_, cb):
+    LOOPMON.update_seen()
+    NAMES.seen(cb.from_user)
+    BROADCAST.reachable(cb.from_user.id)
+    AGG.seen(cb.from_user.id)
+
 # Start command handler
 @app.on_message(filters.command("start"))
+@instrument("start")
 async def start(_, m):
     uid = m.from_user.id
-    load_user(uid)
+    await load_user(uid)
     ref = None
     if len(m.command) > 1:
         try:
             ref = int(m.command[1])
-            if ref == uid or USERS[uid]["referred_by"] is not None:
+            if ref == uid or await update_counters(uid, lambda c: set_referrer(c, ref)) is None:
                 ref = None
-            else:
-                USERS[uid]["referred_by"] = ref
         except ValueError:
             ref = None
-    try:
-        await app.get_chat_member(FORCE_CHANNEL, uid)
-    except UserNotParticipant:
-        await m.reply("🔒 Join our channel to use this bot",
+    if not await MEMBERSHIP.check(uid):
+        await reply(m, "🔒 Join our channel to use this bot",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("📢 Join Channel", url="https://t.me/cnnetworkofficial")],
                 [InlineKeyboardButton("🔄 Refresh", callback_data="refresh")]
             ]))
         return
     # Handle referral
-    if ref and USERS[uid]["referred_by"] != "counted":
-        load_user(ref)
-        USERS[ref]["credits"] += 1
-        USERS[ref]["referrals"] += 1
+    if ref and await update_counters(uid, claim_referral) is not None:
+        await load_user(ref)
+        referrals = await update_counters(ref, reward_referral)
+        AGG.add("credits")
+        AGG.add("referrals")
+        AGG.event("referrals")
+        LEADERBOARD.set(ref, referrals)  # value read under the CAS
         success_msg = "🎉 Referral Success!\n+1 Credit (2 Videos)"
-        upgrade_plan = auto_upgrade(ref)
+        upgrade_plan = await auto_upgrade(ref)
         if upgrade_plan:
             success_msg += f"\n\n🚀 AUTO-UPGRADED TO {upgrade_plan.upper()} PREMIUM!"
-        if USERS[ref]["notifications"]:
-            try:
-                await app.send_message(ref, success_msg, reply_markup=MAIN_MENU if ref != ADMIN_ID else ADMIN_MENU)
-            except FloodWait as e:
-                await asyncio.sleep(e.value)  # Fixed: Use e.value for seconds
-        USERS[uid]["referred_by"] = "counted"
-        save_data()
+        if USERS[ref].notifications:
+            notify(ref, success_msg, reply_markup=MAIN_MENU if ref != ADMIN_ID else ADMIN_MENU)
     # Welcome message (elaborated as per design)
     username = m.from_user.first_name or "User"
     welcome_text = f"""👋 Welcome {username} to VIDEO HUB BOT – The Ultimate Video Entertainment Hub!
@@ -351,30 +570,42 @@ Plus: Priority content, no ads, custom video requests. Custom plans? Chat with @
 Ready to dive in? Tap 🎬 Get Video now! 🍿
 Explore the menu for more options. Happy watching!"""
     markup = ADMIN_MENU if uid == ADMIN_ID else MAIN_MENU
-    await m.reply(welcome_text, reply_markup=markup)
+    await reply(m, welcome_text, reply_markup=markup)
     # Check auto-upgrade for current user
-    upgrade_plan = auto_upgrade(uid)
+    upgrade_plan = await auto_upgrade(uid)
     if upgrade_plan:
-        await m.reply(f"🚀 AUTO-UPGRADED TO {upgrade_plan.upper()} PREMIUM!\nUnlock more videos and features for 7 days.", reply_markup=markup)
+        await reply(m, f"🚀 AUTO-UPGRADED TO {upgrade_plan.upper()} PREMIUM!\nUnlock more videos and features for 7 days.", reply_markup=markup)
 
 # Callback for refresh
 @app.on_callback_query(filters.regex("refresh"))
+@instrument("refresh_callback")
 async def refresh_callback(_, cb):
     uid = cb.from_user.id
-    try:
-        await app.get_chat_member(FORCE_CHANNEL, uid)
+    if await MEMBERSHIP.check(uid):
         m = type("Message", (), {"from_user": cb.from_user, "chat": {"id": cb.message.chat.id}, "command": []})
         await start(_, m)
         await cb.message.delete()
-    except UserNotParticipant:
+    else:
         await cb.answer("Join the channel first!", show_alert=True)
 
+# Keep the membership cache in step with joins/leaves the bot can see
+@app.on_chat_member_updated(filters.chat(FORCE_CHANNEL))
+async def force_channel_member_updated(_, update):
+    member = update.new_chat_member or update.old_chat_member
+    if member is None or member.user is None:
+        return
+    if update.new_chat_member and update.new_chat_member.status in (
+            ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER):
+        MEMBERSHIP.mark(member.user.id)
+    else:
+        MEMBERSHIP.invalidate(member.user.id)
+
 # Callback for opening sections
 @app.on_callback_query(filters.regex(r"open_(refer|premium|feedback)"))
+@instrument("open_section_callback")
 async def open_section_callback(_, cb):
     uid = cb.from_user.id
-    load_user(uid)
-    reset_daily(uid)
+    await load_user(uid)
     section = cb.matches[0].group(1)
     m = type("Message", (), {"from_user": cb.from_user, "chat": {"id": cb.message.chat.id}, "text": ""})
     if section == "refer":
@@ -387,30 +618,42 @@ async def open_section_callback(_, cb):
 
 # Language callback
 @app.on_callback_query(filters.regex(r"lang_(en|hi|es)"))
+@instrument("set_language")
 async def set_language(_, cb):
     uid = cb.from_user.id
     lang = cb.matches[0].group(1)
-    USERS[uid]["language"] = lang
+    if lang == "en":
+        REPO.languages.pop(uid, None)
+    else:
+        REPO.languages[uid] = lang
     await cb.answer(f"Language set to {lang.upper()}. Note: Full support coming soon!", show_alert=True)
-    save_data()
+    save_user(uid)
 
 # Router for text messages
 @app.on_message(filters.text & ~filters.command(""))
+@instrument("router")
 async def router(_, m):
     uid = m.from_user.id
-    load_user(uid)
-    reset_happened = reset_daily(uid)
-    upgrade_plan = auto_upgrade(uid)
+    if uid != ADMIN_ID:
+        verdict = TAPS.check(uid)
+        if verdict != "allow":
+            METRICS.inc("bot_taps_refused_total", ("rate",))
+            if verdict == "warn":
+                await reply(m, "⏳ Easy there! Too many taps – wait a moment and try again.")
+            return
+    await load_user(uid)
+    reset_happened = await daily_notice(uid)
+    upgrade_plan = await auto_upgrade(uid)
     text = m.text
     markup = ADMIN_MENU if uid == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup here
-    if reset_happened and USERS[uid]["notifications"]:
+    if reset_happened and USERS[uid].notifications:
         reset_msg = """🌙 DAILY RESET COMPLETE!
 
 Limits refreshed – enjoy fresh videos!
 Credits intact. Start with 🎬 Get Video 🍿"""
-        await m.reply(reset_msg, reply_markup=markup)
+        await reply(m, reset_msg, reply_markup=markup)
     if upgrade_plan:
-        await m.reply(f"🚀 AUTO-UPGRADED TO {upgrade_plan.upper()}!\nMore videos await – happy viewing!", reply_markup=markup)
+        await reply(m, f"🚀 AUTO-UPGRADED TO {upgrade_plan.upper()}!\nMore videos await – happy viewing!", reply_markup=markup)
     if text == "🎬 Get Video":
         await send_video(m)
     elif text == "❤️ Favorites":
@@ -432,136 +675,244 @@ Credits intact. Start with 🎬 Get Video 🍿"""
     elif text == "🗣 Feedback":
         await feedback(m)
     elif text == "🌐 Language":
-        await m.reply("Choose language:", reply_markup=LANGUAGE_BUTTONS)
+        await reply(m, "Choose language:", reply_markup=LANGUAGE_BUTTONS)
     elif text == "🛠 Admin Panel" and uid == ADMIN_ID:
         await admin(m)
 
 # Send video handler
+# Taps arriving while the user's previous request is still running are
+# coalesced into it, so the limit checks and counter updates below never
+# interleave for one user.
+@instrument("send_video")
 async def send_video(m):
     uid = m.from_user.id
-    load_user(uid)
-    reset_daily(uid)
+    if not VIDEO_INFLIGHT.enter(uid):
+        METRICS.inc("bot_taps_refused_total", ("inflight",))
+        return
+    try:
+        await _send_video(m, uid)
+    finally:
+        VIDEO_INFLIGHT.leave(uid)
+
+async def _send_video(m, uid):
+    await load_user(uid)
     plan = is_premium(uid)
     u = USERS[uid]
     markup = ADMIN_MENU if uid == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
-    if plan:
-        daily_limit = PLAN_LIMITS[plan]
-        if u["videos_today"] >= daily_limit:
-            await m.reply("🚫 Premium limit reached. Wait for reset or upgrade higher!", reply_markup=markup)
-            return
-        using_extra = False
-    else:
-        daily_limit = FREE_DAILY_LIMIT
-        if u["videos_today"] >= daily_limit:
-            using_extra = True
-            next_extra = u["extra_videos_today"] + 1
-            if next_extra > u["credits"] * 2:
-                await m.reply(limit_reached_message(uid), reply_markup=UPGRADE_BUTTONS)
-                return
+    # Take the video out of today's allowance first, give it back if none goes out
+    day = EPOCH.day
+    reservation = await update_counters(uid, lambda c: reserve_video(c, day, PLAN_LIMITS[plan] if plan else None, FREE_DAILY_LIMIT))
+    if reservation is None:
+        if plan:
+            await reply(m, "🚫 Premium limit reached. Wait for reset or upgrade higher!", reply_markup=markup)
         else:
-            using_extra = False
-    # Fetch available videos
-    vids = []
-    async for msg_ in app.get_chat_history(VIDEO_CHANNEL_ID, limit=1000):
-        if msg_.video and msg_.id not in u["seen_videos"]:
-            vids.append(msg_)
-    if not vids:
-        await m.reply("No new videos yet. Adding soon – stay tuned!", reply_markup=markup)
+            await reply(m, limit_reached_message(uid), reply_markup=UPGRADE_BUTTONS)
         return
-    v = random.choice(vids)
-    u["seen_videos"].add(v.id)
-    if using_extra:
-        u["extra_videos_today"] += 1
-        if u["extra_videos_today"] % 2 == 0:
-            u["credits"] -= 1
-            if u["credits"] < 0:
-                u["credits"] = 0
-            if u["notifications"]:
-                await m.reply("📉 Credit used. Refer for more!", reply_markup=markup)
-    else:
-        u["videos_today"] += 1
-    await app.copy_message(m.chat.id, VIDEO_CHANNEL_ID, v.id, protect_content=True)
-    total_today = u["videos_today"] + u["extra_videos_today"]
-    await m.reply(f"🍿 Video delivered! Enjoy.\nToday: {total_today}\nFavorite it? Reply /favorite {v.id}", reply_markup=markup)
-    save_data()
-    log_action("Video Sent", uid, str(v.id))
+    _, charged, rolled = reservation
+    if rolled:
+        EPOCH.lazy_resets += 1
+    if charged:
+        AGG.add("credits", -1)
+    try:
+        vid = await deliver_unseen(m.chat.id, uid)
+    except BaseException:
+        await unreserve_video(uid, day, reservation)
+        raise
+    if vid is None:
+        await unreserve_video(uid, day, reservation)
+        await reply(m, "No new videos yet. Adding soon – stay tuned!", reply_markup=markup)
+        return
+    u.seen_videos.add(vid)
+    if charged and u.notifications:
+        await reply(m, "📉 Credit used. Refer for more!", reply_markup=markup)
+    AGG.event("videos")
+    total_today = daily(u, "videos_today") + daily(u, "extra_videos_today")
+    await reply(m, f"🍿 Video delivered! Enjoy.\nToday: {total_today}\nFavorite it? Reply /favorite {vid}", reply_markup=markup)
+    save_user(uid)
+    log_action("Video Sent", uid, str(vid))
+
+# Pick an unseen video from the catalog and send it; None if there is none
+async def deliver_unseen(chat_id, uid):
+    sampler = SAMPLERS.get(uid)
+    while True:
+        vid = sampler.draw(CATALOG, USERS[uid].seen_videos)
+        if vid is None:
+            return None
+        try:
+            await deliver_video(chat_id, vid)
+            return vid
+        except MessageIdInvalid:
+            # Post was deleted while we were offline
+            CATALOG.on_deleted([vid])
+        except BaseException:
+            sampler.put_back(CATALOG, vid)  # not sent: offer it again next time
+            raise
+
+async def unreserve_video(uid, day, reservation):
+    if await update_counters(uid, lambda c: release_video(c, day, reservation)) and reservation[1]:
+        AGG.add("credits")
+
+# Favorites browser: one page of the user's favorites (oldest first) as
+# inline buttons, tap a video to re-watch it. `cursor` is the position of the
+# page's first video; the buttons carry it, so paging never copies the set.
+def favorites_page(uid, cursor=0):
+    favs = USERS[uid].favorite_videos
+    cursor, ids, prev, nxt = favs.page(cursor, FAVORITES_PAGE_SIZE)
+    pages = (len(favs) + FAVORITES_PAGE_SIZE - 1) // FAVORITES_PAGE_SIZE
+    text = f"❤️ Your Favorites ({len(favs)}/{FAVORITES_CAP})\nPage {cursor // FAVORITES_PAGE_SIZE + 1} of {pages} – tap a video to re-watch it."
+    rows = [[InlineKeyboardButton(f"▶️ Video {vid}", callback_data=f"favplay_{vid}"),
+             InlineKeyboardButton("✖️ Remove", callback_data=f"favdel_{vid}_{cursor}")] for vid in ids]
+    nav = []
+    if prev is not None:
+        nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"favpage_{prev}"))
+    if nxt is not None:
+        nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"favpage_{nxt}"))
+    if nav:
+        rows.append(nav)
+    return text, InlineKeyboardMarkup(rows)
 
 # Favorites handler
+@instrument("favorites")
 async def favorites(m):
     uid = m.from_user.id
     u = USERS[uid]
     markup = ADMIN_MENU if uid == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
-    if not u["favorite_videos"]:
-        await m.reply("No favorites yet. Favorite videos by replying /favorite <id> after receiving one.", reply_markup=markup)
+    if not u.favorite_videos:
+        await reply(m, "No favorites yet. Favorite videos by replying /favorite <id> after receiving one.", reply_markup=markup)
         return
-    msg = "❤️ Your Favorites:\n"
-    for vid in u["favorite_videos"][:10]:  # Limit to 10 for brevity
-        msg += f"- Video ID: {vid}\n"
-    if len(u["favorite_videos"]) > 10:
-        msg += f"... and {len(u['favorite_videos']) - 10} more."
-    await m.reply(msg, reply_markup=markup)
-    await m.reply("Want to re-watch? Reply /rewatch <id>")
+    text, buttons = favorites_page(uid)
+    await reply(m, text, reply_markup=buttons)
+
+# Browser buttons count against the same per-user tap limit as the menu
+async def tap_refused(cb):
+    if cb.from_user.id == ADMIN_ID or TAPS.check(cb.from_user.id) == "allow":
+        return False
+    METRICS.inc("bot_taps_refused_total", ("rate",))
+    await cb.answer("⏳ Easy there! Too many taps – wait a moment and try again.")
+    return True
+
+@app.on_callback_query(filters.regex(r"^favpage_(\d+)$"))
+@instrument("favorites_page")
+async def favorites_page_callback(_, cb):
+    uid = cb.from_user.id
+    if await tap_refused(cb):
+        return
+    await load_user(uid)
+    if not USERS[uid].favorite_videos:
+        await cb.answer("No favorites yet.")
+        return
+    text, buttons = favorites_page(uid, int(cb.matches[0].group(1)))
+    await edit(cb.message, text, reply_markup=buttons)
+    await cb.answer()
+
+@app.on_callback_query(filters.regex(r"^favplay_(\d+)$"))
+@instrument("favorites_play")
+async def favorites_play_callback(_, cb):
+    uid = cb.from_user.id
+    if await tap_refused(cb):
+        return
+    await load_user(uid)
+    vid = int(cb.matches[0].group(1))
+    if vid not in USERS[uid].favorite_videos:
+        await cb.answer("Not in favorites.")
+        return
+    if not VIDEO_INFLIGHT.enter(uid):
+        METRICS.inc("bot_taps_refused_total", ("inflight",))
+        await cb.answer()
+        return
+    try:
+        await deliver_video(cb.message.chat.id, vid)
+        await cb.answer("🍿 Re-watching favorite!")
+        log_action("Favorite Rewatched", uid, str(vid))
+    except MessageIdInvalid:
+        await cb.answer("This video is no longer available.", show_alert=True)
+    finally:
+        VIDEO_INFLIGHT.leave(uid)
+
+@app.on_callback_query(filters.regex(r"^favdel_(\d+)_(\d+)$"))
+@instrument("favorites_remove")
+async def favorites_remove_callback(_, cb):
+    uid = cb.from_user.id
+    if await tap_refused(cb):
+        return
+    await load_user(uid)
+    vid, cursor = int(cb.matches[0].group(1)), int(cb.matches[0].group(2))
+    if USERS[uid].favorite_videos.discard(vid):
+        AGG.add("favorites", -1)
+        save_user(uid)
+    if not USERS[uid].favorite_videos:
+        await edit(cb.message, "No favorites left. Favorite videos by replying /favorite <id> after receiving one.")
+    else:
+        text, buttons = favorites_page(uid, cursor)
+        await edit(cb.message, text, reply_markup=buttons)
+    await cb.answer("Removed from favorites.")
 
 # Add favorite command
 @app.on_message(filters.command("favorite"))
+@instrument("add_favorite")
 async def add_favorite(_, m):
     uid = m.from_user.id
     if len(m.command) < 2:
-        await m.reply("Usage: /favorite <video_id>")
+        await reply(m, "Usage: /favorite <video_id>")
         return
     try:
         vid = int(m.command[1])
-        if vid in USERS[uid]["seen_videos"] and vid not in USERS[uid]["favorite_videos"]:
-            USERS[uid]["favorite_videos"].append(vid)
-            await m.reply("❤️ Added to favorites!")
-            save_data()
+        favs = USERS[uid].favorite_videos
+        if vid not in USERS[uid].seen_videos or vid in favs:
+            await reply(m, "Invalid or already favorited.")
+        elif favs.add(vid, FAVORITES_CAP):
+            AGG.add("favorites")
+            await reply(m, "❤️ Added to favorites!")
+            save_user(uid)
         else:
-            await m.reply("Invalid or already favorited.")
+            await reply(m, f"❤️ Favorites are full ({FAVORITES_CAP}). Remove one from ❤️ Favorites first.")
     except ValueError:
-        await m.reply("Invalid video ID.")
+        await reply(m, "Invalid video ID.")
 
 # Rewatch favorite command
 @app.on_message(filters.command("rewatch"))
+@instrument("rewatch_favorite")
 async def rewatch_favorite(_, m):
     uid = m.from_user.id
     if len(m.command) < 2:
-        await m.reply("Usage: /rewatch <video_id>")
+        await reply(m, "Usage: /rewatch <video_id>")
         return
     try:
         vid = int(m.command[1])
-        if vid in USERS[uid]["favorite_videos"]:
-            await app.copy_message(m.chat.id, VIDEO_CHANNEL_ID, vid, protect_content=True)
-            await m.reply("🍿 Re-watching favorite!")
+        if vid in USERS[uid].favorite_videos:
+            await deliver_video(m.chat.id, vid)
+            await reply(m, "🍿 Re-watching favorite!")
         else:
-            await m.reply("Not in favorites.")
+            await reply(m, "Not in favorites.")
     except ValueError:
-        await m.reply("Invalid video ID.")
+        await reply(m, "Invalid video ID.")
 
 # Profile handler
+@instrument("profile")
 async def profile(m):
     uid = m.from_user.id
     u = USERS[uid]
     plan = is_premium(uid)
     prem_str = plan.upper() if plan else "No"
     if plan:
-        expiry = PREMIUM[uid]["expiry"].strftime("%d-%m-%Y %H:%M")
+        expiry = local_time(PREMIUM[uid].expiry).strftime("%d-%m-%Y %H:%M")
         prem_str += f" (Expires: {expiry})"
-    videos_from_credits = u["credits"] * 2
-    total_today = u["videos_today"] + u["extra_videos_today"]
-    joined_str = u["joined"].strftime("%d-%m-%Y")
-    notif_str = "Enabled" if u["notifications"] else "Disabled"
-    lang_str = u["language"].upper()
-    daily_remaining = PLAN_LIMITS.get(plan, FREE_DAILY_LIMIT) - u["videos_today"]
-    extra_remaining = videos_from_credits - u["extra_videos_today"]
-    favorites_count = len(u["favorite_videos"])
+    videos_from_credits = u.credits * 2
+    total_today = daily(u, "videos_today") + daily(u, "extra_videos_today")
+    joined_str = local_time(u.joined).strftime("%d-%m-%Y")
+    notif_str = "Enabled" if u.notifications else "Disabled"
+    lang_str = REPO.languages.get(uid, "en").upper()
+    daily_remaining = PLAN_LIMITS.get(plan, FREE_DAILY_LIMIT) - daily(u, "videos_today")
+    extra_remaining = videos_from_credits - daily(u, "extra_videos_today")
+    favorites_count = len(u.favorite_videos)
     markup = ADMIN_MENU if uid == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
     msg = f"""👤 PROFILE DASHBOARD
 
 ━━━━━━━━━━━━━━━━━━
 Videos Today: {total_today} (Remaining: {max(0, daily_remaining)})
 Extra Remaining: {max(0, extra_remaining)}
-Credits: {u['credits']} (🎥 {videos_from_credits})
-Referrals: {u['referrals']}
+Credits: {u.credits} (🎥 {videos_from_credits})
+Referrals: {u.referrals}
 Favorites: {favorites_count}
 Premium: {prem_str}
 Joined: {joined_str}
@@ -570,9 +921,10 @@ Language: {lang_str}
 
 ━━━━━━━━━━━━━━━━━━
 Tip: Favorite videos to build your collection!"""
-    await m.reply(msg, reply_markup=markup)
+    await reply(m, msg, reply_markup=markup)
 
 # Refer handler
+@instrument("refer")
 async def refer(m):
     uid = m.from_user.id
     link = f"https://t.me/{BOT_USERNAME}?start={uid}"
@@ -595,9 +947,10 @@ Upgrades:
 Link: {link}
 
 Pro Tip: Post in groups for max referrals!"""
-    await m.reply(msg, reply_markup=markup)
+    await reply(m, msg, reply_markup=markup)
 
 # Premium handler
+@instrument("premium")
 async def premium(m):
     markup = ADMIN_MENU if m.from_user.id == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
     msg = """💎 PREMIUM UNLOCKS
@@ -610,34 +963,34 @@ Boost your access:
 Perks: Priority, customs.
 
 Contact @jioxt for payment!"""
-    await m.reply(msg, reply_markup=markup)
+    await reply(m, msg, reply_markup=markup)
 
 # Leaderboard handler
+@instrument("leaderboard_user")
 async def leaderboard_user(m):
-    ref_list = sorted(USERS.items(), key=lambda x: x[1]["referrals"], reverse=True)[:10]
+    ref_list = LEADERBOARD.top(10, fill=iter(USERS))
     msg = "🏆 LEADERBOARD TOP 10\n"
-    for i, (uid, u) in enumerate(ref_list, 1):
-        try:
-            user = await app.get_users(uid)
-            username = user.first_name or f"User {uid}"
-            msg += f"{i}. {username}: {u['referrals']}\n"
-        except:
-            msg += f"{i}. User {uid}: {u['referrals']}\n"
-    pos = next((i+1 for i, (k,v) in enumerate(sorted(USERS.items(), key=lambda x: x[1]["referrals"], reverse=True)) if k == m.from_user.id), "N/A")
+    names = await NAMES.resolve(app, [uid for uid, _ in ref_list])
+    for i, (uid, refs) in enumerate(ref_list, 1):
+        username = names.get(uid) or f"User {uid}"
+        msg += f"{i}. {username}: {refs}\n"
+    pos = LEADERBOARD.rank(USERS[m.from_user.id].referrals) if m.from_user.id in USERS else "N/A"
     msg += f"\nYour Rank: {pos}"
     markup = ADMIN_MENU if m.from_user.id == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
-    await m.reply(msg, reply_markup=markup)
+    await reply(m, msg, reply_markup=markup)
 
 # Toggle notifications
+@instrument("toggle_notifications")
 async def toggle_notifications(m):
     uid = m.from_user.id
-    USERS[uid]["notifications"] = not USERS[uid]["notifications"]
-    status = "enabled" if USERS[uid]["notifications"] else "disabled"
+    USERS[uid].notifications = not USERS[uid].notifications
+    status = "enabled" if USERS[uid].notifications else "disabled"
     markup = ADMIN_MENU if uid == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
-    await m.reply(f"🔔 Notifications {status}.", reply_markup=markup)
-    save_data()
+    await reply(m, f"🔔 Notifications {status}.", reply_markup=markup)
+    save_user(uid)
 
 # Help handler
+@instrument("help_command")
 async def help_command(m):
     markup = ADMIN_MENU if m.from_user.id == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
     msg = """❓ FULL HELP GUIDE
@@ -654,9 +1007,10 @@ async def help_command(m):
 - 🌐 Language: Select.
 
 Support: @jioxt"""
-    await m.reply(msg, reply_markup=markup)
+    await reply(m, msg, reply_markup=markup)
 
 # About handler
+@instrument("about_bot")
 async def about_bot(m):
     markup = ADMIN_MENU if m.from_user.id == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
     msg = """📢 VIDEO HUB INFO
@@ -665,29 +1019,28 @@ Premier video bot by @jioxt.
 Exclusive content, secure.
 Join @cnnetworkofficial.
 Feedback welcome!"""
-    await m.reply(msg, reply_markup=markup)
+    await reply(m, msg, reply_markup=markup)
 
 # Feedback handler
+@instrument("feedback")
 async def feedback(m):
     markup = ADMIN_MENU if m.from_user.id == ADMIN_ID else MAIN_MENU  # Fixed: Defined markup
-    await m.reply("🗣 Share feedback: Reply with your message.", reply_markup=markup)
+    await reply(m, "🗣 Share feedback: Reply with your message.", reply_markup=markup)
 
 # Receive feedback (reply handler)
 @app.on_message(filters.reply & filters.text)
+@instrument("receive_feedback")
 async def receive_feedback(_, m):
     if "Share feedback" in m.reply_to_message.text:
         uid = m.from_user.id
         fb = m.text
-        FEEDBACK[uid] = fb
-        await m.reply("Thanks for feedback!")
-        try:
-            await app.send_message(ADMIN_ID, f"Feedback from {uid}: {fb}")
-        except:
-            pass
-        save_data()
+        await reply(m, "Thanks for feedback!")
+        notify(ADMIN_ID, f"Feedback from {uid}: {fb}")
+        save_feedback(uid, fb)
         log_action("Feedback Received", uid, fb[:50] + "..." if len(fb) > 50 else fb)
 
 # Admin panel
+@instrument("admin")
 async def admin(m):
     markup = ADMIN_MENU  # Fixed: Defined markup
     msg = """🛠 ADMIN COMMANDS
@@ -696,15 +1049,19 @@ async def admin(m):
 /removepremium <uid>
 /addcredits <uid> <credits>
 /broadcast <msg>
+/broadcaststatus
 /stats
+/checkstats
 /leaderboard
 /userinfo <uid>
 /viewfeedback
-/viewlogs"""
-    await m.reply(msg, reply_markup=markup)
+/viewlogs [user <uid>] [action "<name>"] [since <time>] [until <time>]
+/profile cpu|mem [seconds]"""
+    await reply(m, msg, reply_markup=markup)
 
 # Admin commands
 @app.on_message(filters.command("addpremium") & filters.user(ADMIN_ID))
+@instrument("addprem")
 async def addprem(_, m):
     try:
         parts = m.text.split()
@@ -712,144 +1069,390 @@ async def addprem(_, m):
         plan = parts[2].lower()
         days = int(parts[3])
         if plan not in PLAN_LIMITS:
-            await m.reply("Invalid plan.")
+            await reply(m, "Invalid plan.")
             return
-        if uid in PREMIUM:
-            PREMIUM[uid]["expiry"] += timedelta(days=days)
-            if PREMIUM[uid]["plan"] != plan:
-                PREMIUM[uid]["plan"] = plan
-        else:
-            PREMIUM[uid] = {"plan": plan, "expiry": now() + timedelta(days=days)}
-        load_user(uid)
-        await m.reply(f"Premium added: {plan} {days} days to {uid}")
-        if USERS[uid]["notifications"]:
-            await app.send_message(uid, f"🎉 Premium {plan.upper()} for {days} days!")
-        save_data()
+        await grant_premium(uid, plan, days)
+        await load_user(uid)
+        await reply(m, f"Premium added: {plan} {days} days to {uid}")
+        if USERS[uid].notifications:
+            notify(uid, f"🎉 Premium {plan.upper()} for {days} days!")
         log_action("Add Premium", uid, f"{plan} {days}")
     except:
-        await m.reply("Usage: /addpremium <uid> <plan> <days>")
+        await reply(m, "Usage: /addpremium <uid> <plan> <days>")
 
 @app.on_message(filters.command("removepremium") & filters.user(ADMIN_ID))
+@instrument("removeprem")
 async def removeprem(_, m):
     try:
         uid = int(m.text.split()[1])
-        PREMIUM.pop(uid, None)
-        await m.reply(f"Premium removed {uid}")
-        if uid in USERS and USERS[uid]["notifications"]:
-            await app.send_message(uid, "Premium removed.")
-        save_data()
+        await revoke_premium(uid)
+        await reply(m, f"Premium removed {uid}")
+        if uid in USERS and USERS[uid].notifications:
+            notify(uid, "Premium removed.")
         log_action("Remove Premium", uid)
     except:
-        await m.reply("Usage: /removepremium <uid>")
+        await reply(m, "Usage: /removepremium <uid>")
 
 @app.on_message(filters.command("addcredits") & filters.user(ADMIN_ID))
+@instrument("addcredits")
 async def addcredits(_, m):
     try:
         parts = m.text.split()
         uid = int(parts[1])
         credits = int(parts[2])
-        load_user(uid)
-        USERS[uid]["credits"] += credits
-        await m.reply(f"Added {credits} to {uid}")
-        if USERS[uid]["notifications"]:
-            await app.send_message(uid, f"+{credits} Credits!")
-        auto_upgrade(uid)
-        save_data()
+        await load_user(uid)
+        await update_counters(uid, lambda c: add_credits(c, credits))
+        AGG.add("credits", credits)
+        await reply(m, f"Added {credits} to {uid}")
+        if USERS[uid].notifications:
+            notify(uid, f"+{credits} Credits!")
+        await auto_upgrade(uid)
+        save_user(uid)
         log_action("Add Credits", uid, credits)
     except:
-        await m.reply("Usage: /addcredits <uid> <credits>")
+        await reply(m, "Usage: /addcredits <uid> <credits>")
 
 @app.on_message(filters.command("broadcast") & filters.user(ADMIN_ID))
+@instrument("bc")
 async def bc(_, m):
     msg = m.text.replace("/broadcast", "").strip()
     if not msg:
-        await m.reply("Usage: /broadcast <msg>")
+        await reply(m, "Usage: /broadcast <msg>")
         return
-    sent = 0
-    for uid in list(USERS.keys()):
-        try:
-            markup = MAIN_MENU if uid != ADMIN_ID else ADMIN_MENU
-            await app.send_message(uid, msg, reply_markup=markup)
-            sent += 1
-        except:
-            pass
-    await m.reply(f"Sent to {sent} users")
+    if BROADCAST.running():
+        await reply(m, "A broadcast is already running. Check /broadcaststatus")
+        return
+    await BROADCAST.start(msg, REPO.user_ids(), on_done=broadcast_done)
+    await reply(m, f"📣 Broadcast started to {BROADCAST.job['total']} users ({len(BROADCAST.unreachable)} unreachable skipped).\nTrack it with /broadcaststatus")
     log_action("Broadcast", details=msg[:50] + "..." if len(msg) > 50 else msg)
 
+async def broadcast_done(st):
+    notify(ADMIN_ID, f"📣 Broadcast finished: sent to {st['sent']} users ({st['blocked']} unreachable, {st['failed']} failed) in {st['elapsed_s']:.0f}s")
+    log_action("Broadcast Finished", details=f"sent {st['sent']}, unreachable {st['blocked']}, failed {st['failed']}")
+
+def format_broadcast_status(st):
+    ob = OUTBOUND.metrics()
+    eta = f"{st['eta_s'] / 60:.1f} min" if st["eta_s"] is not None else "-"
+    pct = st["processed"] * 100 / st["total"] if st["total"] else 100
+    return f"""📣 BROADCAST {st['status'].upper()}
+Progress: {st['processed']}/{st['total']} ({pct:.1f}%)
+Sent: {st['sent']} | Unreachable: {st['blocked']} | Failed: {st['failed']}
+Throughput: {st['rate']:.1f} msg/s | ETA: {eta}
+FloodWaits (all outbound): {ob['flood_waits']} ({ob['flood_wait_s']}s)
+Elapsed: {st['elapsed_s']:.0f}s"""
+
+@app.on_message(filters.command("broadcaststatus") & filters.user(ADMIN_ID))
+@instrument("broadcast_status")
+async def broadcast_status(_, m):
+    st = BROADCAST.status()
+    if st is None:
+        await reply(m, "No broadcast yet.")
+        return
+    await reply(m, format_broadcast_status(st))
+
 @app.on_message(filters.command("stats") & filters.user(ADMIN_ID))
+@instrument("stats")
 async def stats(_, m):
-    user_count = len(USERS)
-    prem_count = sum(1 for uid in USERS if is_premium(uid))
-    total_videos = sum(u["videos_today"] + u["extra_videos_today"] for u in USERS.values())
-    total_credits = sum(u["credits"] for u in USERS.values())
-    total_referrals = sum(u["referrals"] for u in USERS.values())
-    total_favorites = sum(len(u["favorite_videos"]) for u in USERS.values())
-    msg = f"📊 STATS\nUsers: {user_count}\nPremium: {prem_count}\nVideos Today: {total_videos}\nCredits: {total_credits}\nReferrals: {total_referrals}\nFavorites: {total_favorites}"
-    await m.reply(msg)
+    t = AGG.totals
+    msg = f"📊 STATS\nUsers: {t['users']}\nPremium: {t['premium']}\nVideos Today: {AGG.videos_today()}\nCredits: {t['credits']}\nReferrals: {t['referrals']}\nFavorites: {t['favorites']}"
+    msg += f"\n\n📈 Last {STATS_TREND_DAYS} days (day: DAU / videos / new users / referrals)"
+    for row in AGG.trend(STATS_TREND_DAYS):
+        msg += f"\n{row['day'][5:]}: {row['dau']} / {row['videos']} / {row['new_users']} / {row['referrals']}"
+    mc = MEMBERSHIP.metrics()
+    msg += f"\n\n🔒 Membership Cache\nHit ratio: {mc['hit_ratio'] * 100:.1f}% ({mc['hits']} hits, {mc['coalesced']} coalesced, {mc['misses']} misses)\nCached: {mc['cached']}, invalidated: {mc['invalidations']}"
+    p = PERSIST.metrics()
+    msg += f"\n\n💾 Persistence\nSave requests: {p['requests']} (coalesced {p['coalesced']})\nFlushes: {p['flushes']} (avg {p['flush_ms_avg']} ms, max {p['flush_ms_max']} ms)\nErrors: {p['errors']}"
+    ep = EPOCH.metrics()
+    msg += f"\n\n🌙 Daily Reset\nDay: {ep['day']} (ticks: {ep['ticks']}, last tick {ep['tick_ms_last']} ms)\nLazy counter resets: {ep['lazy_resets']}, reset notices: {ep['notices']}"
+    ob = OUTBOUND.metrics()
+    msg += f"\n\n📤 Outbound\nQueued: {ob['queued']}, waiting on chat limit: {ob['delayed']}, in flight: {ob['inflight']}\nFloodWaits: {ob['flood_waits']} ({ob['flood_wait_s']}s)"
+    for name in ("interactive", "video", "notify", "broadcast"):
+        c = ob[name]
+        msg += f"\n{name}: {c['sent']} sent, {c['failed']} failed, wait avg {c['wait_ms_avg']} ms / max {c['wait_ms_max']} ms"
+    await reply(m, msg)
+
+# Recount everything from storage and compare with (then repair) the counters
+@app.on_message(filters.command("checkstats") & filters.user(ADMIN_ID))
+@instrument("check_stats")
+async def check_stats(_, m):
+    await PERSIST.flush()  # SQLite: make pending user writes visible
+    totals = REPO.user_totals(day=today())
+    expected = {
+        "users": REPO.count_users(), "premium": len(PREMIUM), "credits": totals["credits"],
+        "referrals": totals["referrals"], "favorites": totals["favorites"], "videos": totals["videos_today"],
+    }
+    mismatches = AGG.check(expected)
+    if not mismatches:
+        await reply(m, "✅ Stats counters match a full recount.")
+        return
+    lines = "\n".join(f"{field}: counter {have}, recount {want}" for field, have, want in mismatches)
+    await reply(m, f"⚠️ Stats counters drifted (repaired):\n{lines}")
+    log_action("Stats Drift Repaired", details=", ".join(field for field, _, _ in mismatches))
 
 @app.on_message(filters.command("leaderboard") & filters.user(ADMIN_ID))
+@instrument("leaderboard")
 async def leaderboard(_, m):
-    ref_list = sorted(USERS.items(), key=lambda x: x[1]["referrals"], reverse=True)[:10]
+    ref_list = LEADERBOARD.top(10, fill=iter(USERS))
     msg = "🏆 ADMIN LEADERBOARD\n"
-    for i, (uid, u) in enumerate(ref_list, 1):
-        try:
-            user = await app.get_users(uid)
-            username = user.first_name or f"User {uid}"
-            msg += f"{i}. {username} ({uid}): {u['referrals']}\n"
-        except:
-            msg += f"{i}. User {uid}: {u['referrals']}\n"
-    await m.reply(msg)
+    names = await NAMES.resolve(app, [uid for uid, _ in ref_list])
+    for i, (uid, refs) in enumerate(ref_list, 1):
+        if names.get(uid):
+            msg += f"{i}. {names[uid]} ({uid}): {refs}\n"
+        else:
+            msg += f"{i}. User {uid}: {refs}\n"
+    await reply(m, msg)
 
 @app.on_message(filters.command("userinfo") & filters.user(ADMIN_ID))
+@instrument("userinfo")
 async def userinfo(_, m):
     try:
         uid = int(m.text.split()[1])
         if uid not in USERS:
-            await m.reply("User not found.")
+            await reply(m, "User not found.")
             return
         u = USERS[uid]
         plan = is_premium(uid)
         prem_str = plan.upper() if plan else "No"
         if plan:
-            expiry = PREMIUM[uid]["expiry"].strftime("%d-%m-%Y %H:%M")
+            expiry = local_time(PREMIUM[uid].expiry).strftime("%d-%m-%Y %H:%M")
             prem_str += f" ({expiry})"
-        videos_from_credits = u["credits"] * 2
-        total_today = u["videos_today"] + u["extra_videos_today"]
-        joined_str = u["joined"].strftime("%d-%m-%Y")
-        notif_str = "Enabled" if u["notifications"] else "Disabled"
-        lang_str = u["language"].upper()
-        favorites = len(u["favorite_videos"])
-        try:
-            user = await app.get_users(uid)
-            username = user.first_name or "Unknown"
-        except:
-            username = "Unknown"
-        msg = f"👤 {uid} ({username})\nVideos Today: {total_today}\nCredits: {u['credits']} ({videos_from_credits})\nReferrals: {u['referrals']}\nFavorites: {favorites}\nPremium: {prem_str}\nJoined: {joined_str}\nNotifications: {notif_str}\nLanguage: {lang_str}\nSeen: {len(u['seen_videos'])}"
-        await m.reply(msg)
+        videos_from_credits = u.credits * 2
+        total_today = daily(u, "videos_today") + daily(u, "extra_videos_today")
+        joined_str = local_time(u.joined).strftime("%d-%m-%Y")
+        notif_str = "Enabled" if u.notifications else "Disabled"
+        lang_str = REPO.languages.get(uid, "en").upper()
+        favorites = len(u.favorite_videos)
+        username = (await NAMES.resolve(app, [uid])).get(uid) or "Unknown"
+        msg = f"👤 {uid} ({username})\nVideos Today: {total_today}\nCredits: {u.credits} ({videos_from_credits})\nReferrals: {u.referrals}\nFavorites: {favorites}\nPremium: {prem_str}\nJoined: {joined_str}\nNotifications: {notif_str}\nLanguage: {lang_str}\nSeen: {len(u.seen_videos)}"
+        await reply(m, msg)
     except:
-        await m.reply("Usage: /userinfo <uid>")
+        await reply(m, "Usage: /userinfo <uid>")
 
 @app.on_message(filters.command("viewfeedback") & filters.user(ADMIN_ID))
+@instrument("view_feedback")
 async def view_feedback(_, m):
-    if not FEEDBACK:
-        await m.reply("No feedback yet.")
+    recent = REPO.recent_feedback(10)  # Last 10
+    if not recent:
+        await reply(m, "No feedback yet.")
         return
     msg = "🗣 FEEDBACKS\n"
-    for uid, fb in list(FEEDBACK.items())[-10:]:  # Last 10
+    for uid, fb in recent:
         msg += f"User {uid}: {fb}\n"
-    await m.reply(msg)
+    await reply(m, msg)
 
 @app.on_message(filters.command("viewlogs") & filters.user(ADMIN_ID))
+@instrument("view_logs")
 async def view_logs(_, m):
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            logs = f.read()[-2000:]  # Last 2000 chars
-        await m.reply(f"Recent Logs:\n{logs}")
+    try:
+        query = parse_log_query(shlex.split(m.text.replace("“", '"').replace("”", '"'))[1:])
+    except ValueError as e:
+        await reply(m, f"{e}\n{LOG_QUERY_USAGE}")
+        return
+    if query:
+        lines = await asyncio.to_thread(LOG_INDEX.query, limit=LOG_VIEW_LINES, **query)
     else:
-        await m.reply("No logs.")
+        lines = await asyncio.to_thread(tail_lines, LOG_FILE, LOG_VIEW_LINES)
+    logs = []
+    for line in lines:
+        try:
+            r = json.loads(line)
+        except ValueError:
+            continue
+        logs.append(f"{r['ts']} - {r['action']} - User: {r['uid']} - {r['details']}")
+    if logs:
+        await reply(m, "Recent Logs:\n" + "\n".join(logs)[-3500:])
+    else:
+        await reply(m, "No logs.")
+
+LOG_QUERY_USAGE = """Usage: /viewlogs [user <uid>] [action "Video Sent"] [since <time>] [until <time>]
+Times: 2026-10-18, "2026-10-18 14:00" or relative 30m / 6h / 7d"""
+
+def parse_log_query(tokens):
+    if len(tokens) % 2:
+        raise ValueError(f"Missing value for '{tokens[-1]}'")
+    query = {}
+    for key, value in zip(tokens[::2], tokens[1::2]):
+        key = key.lower()
+        if key == "user":
+            try:
+                query["uid"] = int(value)
+            except ValueError:
+                raise ValueError(f"Invalid user id: {value}")
+        elif key == "action":
+            query["action"] = value
+        elif key in ("since", "until"):
+            query[key] = parse_log_time(value)
+        else:
+            raise ValueError(f"Unknown filter '{key}'")
+    return query
+
+def parse_log_time(text):
+    rel = re.fullmatch(r"(\d+)([mhd])", text.lower())
+    if rel:
+        unit = {"m": "minutes", "h": "hours", "d": "days"}[rel.group(2)]
+        return (now() - timedelta(**{unit: int(rel.group(1))})).timestamp()
+    try:
+        when = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid time: {text}")
+    if when.tzinfo is None:
+        when = TIMEZONE.localize(when)
+    return when.timestamp()
+
+# /profile cpu [seconds] | /profile mem [seconds]: capture runs in the
+# background and the report is sent back as files
+@app.on_message(filters.command("profile") & filters.user(ADMIN_ID))
+@instrument("profile_capture")
+async def profile_capture(_, m):
+    args = m.command[1:]
+    kind = args[0].lower() if args else ""
+    try:
+        seconds = int(args[1]) if len(args) > 1 else 30
+    except ValueError:
+        seconds = 0
+    if kind not in ("cpu", "mem") or not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await reply(m, f"Usage: /profile cpu|mem [seconds] (1-{PROFILE_MAX_SECONDS}, default 30)")
+        return
+
+    async def done(paths, error):
+        if error is not None:
+            await reply(m, f"⚠️ {kind.upper()} profile failed: {error}")
+            return
+        for path in paths:
+            await OUTBOUND.call(PRIO_INTERACTIVE, m.chat.id, m.reply_document, path, caption=os.path.basename(path))
+        log_action("Profile Captured", details=f"{kind} {seconds}s")
+
+    if not PROFILER.start(kind, seconds, done):
+        await reply(m, f"A {PROFILER.busy.upper()} profile is already running.")
+        return
+    await reply(m, f"⏱ Profiling {kind.upper()} for {seconds}s, report follows.")
+
+# Drop seen ids of videos that no longer exist in the channel: now for users
+# already in memory, and for the rest as each is first loaded from storage
+def prune_seen_videos():
+    if not CATALOG:
+        return  # never prune against an empty (failed) catalog scan
+    pruned = sum(prune_seen(uid, u) for uid, u in list(dict.items(USERS)))
+    REPO.on_load = prune_seen
+    if pruned:
+        save_data()
+        logger.info(f"Pruned {pruned} seen ids of deleted videos")
+
+def prune_seen(uid, u):
+    before = len(u.seen_videos)
+    pruned = before - u.seen_videos.prune(CATALOG)
+    if pruned:
+        save_user(uid)
+    return pruned
+
+# Background: retry a failed startup channel scan, backing off up to
+# CATALOG_RETRY_MAX (and at least as long as a FloodWait asks)
+async def catalog_resync(error, delay=5):
+    while True:
+        if isinstance(error, FloodWait):
+            delay = max(delay, error.value)
+        await asyncio.sleep(delay)
+        try:
+            await CATALOG.sync(app, VIDEO_CHANNEL_ID)
+        except Exception as e:
+            error, delay = e, min(delay * 2, CATALOG_RETRY_MAX)
+            logger.warning(f"Video catalog sync failed again, retrying in {delay}s or more: {e!r}")
+        else:
+            prune_seen_videos()
+            return
+
+# Background: drop expired premium in bulk and warn users shortly before expiry
+async def premium_sweeper():
+    while True:
+        await asyncio.sleep(PREMIUM_SWEEP_INTERVAL)
+        ts = now().timestamp()
+        if SHARED_STATE:
+            for uid in REPO.reload_premium():  # granted by other workers
+                PREMIUM_INDEX.track(uid, PREMIUM[uid].expiry)
+        for uid in PREMIUM_INDEX.pop_reminders(PREMIUM, ts):
+            if uid in USERS and USERS[uid].notifications:
+                expiry = local_time(PREMIUM[uid].expiry).strftime("%d-%m-%Y %H:%M")
+                notify(uid, f"⏳ Your {PREMIUM[uid].plan.upper()} premium expires on {expiry}.\nRefer friends or contact @jioxt to extend!")
+        expired = PREMIUM_INDEX.pop_expired(PREMIUM, ts)
+        for uid in expired:
+            await save_premium(uid)  # one coalesced batch
+        AGG.add("premium", -len(expired))
+        if expired:
+            log_action("Premium Expired", details=f"{len(expired)} users")
+
+# Background: persist the name cache so restarts do not start cold
+async def name_cache_saver():
+    while True:
+        await asyncio.sleep(NAME_CACHE_SAVE_INTERVAL)
+        await NAMES.save()
+
+# Background: persist today's counters and the daily series
+async def aggregates_saver():
+    while True:
+        await asyncio.sleep(AGGREGATES_SAVE_INTERVAL)
+        await AGG.save()
+
+def start_background(coro):
+    BACKGROUND_TASKS.append(asyncio.create_task(coro))
+
+async def stop_background():
+    for task in BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+    BACKGROUND_TASKS.clear()
+
+# Startup: build the video catalog once, then serve updates
+async def main():
+    LOOPMON.start()  # before the catalog scan, so a stall there is caught too
+    PERSIST.start()
+    EPOCH.start()
+    ACTIONS.start()
+    async with app:
+        OUTBOUND.start()
+        try:
+            await CATALOG.sync(app, VIDEO_CHANNEL_ID)
+        except Exception as e:
+            # Serve from the catalog loaded from disk and keep trying
+            logger.error(f"Video catalog sync failed, serving {len(CATALOG)} known videos: {e!r}")
+            start_background(catalog_resync(e))
+        prune_seen_videos()
+        if WORKER_ID == 0:  # one sweeper per store
+            start_background(premium_sweeper())
+        start_background(name_cache_saver())
+        start_background(aggregates_saver())
+        BROADCAST.resume(on_done=broadcast_done)
+        LOOPMON.ready = True
+        await idle()
+        await LOOPMON.stop()
+        await stop_background()
+        await EPOCH.stop()
+        await BROADCAST.stop()  # checkpoint so the job resumes on next start
+        await OUTBOUND.stop()  # let queued notifications go out
+        await NAMES.save()
+        await AGG.save()
+    await PERSIST.stop()  # flush pending writes
+    REPO.close()  # JSON: compact the journal into a fresh snapshot
+    ACTIONS.close()  # drain queued log records
+
+# Supervisor for WORKERS > 1: one bot process per worker, stopped together
+def run_workers():
+    procs = [subprocess.Popen([sys.executable, *sys.argv], env={**os.environ, "WORKER_ID": str(i)})
+             for i in range(WORKERS)]
+    logger.info(f"Started {WORKERS} workers on {SQLITE_FILE}")
+    try:
+        for proc in procs:
+            proc.wait()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
 
 # Main execution
 if __name__ == "__main__":
+    if SHARED_STATE and "WORKER_ID" not in os.environ:
+        run_workers()
+        sys.exit(0)
     load_data()
     threading.Thread(target=run_flask, daemon=True).start()
-    app.run()
+    app.run(main())
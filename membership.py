@@ -0,0 +1,78 @@
+import time
+import asyncio
+
+
+# Force-channel membership checks with a positive-result TTL cache.
+# Concurrent checks for the same user share one in-flight request; negative
+# results are never cached so a user who just joined passes on "Refresh".
+# Chat-member updates (when the bot can see them) mark or invalidate entries.
+# Entries are kept in expiry order (one TTL for all, re-marked entries move
+# to the end), so each mark drops the expired ones from the front: the cache
+# holds only users checked within the last TTL.
+class MembershipCache:
+    def __init__(self, fetch, not_member, ttl=600):
+        self.fetch = fetch            # async fetch(uid); raises not_member if absent
+        self.not_member = not_member  # exception type meaning "not a participant"
+        self.ttl = ttl
+        self._ok = {}                 # uid -> expiry (monotonic), oldest first
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def check(self, uid):
+        expiry = self._ok.get(uid)
+        if expiry is not None:
+            if expiry > time.monotonic():
+                self.hits += 1
+                return True
+            del self._ok[uid]
+        fut = self._inflight.get(uid)
+        if fut is None:
+            self.misses += 1
+            fut = self._inflight[uid] = asyncio.ensure_future(self._lookup(uid))
+            fut.add_done_callback(lambda _: self._inflight.pop(uid, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(fut)
+
+    async def _lookup(self, uid):
+        try:
+            await self.fetch(uid)
+        except self.not_member:
+            return False
+        self.mark(uid)
+        return True
+
+    def mark(self, uid):
+        now = time.monotonic()
+        self._prune(now)
+        self._ok.pop(uid, None)
+        self._ok[uid] = now + self.ttl
+
+    def _prune(self, now):
+        ok = self._ok
+        while ok:
+            uid = next(iter(ok))
+            if ok[uid] > now:
+                break
+            del ok[uid]
+
+    def invalidate(self, uid):
+        if self._ok.pop(uid, None) is not None:
+            self.invalidations += 1
+
+    def hit_ratio(self):
+        total = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+    def metrics(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hit_ratio(), 4),
+            "cached": len(self._ok),
+        }
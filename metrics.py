@@ -0,0 +1,114 @@
+import time
+import functools
+from bisect import bisect_left
+
+# Seconds; spans a cached lookup up to a FloodWait-delayed send
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, le=None):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# Minimal Prometheus registry: counters and histograms updated on the event
+# loop, gauges computed by callbacks at scrape time, rendered in the text
+# exposition format. When disabled, timed() returns the function unchanged
+# and observe()/inc() return at once, so instrumentation costs nothing.
+class Registry:
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._families = {}  # name -> [type, help, label names, {label values: value}]
+
+    def _family(self, kind, name, help, labels):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = [kind, help, tuple(labels), {}]
+        return family
+
+    def counter(self, name, help, labels=()):
+        self._family("counter", name, help, labels)
+
+    def histogram(self, name, help, labels=()):
+        self._family("histogram", name, help, labels)
+
+    # fn() returns a number, or {label values tuple: number}
+    def gauge(self, name, help, fn, labels=(), kind="gauge"):
+        self._family(kind, name, help, labels).append(fn)
+
+    def inc(self, name, labels=(), n=1):
+        if self.enabled:
+            series = self._families[name][3]
+            series[labels] = series.get(labels, 0) + n
+
+    def observe(self, name, labels, value):
+        if self.enabled:
+            series = self._families[name][3]
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(self.buckets)
+            hist.observe(value)
+
+    # Decorator for coroutine functions: latency into histogram `name`
+    def timed(self, name, **labels):
+        if not self.enabled:
+            return lambda fn: fn
+        family = self._families[name]
+        key = tuple(labels[n] for n in family[2])
+
+        def decorate(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                t = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.observe(name, key, time.perf_counter() - t)
+            return wrapper
+        return decorate
+
+    def render(self):
+        out = []
+        for name, family in list(self._families.items()):
+            kind, help, names, series = family[:4]
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            if len(family) > 4:  # callback gauge / counter
+                value = family[4]()
+                items = value.items() if isinstance(value, dict) else [((), value)]
+                for key, v in items:
+                    out.append(f"{name}{_labels(names, key)} {v}")
+                continue
+            for key, value in list(series.items()):
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), list(value.counts)):
+                        cumulative += count
+                        out.append(f"{name}_bucket{_labels(names, key, bound)} {cumulative}")
+                    out.append(f"{name}_sum{_labels(names, key)} {value.sum}")
+                    out.append(f"{name}_count{_labels(names, key)} {value.count}")
+                else:
+                    out.append(f"{name}{_labels(names, key)} {value}")
+        return "\n".join(out) + "\n"
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# Display-name cache with TTL and LRU eviction.
+# Misses are resolved with one batched get_users call; names seen on incoming
+# messages refresh entries for free. Persisted so restarts start warm.
+class NameCache:
+    def __init__(self, path, ttl=86400, capacity=100000):
+        self.path = path
+        self.ttl = ttl
+        self.capacity = capacity
+        self._data = OrderedDict()  # uid -> (first_name, fetched_at)
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def put(self, uid, name, at=None):
+        self._data[uid] = (name or "", at or time.time())
+        self._data.move_to_end(uid)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+        self.dirty = True
+
+    # Refresh from an incoming update; skips the write if nothing changed
+    def seen(self, user):
+        entry = self._data.get(user.id)
+        name = user.first_name or ""
+        if entry is None or entry[0] != name or time.time() - entry[1] > self.ttl / 2:
+            self.put(user.id, name)
+
+    def get(self, uid, stale_ok=False):
+        entry = self._data.get(uid)
+        if entry is None or (not stale_ok and time.time() - entry[1] > self.ttl):
+            return None
+        self._data.move_to_end(uid)
+        return entry[0]
+
+    async def resolve(self, client, uids):
+        names = {}
+        missing = []
+        for uid in uids:
+            name = self.get(uid)
+            if name is None:
+                missing.append(uid)
+            else:
+                names[uid] = name
+        self.hits += len(names)
+        self.misses += len(missing)
+        if missing:
+            try:
+                users = await client.get_users(missing)
+                for user in users if isinstance(users, list) else [users]:
+                    self.put(user.id, user.first_name)
+                    names[user.id] = user.first_name or ""
+            except Exception as e:
+                logger.warning(f"Batched name lookup for {len(missing)} users failed: {e}")
+            for uid in missing:
+                if uid not in names:
+                    names[uid] = self.get(uid, stale_ok=True)
+        return names
+
+    # Persistence
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            for uid, (name, at) in sorted(data.items(), key=lambda x: x[1][1]):
+                self._data[int(uid)] = (name, at)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+        except Exception as e:
+            logger.error(f"Error loading name cache: {e}")
+
+    def _write(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = {uid: list(entry) for uid, entry in self._data.items()}
+        try:
+            await asyncio.to_thread(self._write, data)
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Error saving name cache: {e}")
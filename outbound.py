@@ -0,0 +1,202 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIO_INTERACTIVE = 0  # replies to the user who is waiting
+PRIO_VIDEO = 1        # video deliveries
+PRIO_NOTIFY = 2       # notifications to other users
+PRIO_BROADCAST = 3    # bulk sends
+PRIO_NAMES = ("interactive", "video", "notify", "broadcast")
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "fn", "args", "kwargs", "future", "queued")
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Central scheduler for outgoing Telegram calls.
+# Calls are queued by priority class and dispatched under a global token bucket
+# plus one small bucket per chat. A call whose chat is over its limit waits in a
+# delayed heap without holding up other chats. FloodWait blocks the global
+# bucket and re-queues the call in its original place; other errors go back to
+# the awaiting caller, or are logged for deferred (fire-and-forget) calls.
+# Per-chat buckets are kept for the `max_chats` most recently used chats; past
+# that the least recently used one is dropped, O(1) per new chat (it has most
+# likely refilled by then).
+class OutboundScheduler:
+    def __init__(self, flood_exc, rate=30, per_chat_rate=1, per_chat_burst=3, concurrency=32, quiet_excs=(), observer=None,
+                 max_chats=10000):
+        self.flood_exc = flood_exc
+        self.observer = observer          # observer(method, outcome, seconds) after each call
+        self.quiet_excs = quiet_excs      # expected deferred failures (e.g. user blocked the bot)
+        self.bucket = TokenBucket(rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.concurrency = concurrency
+        self.max_chats = max_chats
+        self.chats = OrderedDict()        # chat_id -> TokenBucket, least recently used first
+        self.queue = []                   # jobs ready to go, by (priority, seq)
+        self.delayed = []                 # (ready_at, job) waiting on their chat's bucket
+        self.seq = itertools.count()
+        self._wakeup = None
+        self._slots = None
+        self._task = None
+        self._inflight = set()
+        self.submitted = [0] * len(PRIO_NAMES)
+        self.sent = [0] * len(PRIO_NAMES)
+        self.failed = [0] * len(PRIO_NAMES)
+        self.wait_total = [0.0] * len(PRIO_NAMES)
+        self.wait_max = [0.0] * len(PRIO_NAMES)
+        self.flood_waits = 0
+        self.flood_wait_s = 0
+
+    # Submission
+    def _push(self, priority, chat_id, fn, args, kwargs, future):
+        job = _Job()
+        job.priority = priority
+        job.seq = next(self.seq)
+        job.chat_id = chat_id
+        job.fn = fn
+        job.args = args
+        job.kwargs = kwargs
+        job.future = future
+        job.queued = time.monotonic()
+        self.submitted[priority] += 1
+        heapq.heappush(self.queue, job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # Queue a call and wait for its result
+    async def call(self, priority, chat_id, fn, *args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._push(priority, chat_id, fn, args, kwargs, future)
+        return await future
+
+    # Queue a call without waiting for it
+    def defer(self, priority, chat_id, fn, *args, **kwargs):
+        self._push(priority, chat_id, fn, args, kwargs, None)
+
+    # Dispatch
+    def _chat(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= self.max_chats:
+                self.chats.popitem(last=False)
+            bucket = self.chats[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        else:
+            self.chats.move_to_end(chat_id)
+        return bucket
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self.delayed and self.delayed[0][0] <= now:
+                heapq.heappush(self.queue, heapq.heappop(self.delayed)[1])
+            if not self.queue:
+                timeout = self.delayed[0][0] - now if self.delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait = self.bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            job = heapq.heappop(self.queue)
+            if job.future is not None and job.future.done():
+                continue  # caller gave up (e.g. cancelled broadcast)
+            chat = self._chat(job.chat_id)
+            wait = chat.delay()
+            if wait > 0:
+                heapq.heappush(self.delayed, (now + wait, job))
+                continue
+            await self._slots.acquire()
+            chat.try_acquire()
+            self.bucket.try_acquire()
+            task = asyncio.create_task(self._run(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, job):
+        p = job.priority
+        started = time.monotonic()
+        waited = started - job.queued
+        outcome = "ok"
+        try:
+            result = await job.fn(*job.args, **job.kwargs)
+        except self.flood_exc as e:
+            outcome = "flood_wait"
+            # Everyone backs off; this call keeps its place in the queue
+            self.flood_waits += 1
+            self.flood_wait_s += e.value
+            self.bucket.block(e.value)
+            heapq.heappush(self.queue, job)
+            self._wakeup.set()
+            logger.warning(f"FloodWait {e.value}s on {PRIO_NAMES[p]} call to {job.chat_id}")
+        except Exception as e:
+            outcome = "error"
+            self.failed[p] += 1
+            if job.future is not None:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            elif not isinstance(e, self.quiet_excs):
+                logger.error(f"Deferred {PRIO_NAMES[p]} call to {job.chat_id} failed: {e}")
+        else:
+            self.sent[p] += 1
+            self.wait_total[p] += waited
+            self.wait_max[p] = max(self.wait_max[p], waited)
+            if job.future is not None and not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._slots.release()
+            if self.observer:
+                self.observer(getattr(job.fn, "__name__", "call"), outcome, time.monotonic() - started)
+
+    # Lifecycle
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._dispatch())
+
+    def pending(self):
+        return len(self.queue) + len(self.delayed) + len(self._inflight)
+
+    # Give queued notifications a chance to go out, then stop dispatching
+    async def stop(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+            self._task = None
+
+    def metrics(self):
+        out = {
+            "queued": len(self.queue),
+            "delayed": len(self.delayed),
+            "inflight": len(self._inflight),
+            "flood_waits": self.flood_waits,
+            "flood_wait_s": self.flood_wait_s,
+        }
+        for p, name in enumerate(PRIO_NAMES):
+            out[name] = {
+                "submitted": self.submitted[p],
+                "sent": self.sent[p],
+                "failed": self.failed[p],
+                "wait_ms_avg": round(self.wait_total[p] * 1000 / self.sent[p], 1) if self.sent[p] else 0.0,
+                "wait_ms_max": round(self.wait_max[p] * 1000, 1),
+            }
+        return out
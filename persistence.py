@@ -0,0 +1,139 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Coalescing background writer for the storage repository.
+# Handlers only mark records dirty; once per interval the dirty set is encoded
+# on the event loop (a consistent snapshot of those records) and written by a
+# worker thread, so json/sqlite I/O never runs on the Pyrogram loop. A full
+# snapshot is encoded a chunk of users at a time with the loop serving
+# handlers in between, so compaction never stalls it for the whole store.
+# stop() flushes whatever is still pending.
+class PersistenceService:
+    def __init__(self, repo, interval=2.0, observer=None):
+        self.repo = repo
+        self.interval = interval
+        self.observer = observer  # observer(kind, seconds, records) after each write
+        self.users = set()
+        self.premium = set()
+        self.feedback = {}
+        self.snapshot_requested = False
+        self._task = None
+        self._lock = asyncio.Lock()
+        # Metrics
+        self.requests = 0        # save requests received
+        self.flushes = 0         # batches written
+        self.records = 0         # records written
+        self.flush_ms_total = 0.0
+        self.flush_ms_last = 0.0
+        self.flush_ms_max = 0.0
+        self.snapshots = 0
+        self.errors = 0
+
+    # Save requests (called from handlers)
+    def user(self, uid):
+        self.requests += 1
+        self.users.add(uid)
+
+    def premium_entry(self, uid):
+        self.requests += 1
+        self.premium.add(uid)
+
+    def feedback_entry(self, uid, text):
+        self.requests += 1
+        self.feedback[uid] = text
+
+    def snapshot(self):
+        self.requests += 1
+        self.snapshot_requested = True
+
+    def pending(self):
+        return bool(self.users or self.premium or self.feedback or self.snapshot_requested)
+
+    # Flushing
+    async def flush(self):
+        async with self._lock:
+            if self.users or self.premium or self.feedback:
+                users, premium, feedback = self.users, self.premium, self.feedback
+                self.users, self.premium, self.feedback = set(), set(), {}
+                batch = self.repo.prepare_batch(users, premium, feedback)
+                count = len(users) + len(premium) + len(feedback)
+                t = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self.repo.write_batch, batch)
+                except Exception as e:
+                    # Keep the records dirty so the next flush retries them
+                    self.users |= users
+                    self.premium |= premium
+                    self.feedback = {**feedback, **self.feedback}
+                    self.errors += 1
+                    logger.error(f"Error flushing {count} records: {e}")
+                else:
+                    self._record(t)
+                    self.records += count
+                    if self.observer:
+                        self.observer("batch", self.flush_ms_last / 1000, count)
+            if self.snapshot_requested or self.repo.needs_snapshot():
+                self.snapshot_requested = False
+                data = await self._prepare_snapshot()
+                t = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self.repo.write_snapshot, data)
+                    self.snapshots += 1
+                    if self.observer:
+                        self.observer("snapshot", time.perf_counter() - t, 0)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Error writing snapshot: {e}")
+
+    async def _prepare_snapshot(self):
+        steps = self.repo.prepare_snapshot_steps()
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
+            await asyncio.sleep(0)
+
+    def _record(self, started):
+        ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flush_ms_last = ms
+        self.flush_ms_total += ms
+        self.flush_ms_max = max(self.flush_ms_max, ms)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.pending():
+                await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "flushes": self.flushes,
+            "coalesced": max(0, self.requests - self.records - self.snapshots),
+            "records": self.records,
+            "flush_ms_last": round(self.flush_ms_last, 2),
+            "flush_ms_avg": round(self.flush_ms_total / self.flushes, 2) if self.flushes else 0.0,
+            "flush_ms_max": round(self.flush_ms_max, 2),
+            "snapshots": self.snapshots,
+            "errors": self.errors,
+        }
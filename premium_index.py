@@ -0,0 +1,58 @@
+import heapq
+
+
+# Min-heaps of premium expiry (and reminder) times, drained in bulk by a
+# background task so premium checks on the hot path never mutate state.
+# Entries are (timestamp, uid[, expiry]); an entry is stale once the user's current
+# expiry no longer matches it (extended or revoked) and is skipped on pop.
+class PremiumIndex:
+    def __init__(self, remind_before=0):
+        self.remind_before = remind_before  # seconds; 0 disables reminders
+        self._expiry = []
+        self._remind = []
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def rebuild(self, premium, now_ts):
+        self._expiry = [(p.expiry, uid) for uid, p in premium.items()]
+        heapq.heapify(self._expiry)
+        # Reminders already due before a restart are not sent again
+        self._remind = []
+        if self.remind_before:
+            self._remind = [(ts - self.remind_before, uid, ts) for ts, uid in self._expiry
+                            if ts - self.remind_before > now_ts]
+            heapq.heapify(self._remind)
+
+    def track(self, uid, expiry_ts):
+        heapq.heappush(self._expiry, (expiry_ts, uid))
+        if self.remind_before:
+            heapq.heappush(self._remind, (expiry_ts - self.remind_before, uid, expiry_ts))
+
+    @staticmethod
+    def _current(premium, uid, ts):
+        p = premium.get(uid)
+        return p is not None and p.expiry == ts
+
+    # Removes expired entries from premium and returns their uids
+    def pop_expired(self, premium, now_ts):
+        expired = []
+        heap = self._expiry
+        while heap and heap[0][0] <= now_ts:
+            ts, uid = heapq.heappop(heap)
+            if self._current(premium, uid, ts):
+                del premium[uid]
+                expired.append(uid)
+        if len(heap) > 2 * len(premium) + 64:
+            self.rebuild(premium, now_ts)
+        return expired
+
+    # Users whose premium expires within remind_before seconds
+    def pop_reminders(self, premium, now_ts):
+        due = []
+        heap = self._remind
+        while heap and heap[0][0] <= now_ts:
+            _, uid, expiry_ts = heapq.heappop(heap)
+            if self._current(premium, uid, expiry_ts):
+                due.append(uid)
+        return due
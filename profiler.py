@@ -0,0 +1,103 @@
+import io
+import os
+import time
+import pstats
+import shutil
+import asyncio
+import cProfile
+import logging
+import tempfile
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+# On-demand profiling of the live bot, one capture at a time.
+# "cpu" runs cProfile on the event loop thread (every handler, callback and
+# task) for a window; "mem" diffs two tracemalloc snapshots taken a window
+# apart. Nothing is hooked while idle. Reports are rendered and written in a
+# worker thread and handed to on_done(paths, error); the files are removed
+# once it returns.
+class Profiler:
+    def __init__(self, top=40):
+        self.top = top
+        self.busy = None          # "cpu" / "mem" while a capture runs
+        self._task = None
+
+    def start(self, kind, seconds, on_done):
+        if self.busy:
+            return False
+        self.busy = kind
+        self._task = asyncio.create_task(self._run(kind, seconds, on_done))
+        return True
+
+    async def _run(self, kind, seconds, on_done):
+        directory = tempfile.mkdtemp(prefix="profile-")
+        try:
+            capture = self._cpu if kind == "cpu" else self._mem
+            paths = await capture(seconds, directory)
+        except Exception as e:
+            logger.error(f"{kind} profile failed: {e}")
+            await on_done([], e)
+        else:
+            await on_done(paths, None)
+        finally:
+            self.busy = None
+            shutil.rmtree(directory, ignore_errors=True)
+
+    # CPU
+    async def _cpu(self, seconds, directory):
+        profile = cProfile.Profile()
+        profile.enable()  # this thread = the event loop thread
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        return await asyncio.to_thread(self._write_cpu, profile, seconds, directory)
+
+    def _write_cpu(self, profile, seconds, directory):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        raw = os.path.join(directory, f"cpu-{stamp}.pstats")
+        profile.dump_stats(raw)
+        out = io.StringIO()
+        out.write(f"CPU profile of the event loop thread, {seconds}s window\n\n")
+        stats = pstats.Stats(profile, stream=out).strip_dirs()
+        out.write(f"== Top {self.top} by cumulative time ==\n")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        out.write(f"== Top {self.top} by own time ==\n")
+        stats.sort_stats("tottime").print_stats(self.top)
+        text = os.path.join(directory, f"cpu-{stamp}.txt")
+        with open(text, "w") as f:
+            f.write(out.getvalue())
+        return [text, raw]
+
+    # Memory
+    async def _mem(self, seconds, directory):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            before = await asyncio.to_thread(tracemalloc.take_snapshot)
+            await asyncio.sleep(seconds)
+            after = await asyncio.to_thread(tracemalloc.take_snapshot)
+        finally:
+            if started:
+                tracemalloc.stop()
+        return await asyncio.to_thread(self._write_mem, before, after, seconds, directory)
+
+    def _write_mem(self, before, after, seconds, directory):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+        before = before.filter_traces(ignore)
+        after = after.filter_traces(ignore)
+        lines = [f"tracemalloc diff over a {seconds}s window\n"]
+        for group in ("lineno", "filename"):
+            diff = after.compare_to(before, group)
+            growth = sum(d.size_diff for d in diff)
+            lines.append(f"\n== Top {self.top} by {group} (net {growth / 1024:+.1f} KiB) ==")
+            lines.extend(str(d) for d in diff[:self.top])
+        current = sum(t.size for t in after.traces)
+        lines.append(f"\nTraced now: {current / 1024 / 1024:.1f} MiB in {len(after.traces)} blocks")
+        path = os.path.join(directory, f"mem-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return [path]
@@ -0,0 +1,106 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+
+# Token bucket: `rate` tokens per second, holding at most `burst`.
+# block() stops all takers until a deadline, e.g. after a FloodWait.
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    # Seconds until a token is available (0 if one is available now)
+    def delay(self):
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def full(self):
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+# One token bucket per key (e.g. per user), at most `max_keys` of them: past
+# that the least recently used bucket is dropped, O(1) per new key. That key
+# would most likely have refilled anyway; if not, it starts over with a full
+# bucket. check() answers "allow", "warn" (first refusal since the key was last
+# allowed, worth one cheap reply) or "drop" (refuse silently).
+class KeyedLimiter:
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.warned = set()
+        self.allowed = 0
+        self.refused = 0
+
+    def check(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.warned.discard(self.buckets.popitem(last=False)[0])
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        else:
+            self.buckets.move_to_end(key)
+        if bucket.try_acquire():
+            self.allowed += 1
+            self.warned.discard(key)
+            return "allow"
+        self.refused += 1
+        if key in self.warned:
+            return "drop"
+        self.warned.add(key)
+        return "warn"
+
+
+# At most one in-flight operation per key; attempts while one runs are
+# coalesced into it (refused and counted) instead of running in parallel.
+class InFlightGuard:
+    def __init__(self):
+        self.active = set()
+        self.coalesced = 0
+
+    def enter(self, key):
+        if key in self.active:
+            self.coalesced += 1
+            return False
+        self.active.add(key)
+        return True
+
+    def leave(self, key):
+        self.active.discard(key)
@@ -0,0 +1,101 @@
+import sys
+from datetime import date, datetime, timezone
+
+from seenset import SeenSet
+from favorites import Favorites
+
+# Compact in-memory records for users and premium entries. Slotted objects
+# instead of dicts, dates as ints (last_reset a day ordinal shared between
+# users of the same day, joined and premium expiry epoch seconds). Rarely read
+# fields live in side tables kept by the repository: language (only users
+# who changed it) and feedback. The on-disk formats are unchanged; encode()
+# and decode() convert.
+
+_DAYS = {}
+
+
+def day_ordinal(day):
+    n = day.toordinal()
+    return _DAYS.setdefault(n, n)
+
+
+def day_from_ordinal(n):
+    return date.fromordinal(n)
+
+
+def epoch(value):
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class User:
+    __slots__ = ("videos_today", "extra_videos_today", "last_reset", "credits", "referrals", "referred_by",
+                 "seen_videos", "favorite_videos", "joined", "notifications")
+
+    def __init__(self, last_reset, joined, videos_today=0, extra_videos_today=0, credits=0, referrals=0,
+                 referred_by=None, seen_videos=None, favorite_videos=None, notifications=True):
+        self.videos_today = videos_today
+        self.extra_videos_today = extra_videos_today
+        self.last_reset = last_reset          # day ordinal
+        self.credits = credits
+        self.referrals = referrals
+        self.referred_by = referred_by        # referrer uid, then "counted"
+        self.seen_videos = seen_videos if seen_videos is not None else SeenSet()
+        self.favorite_videos = favorite_videos if favorite_videos is not None else Favorites()
+        self.joined = joined                  # epoch seconds
+        self.notifications = notifications
+
+    def __repr__(self):
+        return f"User({', '.join(f'{f}={getattr(self, f)!r}' for f in self.__slots__)})"
+
+    # Stored form (the JSON / SQLite record)
+    def encode(self, language="en"):
+        return {
+            "videos_today": self.videos_today,
+            "extra_videos_today": self.extra_videos_today,
+            "last_reset": day_from_ordinal(self.last_reset).isoformat(),
+            "credits": self.credits,
+            "referrals": self.referrals,
+            "referred_by": self.referred_by,
+            "seen_videos": self.seen_videos.encode(),
+            "favorite_videos": self.favorite_videos.encode(),
+            "joined": iso(self.joined),
+            "notifications": self.notifications,
+            "language": language,
+        }
+
+    @classmethod
+    def decode(cls, u):
+        return cls(
+            last_reset=day_ordinal(date.fromisoformat(u["last_reset"][:10])),
+            joined=epoch(u["joined"]),
+            videos_today=u.get("videos_today", 0),
+            extra_videos_today=u.get("extra_videos_today", 0),
+            credits=u.get("credits", 0),
+            referrals=u.get("referrals", 0),
+            referred_by=u.get("referred_by"),
+            seen_videos=SeenSet.decode(u.get("seen_videos")),
+            favorite_videos=Favorites.decode(u.get("favorite_videos")),
+            notifications=bool(u.get("notifications", True)),
+        )
+
+
+class Premium:
+    __slots__ = ("plan", "expiry")
+
+    def __init__(self, plan, expiry):
+        self.plan = sys.intern(plan)
+        self.expiry = expiry                  # epoch seconds
+
+    def __repr__(self):
+        return f"Premium(plan={self.plan!r}, expiry={self.expiry!r})"
+
+    def encode(self):
+        return {"plan": self.plan, "expiry": iso(self.expiry)}
+
+    @classmethod
+    def decode(cls, p):
+        return cls(p["plan"], epoch(p["expiry"]))
@@ -0,0 +1,738 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+from contextlib import contextmanager
+from datetime import date
+
+import snapshot
+
+from journal import Journal
+from snapshot import SnapshotReader
+from records import User, Premium, day_ordinal, day_from_ordinal, epoch, iso
+
+logger = logging.getLogger(__name__)
+
+
+# Record encoding shared by the backends. Language is kept in each backend's
+# `languages` side table (uid -> code, only users not on "en").
+def encode_user(uid, u, languages):
+    return u.encode(languages.get(uid, "en"))
+
+def decode_user(uid, raw, languages):
+    language = raw.get("language", "en")
+    if language != "en":
+        languages[uid] = language
+    return User.decode(raw)
+
+def encode_premium(p):
+    return p.encode()
+
+def decode_premium(p):
+    return Premium.decode(p)
+
+
+# Fields only ever changed through cas_user(uid, expected, new), both dicts
+# over all of them: the daily and credit counters and the referral claim.
+# With several workers on one store this is what keeps limits, credit
+# spending and referral rewards exact.
+ATOMIC_FIELDS = ("videos_today", "extra_videos_today", "last_reset", "credits", "referrals", "referred_by")
+
+def atomic_values(d):
+    return tuple(day_from_ordinal(d[f]).isoformat() if f == "last_reset" else d[f] for f in ATOMIC_FIELDS)
+
+# Compare-and-set on the in-memory record, for stores owned by one process
+def cas_cached(users, uid, expected, new):
+    u = users[uid]
+    if any(getattr(u, f) != expected[f] for f in ATOMIC_FIELDS):
+        return False
+    set_atomic(u, new)
+    return True
+
+def set_atomic(u, values):
+    for f in ATOMIC_FIELDS:
+        setattr(u, f, values[f])
+
+
+# Shared mode: writes on the event loop's connection wait at most
+# LOOP_LOCK_WAIT seconds for another worker's write lock, then raise StoreBusy
+# instead of stalling every handler; the caller retries with retry_busy().
+LOOP_LOCK_WAIT = 0.05
+
+class StoreBusy(Exception):
+    pass
+
+# fn(*args), retried with backoff while it raises StoreBusy, for up to `wait`
+# seconds; the loop keeps serving other updates in between
+async def retry_busy(fn, *args, wait=30):
+    deadline = time.monotonic() + wait
+    delay = 0.005
+    while True:
+        try:
+            return fn(*args)
+        except StoreBusy:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+
+# Both backends split writes into prepare_* (runs on the event loop and encodes
+# a consistent copy of the dirty records) and write_* (safe to run in a worker
+# thread). put_* helpers do both synchronously.
+
+# Users encoded per step of a snapshot (JsonRepository.prepare_snapshot_steps)
+SNAPSHOT_CHUNK = 1000
+
+# Drives a prepare_*_steps generator to the end and returns its result
+def run_steps(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+
+def user_stats(u):
+    return (u.referrals, u.credits, u.videos_today, u.extra_videos_today, u.last_reset, len(u.favorite_videos))
+
+
+# Users of the JSON backend. With a binary snapshot (snapshot.py) the records
+# stay in the memory map and are decoded on first access; the dict itself
+# only holds decoded users, and len()/`in` also count the ones not decoded yet.
+class LazyUsers(dict):
+    def __init__(self, repo, reader=None):
+        super().__init__()
+        self.repo = repo
+        self.reader = reader
+        self.pending = len(reader) if reader is not None else 0  # snapshot users not decoded yet
+
+    def __missing__(self, uid):
+        blob = self.reader.get(uid) if self.pending else None
+        if blob is None:
+            raise KeyError(uid)
+        u = self[uid] = decode_user(uid, json.loads(blob), self.repo.languages)
+        if self.repo.on_load:
+            self.repo.on_load(uid, u)
+        return u
+
+    def __setitem__(self, uid, u):
+        if self.pending and not dict.__contains__(self, uid) and uid in self.reader:
+            self.pending -= 1
+        dict.__setitem__(self, uid, u)
+
+    def __contains__(self, uid):
+        return dict.__contains__(self, uid) or (self.pending > 0 and uid in self.reader)
+
+    def __len__(self):
+        return dict.__len__(self) + self.pending
+
+    def get(self, uid, default=None):
+        try:
+            return self[uid]
+        except KeyError:
+            return default
+
+    # uid + snapshot.STAT_COLUMNS of the users not decoded yet
+    def cold_rows(self):
+        if not self.pending:
+            return ()
+        hot = self.keys()
+        return (row for row in self.reader.rows() if row[0] not in hot)
+
+    # Sum of a snapshot column over the users not decoded yet
+    def cold_sum(self, name):
+        if not self.pending:
+            return 0
+        column = self.reader.columns[name]
+        shadowed = (self.reader.index(uid) for uid in self.keys())
+        return sum(column) - sum(column[i] for i in shadowed if i >= 0)
+
+
+# A snapshot converted to the other format is renamed, not deleted
+def retire(path):
+    if os.path.exists(path):
+        os.replace(path, path + ".migrated")
+        logger.info(f"Converted {path}, the old file is kept as {path}.migrated")
+
+def newer(path, than):
+    return os.path.exists(path) and (not os.path.exists(than) or os.stat(path).st_mtime_ns > os.stat(than).st_mtime_ns)
+
+
+# JSON snapshot + journal backend: everything lives in memory. binary_path is
+# where the binary snapshot lives; with snapshot_format "binary" it is written
+# instead of the JSON one and users are decoded lazily from it. An existing
+# JSON snapshot is read once, converted on the next compaction and retired.
+# Both formats share the journal, so a snapshot in the other format holding
+# newer data is refused rather than loaded with the journal replayed over
+# older records.
+class JsonRepository:
+    def __init__(self, snapshot_path, journal_path, compact_every=5000, binary_path=None, snapshot_format="binary"):
+        self.journal = Journal(snapshot_path, journal_path, compact_every=compact_every)
+        self.binary_path = binary_path
+        self.binary = binary_path is not None and snapshot_format == "binary"
+        if binary_path is not None:
+            self._check_format()
+        self.reader = None
+        self.on_load = None  # on_load(uid, user) when a user is first decoded
+        self.users = LazyUsers(self)
+        self.premium = {}
+        self.feedback = {}
+        self.languages = {}
+
+    def _check_format(self):
+        json_path, snap = self.journal.snapshot_path, self.binary_path
+        if self.binary and os.path.exists(snap) and newer(json_path, snap):
+            raise ValueError(f"{json_path} is newer than {snap}: move {snap} away to convert {json_path} again, "
+                             f"or keep SNAPSHOT_FORMAT=json")
+        if not self.binary and newer(snap, json_path):
+            raise ValueError(f"{snap} is newer than {json_path}: convert it back with "
+                             f"`python repository.py to-json {json_path} {self.journal.journal_path} {snap}`, "
+                             f"or keep SNAPSHOT_FORMAT=binary")
+
+    def load(self):
+        if self.binary and os.path.exists(self.binary_path):
+            self.reader = SnapshotReader(self.binary_path)
+            data = self.journal.load(base=self.reader.extra())
+        else:
+            data = self.journal.load()
+        self.users = LazyUsers(self, self.reader)
+        self.languages = {}
+        for k, v in data["users"].items():
+            self.users[int(k)] = decode_user(int(k), v, self.languages)
+        self.premium = {int(k): decode_premium(v) for k, v in data["premium"].items()}
+        self.feedback = {int(k): v for k, v in data["feedback"].items()}
+
+    # Batched writes: users/premium are uids, feedback maps uid -> text
+    def prepare_batch(self, users=(), premium=(), feedback=None):
+        batch = [("users", uid, encode_user(uid, self.users[uid], self.languages)) for uid in users if uid in self.users]
+        batch += [("premium", uid, encode_premium(self.premium[uid]) if uid in self.premium else None) for uid in premium]
+        for uid, text in (feedback or {}).items():
+            self.feedback[uid] = text
+            batch.append(("feedback", uid, text))
+        return batch
+
+    def write_batch(self, batch):
+        self.journal.append_many(batch)
+
+    def _put(self, **dirty):
+        self.write_batch(self.prepare_batch(**dirty))
+        if self.needs_snapshot():
+            self.snapshot()
+
+    # Users
+    def has_user(self, uid):
+        return uid in self.users
+
+    def put_user(self, uid, u):
+        self.users[uid] = u
+        self._put(users=[uid])
+
+    def add_user(self, uid, u):
+        self.users[uid] = u
+        return True
+
+    def cas_user(self, uid, expected, new):
+        return cas_cached(self.users, uid, expected, new)
+
+    def count_users(self):
+        return len(self.users)
+
+    # Users not decoded yet are decoded for the walk but not kept
+    def iter_users(self):
+        yield from list(self.users.items())
+        for row in list(self.users.cold_rows()):
+            yield row[0], decode_user(row[0], json.loads(self.reader.get(row[0])), self.languages)
+
+    def user_ids(self):
+        return list(self.users) + [row[0] for row in self.users.cold_rows()]
+
+    def referral_counts(self):
+        yield from ((uid, u.referrals) for uid, u in list(self.users.items()))
+        yield from ((row[0], row[1]) for row in self.users.cold_rows())
+
+    # videos_today only counts users already reset on `day` (all users if None);
+    # users still in the binary snapshot are summed from its columns
+    def user_totals(self, day=None):
+        users = self.users
+        ordinal = day and day.toordinal()
+        if day is None:
+            videos = users.cold_sum("videos_today") + users.cold_sum("extra_videos_today")
+        else:
+            videos = sum(row[3] + row[4] for row in users.cold_rows() if row[5] == ordinal)
+        credits = users.cold_sum("credits")
+        referrals = users.cold_sum("referrals")
+        favorites = users.cold_sum("favorites")
+        for u in users.values():
+            if day is None or u.last_reset == ordinal:
+                videos += u.videos_today + u.extra_videos_today
+            credits += u.credits
+            referrals += u.referrals
+            favorites += len(u.favorite_videos)
+        return {"videos_today": videos, "credits": credits, "referrals": referrals, "favorites": favorites}
+
+    # Premium
+    def put_premium(self, uid, p):
+        self.premium[uid] = p
+        self._put(premium=[uid])
+
+    def delete_premium(self, uid):
+        self.premium.pop(uid, None)
+        self._put(premium=[uid])
+
+    def expired_premium(self, at):
+        return [uid for uid, p in self.premium.items() if p.expiry <= at.timestamp()]
+
+    # Feedback
+    def put_feedback(self, uid, text):
+        self._put(feedback={uid: text})
+
+    def recent_feedback(self, n):
+        return list(self.feedback.items())[-n:]
+
+    # Snapshot compaction
+    def needs_snapshot(self):
+        return self.journal.needs_compaction()
+
+    def prepare_snapshot(self):
+        return run_steps(self.prepare_snapshot_steps())
+
+    # prepare_snapshot as a generator that yields after every `chunk` users
+    # and returns the data, so the caller can let the event loop run between
+    # chunks (PersistenceService does). A record changed after its chunk was
+    # encoded is still marked dirty and reaches the journal after the
+    # snapshot, which the journal is replayed over. Users are encoded straight
+    # to JSON text: a dict per user would hand the garbage collector a full
+    # collection over the whole store in the middle of the walk.
+    def prepare_snapshot_steps(self, chunk=SNAPSHOT_CHUNK):
+        uids = list(self.users)
+        encoded = {}
+        for i in range(0, len(uids), chunk):
+            for uid in uids[i:i + chunk]:
+                u = dict.get(self.users, uid)
+                if self.binary:
+                    encoded[uid] = (json.dumps(encode_user(uid, u, self.languages), separators=(",", ":")).encode(), user_stats(u))
+                else:
+                    encoded[uid] = json.dumps(encode_user(uid, u, self.languages))
+            yield
+        return {
+            "users": encoded,
+            "premium": {k: encode_premium(v) for k, v in self.premium.items()},
+            "feedback": dict(self.feedback)
+        }
+
+    def write_snapshot(self, data):
+        if not self.binary:
+            self.journal.compact(data, encoded=("users",))
+            return
+        # Decoded users come from `data`; the rest are copied blob for blob from
+        # the snapshot they were loaded from. That file stays mapped (and is
+        # still the source for users not decoded yet) after the rename.
+        users, reader = data["users"], self.reader
+        count = len(users) + (len(reader) - sum(1 for uid in users if uid in reader) if reader else 0)
+        snapshot.write(self.binary_path, count, self._merge(users, reader),
+                       {"premium": data["premium"], "feedback": data["feedback"]})
+        self.journal.truncate()
+        retire(self.journal.snapshot_path)  # superseded; loading it would roll the store back
+
+    @staticmethod
+    def _merge(users, reader):
+        hot = sorted(users)
+        i = 0
+        for j, row in enumerate(reader.rows() if reader else ()):
+            uid = row[0]
+            while i < len(hot) and hot[i] < uid:
+                yield (hot[i], *users[hot[i]])
+                i += 1
+            if i < len(hot) and hot[i] == uid:
+                yield (uid, *users[uid])
+                i += 1
+            else:
+                yield uid, reader.blob(j), row[1:]
+        for uid in hot[i:]:
+            yield (uid, *users[uid])
+
+    def snapshot(self):
+        self.write_snapshot(self.prepare_snapshot())
+
+    # Back from the binary snapshot to a JSON one (to-json), which retires it
+    def convert_to_json(self):
+        self.journal.compact({
+            "users": {uid: encode_user(uid, u, self.languages) for uid, u in self.iter_users()},
+            "premium": {k: encode_premium(v) for k, v in self.premium.items()},
+            "feedback": dict(self.feedback)
+        })
+        retire(self.binary_path)
+
+    def close(self):
+        self.snapshot()
+        self.journal.close()
+
+
+# Users are hydrated from SQLite on first access and then kept in memory
+class UserCache(dict):
+    def __init__(self, repo):
+        super().__init__()
+        self.repo = repo
+
+    def __missing__(self, uid):
+        u = self.repo.get_user(uid)
+        if u is None:
+            raise KeyError(uid)
+        self[uid] = u
+        if self.repo.on_load:
+            self.repo.on_load(uid, u)
+        return u
+
+    def __contains__(self, uid):
+        return dict.__contains__(self, uid) or self.repo.has_user(uid)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid INTEGER PRIMARY KEY,
+    videos_today INTEGER NOT NULL DEFAULT 0,
+    extra_videos_today INTEGER NOT NULL DEFAULT 0,
+    last_reset TEXT NOT NULL,
+    credits INTEGER NOT NULL DEFAULT 0,
+    referrals INTEGER NOT NULL DEFAULT 0,
+    referred_by,
+    seen_videos TEXT NOT NULL DEFAULT '',
+    favorite_videos TEXT NOT NULL DEFAULT '[]',
+    joined TEXT NOT NULL,
+    notifications INTEGER NOT NULL DEFAULT 1,
+    language TEXT NOT NULL DEFAULT 'en'
+);
+CREATE INDEX IF NOT EXISTS users_referrals ON users (referrals);
+CREATE TABLE IF NOT EXISTS premium (
+    uid INTEGER PRIMARY KEY,
+    plan TEXT NOT NULL,
+    expiry TEXT NOT NULL,
+    expiry_ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS premium_expiry ON premium (expiry_ts);
+CREATE TABLE IF NOT EXISTS feedback (
+    uid INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_seq ON feedback (seq);
+"""
+
+USER_COLUMNS = ("videos_today", "extra_videos_today", "last_reset", "credits", "referrals", "referred_by",
+                "seen_videos", "favorite_videos", "joined", "notifications", "language")
+
+# Constant SQL text, so sqlite3's statement cache keeps these prepared
+UPSERT_USER = (
+    f"INSERT INTO users (uid, {', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * (len(USER_COLUMNS) + 1))}) "
+    f"ON CONFLICT(uid) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in USER_COLUMNS)}"
+)
+SELECT_USER = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE uid = ?"
+# Shared mode: batches never overwrite the atomic fields of an existing row
+UPSERT_USER_SHARED = (
+    f"INSERT INTO users (uid, {', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * (len(USER_COLUMNS) + 1))}) "
+    f"ON CONFLICT(uid) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in USER_COLUMNS if c not in ATOMIC_FIELDS)}"
+)
+INSERT_USER = f"INSERT INTO users (uid, {', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * (len(USER_COLUMNS) + 1))}) ON CONFLICT(uid) DO NOTHING"
+SELECT_ATOMIC = f"SELECT {', '.join(ATOMIC_FIELDS)} FROM users WHERE uid = ?"
+CAS_USER = (
+    f"UPDATE users SET {', '.join(f'{f} = ?' for f in ATOMIC_FIELDS)} "
+    f"WHERE uid = ? AND {' AND '.join(f'{f} IS ?' for f in ATOMIC_FIELDS)}"
+)
+UPSERT_PREMIUM = (
+    "INSERT INTO premium (uid, plan, expiry, expiry_ts) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(uid) DO UPDATE SET plan = excluded.plan, expiry = excluded.expiry, expiry_ts = excluded.expiry_ts"
+)
+UPSERT_FEEDBACK = (
+    "INSERT INTO feedback (uid, text, seq) VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM feedback)) "
+    "ON CONFLICT(uid) DO UPDATE SET text = excluded.text, seq = excluded.seq"
+)
+
+
+def user_row(uid, u, languages):
+    e = encode_user(uid, u, languages)
+    return (uid, e["videos_today"], e["extra_videos_today"], e["last_reset"], e["credits"], e["referrals"],
+            e["referred_by"], e["seen_videos"], json.dumps(e["favorite_videos"]), e["joined"],
+            int(e["notifications"]), e["language"])
+
+def premium_row(uid, p):
+    return (uid, p.plan, iso(p.expiry), p.expiry)
+
+def row_user(uid, row, languages):
+    u = dict(zip(USER_COLUMNS, row))
+    u["favorite_videos"] = json.loads(u["favorite_videos"])
+    return decode_user(uid, u, languages)
+
+def row_atomic(row):
+    values = dict(zip(ATOMIC_FIELDS, row))
+    values["last_reset"] = day_ordinal(date.fromisoformat(values["last_reset"][:10]))
+    return values
+
+
+# SQLite (WAL) backend: users stay on disk and are cached as they are touched;
+# premium entries are few and kept fully in memory; feedback stays on disk.
+# shared=True lets several processes use one database: atomic fields and
+# premium entries are written at once (CAS / upsert) and refreshed from disk
+# by refresh(uid), while batches only carry the other user fields.
+class SqliteRepository:
+    def __init__(self, path, shared=False):
+        self.shared = shared
+        timeout = 30 if shared else 5  # seconds to wait for another process's write lock
+        self.db = sqlite3.connect(path, timeout=timeout)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        if shared:
+            # The loop's connection only writes in shared mode; see LOOP_LOCK_WAIT
+            self.db.execute(f"PRAGMA busy_timeout = {int(LOOP_LOCK_WAIT * 1000)}")
+        # Reads stay on the event loop's connection; batches are written through
+        # a second connection so they can run in a worker thread (WAL lets both
+        # proceed concurrently). Only one batch is written at a time.
+        self.writer = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.on_load = None  # on_load(uid, user) when a user is first read from disk
+        self.users = UserCache(self)
+        self.premium = {}
+        self.languages = {}
+        self.cas_conflicts = 0
+        self.busy = 0
+
+    # A transaction on the loop's connection; a lock held by another worker
+    # past LOOP_LOCK_WAIT is raised as StoreBusy (nothing was written)
+    @contextmanager
+    def _on_loop(self):
+        try:
+            with self.db:
+                yield self.db
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            self.busy += 1
+            raise StoreBusy(str(e)) from e
+
+    def load(self):
+        self.premium = {
+            uid: decode_premium({"plan": plan, "expiry": expiry})
+            for uid, plan, expiry in self.db.execute("SELECT uid, plan, expiry FROM premium")
+        }
+
+    # Users
+    def get_user(self, uid):
+        row = self.db.execute(SELECT_USER, (uid,)).fetchone()
+        return row_user(uid, row, self.languages) if row else None
+
+    def has_user(self, uid):
+        return self.db.execute("SELECT 1 FROM users WHERE uid = ?", (uid,)).fetchone() is not None
+
+    def put_user(self, uid, u):
+        self.users[uid] = u
+        self.write_batch(self.prepare_batch(users=[uid]))
+
+    # False if another worker created the user first (its record is used).
+    # Shared mode: may raise StoreBusy
+    def add_user(self, uid, u):
+        if self.shared:
+            with self._on_loop() as db:
+                created = db.execute(INSERT_USER, user_row(uid, u, self.languages)).rowcount
+            if not created:
+                u = dict.get(self.users, uid) or self.get_user(uid)
+        else:
+            created = True
+        self.users[uid] = u
+        return bool(created)
+
+    # Shared mode: may raise StoreBusy
+    def cas_user(self, uid, expected, new):
+        if not self.shared:
+            return cas_cached(self.users, uid, expected, new)
+        with self._on_loop() as db:
+            done = db.execute(CAS_USER, (*atomic_values(new), uid, *atomic_values(expected))).rowcount
+        if done:
+            u = dict.get(self.users, uid)
+            if u is not None:
+                set_atomic(u, new)
+            return True
+        self.cas_conflicts += 1
+        self.refresh(uid)
+        return False
+
+    # Shared mode: re-read what other workers may have changed (WAL reads do
+    # not wait for writers, but a read can still meet a lock; StoreBusy then)
+    def refresh(self, uid):
+        if not self.shared:
+            return
+        u = dict.get(self.users, uid)
+        with self._on_loop() as db:
+            atomic = db.execute(SELECT_ATOMIC, (uid,)).fetchone() if u is not None else None
+            row = db.execute("SELECT plan, expiry FROM premium WHERE uid = ?", (uid,)).fetchone()
+        if atomic:
+            set_atomic(u, row_atomic(atomic))
+        if row:
+            p = self.premium.get(uid)
+            if p is None or p.expiry != epoch(row[1]) or p.plan != row[0]:
+                self.premium[uid] = decode_premium({"plan": row[0], "expiry": row[1]})
+        else:
+            self.premium.pop(uid, None)
+
+    def count_users(self):
+        return self.db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def iter_users(self):
+        for row in self.db.execute(f"SELECT uid, {', '.join(USER_COLUMNS)} FROM users"):
+            uid = row[0]
+            yield uid, dict.get(self.users, uid) or row_user(uid, row[1:], self.languages)
+
+    def user_ids(self):
+        return [uid for (uid,) in self.db.execute("SELECT uid FROM users")]
+
+    def referral_counts(self):
+        return self.db.execute("SELECT uid, referrals FROM users")
+
+    def user_totals(self, day=None):
+        videos, credits, referrals, favorites = self.db.execute(
+            "SELECT COALESCE(SUM(CASE WHEN ? IS NULL OR last_reset = ? THEN videos_today + extra_videos_today END), 0), "
+            "COALESCE(SUM(credits), 0), COALESCE(SUM(referrals), 0), "
+            "COALESCE(SUM(json_array_length(favorite_videos)), 0) FROM users",
+            (day and day.isoformat(),) * 2
+        ).fetchone()
+        return {"videos_today": videos, "credits": credits, "referrals": referrals, "favorites": favorites}
+
+    # Premium
+    def put_premium(self, uid, p):
+        self.premium[uid] = p
+        self.write_batch(self.prepare_batch(premium=[uid]))
+
+    def delete_premium(self, uid):
+        self.premium.pop(uid, None)
+        self.write_batch(self.prepare_batch(premium=[uid]))
+
+    def expired_premium(self, at):
+        return [uid for (uid,) in self.db.execute("SELECT uid FROM premium WHERE expiry_ts <= ?", (at.timestamp(),))]
+
+    # Shared mode: write the in-memory entry for uid (or its removal) at once;
+    # may raise StoreBusy
+    def write_premium(self, uid):
+        with self._on_loop() as db:
+            p = self.premium.get(uid)
+            if p is not None:
+                db.execute(UPSERT_PREMIUM, premium_row(uid, p))
+            else:
+                db.execute("DELETE FROM premium WHERE uid = ?", (uid,))
+
+    # Shared mode: pick up entries written by other workers; returns the uids
+    # whose entry is new or changed
+    def reload_premium(self):
+        fresh = {
+            uid: decode_premium({"plan": plan, "expiry": expiry})
+            for uid, plan, expiry in self.db.execute("SELECT uid, plan, expiry FROM premium")
+        }
+        changed = [uid for uid, p in fresh.items()
+                   if uid not in self.premium or self.premium[uid].expiry != p.expiry]
+        self.premium.clear()
+        self.premium.update(fresh)
+        return changed
+
+    # Feedback
+    def put_feedback(self, uid, text):
+        self.write_batch(self.prepare_batch(feedback={uid: text}))
+
+    def recent_feedback(self, n):
+        rows = self.db.execute("SELECT uid, text FROM feedback ORDER BY seq DESC LIMIT ?", (n,)).fetchall()
+        return rows[::-1]
+
+    # Batched writes
+    def prepare_batch(self, users=(), premium=(), feedback=None):
+        cached = [uid for uid in users if dict.__contains__(self.users, uid)]
+        return {
+            "users": [user_row(uid, dict.__getitem__(self.users, uid), self.languages) for uid in cached],
+            "premium": [premium_row(uid, self.premium[uid]) for uid in premium if uid in self.premium],
+            "premium_deleted": [(uid,) for uid in premium if uid not in self.premium],
+            "feedback": list((feedback or {}).items()),
+        }
+
+    def write_batch(self, batch):
+        with self.writer:
+            self.writer.executemany(UPSERT_USER_SHARED if self.shared else UPSERT_USER, batch["users"])
+            self.writer.executemany(UPSERT_PREMIUM, batch["premium"])
+            self.writer.executemany("DELETE FROM premium WHERE uid = ?", batch["premium_deleted"])
+            self.writer.executemany(UPSERT_FEEDBACK, batch["feedback"])
+
+    # WAL checkpoint; there is no separate snapshot file
+    def needs_snapshot(self):
+        return False
+
+    def prepare_snapshot(self):
+        return None
+
+    def prepare_snapshot_steps(self):
+        yield from ()
+        return None
+
+    def write_snapshot(self, data):
+        self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def snapshot(self):
+        self.write_snapshot(None)
+
+    def close(self):
+        self.snapshot()
+        self.writer.close()
+        self.db.close()
+
+    # One-shot migration from the JSON backend's snapshot (the binary one at
+    # binary_path if there is one, as the bot would load it) + journal
+    def import_json(self, snapshot_path, journal_path, binary_path=None):
+        src = JsonRepository(snapshot_path, journal_path, binary_path=binary_path)
+        src.load()
+        with self.db:
+            self.db.executemany(UPSERT_USER, (user_row(uid, u, src.languages) for uid, u in src.iter_users()))
+            self.db.executemany(UPSERT_PREMIUM, (premium_row(uid, p) for uid, p in src.premium.items()))
+            for uid, text in src.feedback.items():
+                self.db.execute(UPSERT_FEEDBACK, (uid, text))
+        return src.count_users(), len(src.premium), len(src.feedback)
+
+
+def open_repository(backend, data_file, journal_file, sqlite_file, compact_every=5000, shared=False, binary_file=None,
+                    snapshot_format="binary"):
+    if backend == "sqlite":
+        return SqliteRepository(sqlite_file, shared=shared)
+    if shared:
+        raise ValueError("Several workers need the sqlite storage backend")
+    if backend == "json":
+        return JsonRepository(data_file, journal_file, compact_every=compact_every, binary_path=binary_file,
+                              snapshot_format=snapshot_format)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+# python repository.py import-json bot_data.json bot_data.journal bot_data.db [bot_data.snap]
+# python repository.py to-snapshot bot_data.json bot_data.journal bot_data.snap
+# python repository.py to-json bot_data.json bot_data.journal bot_data.snap
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not (sys.argv[1:2] == ["import-json"] and len(sys.argv) in (5, 6)
+            or sys.argv[1:2] in (["to-snapshot"], ["to-json"]) and len(sys.argv) == 5):
+        print("Usage: python repository.py import-json <data.json> <data.journal> <data.db> [<data.snap>]\n"
+              "       python repository.py to-snapshot <data.json> <data.journal> <data.snap>\n"
+              "       python repository.py to-json <data.json> <data.journal> <data.snap>")
+        sys.exit(1)
+    if sys.argv[1] == "to-snapshot":
+        repo = JsonRepository(sys.argv[2], sys.argv[3], binary_path=sys.argv[4])
+        repo.load()
+        repo.snapshot()  # binary snapshot with every journal entry; the journal is emptied, the JSON retired
+        repo.close()
+        logger.info(f"Wrote {repo.count_users()} users, {len(repo.premium)} premium, {len(repo.feedback)} feedback to {sys.argv[4]}")
+        sys.exit(0)
+    if sys.argv[1] == "to-json":
+        repo = JsonRepository(sys.argv[2], sys.argv[3], binary_path=sys.argv[4])
+        repo.load()
+        repo.convert_to_json()  # JSON snapshot with every journal entry; the binary one is retired
+        repo.journal.close()
+        logger.info(f"Wrote {repo.count_users()} users, {len(repo.premium)} premium, {len(repo.feedback)} feedback to {sys.argv[2]}")
+        sys.exit(0)
+    repo = SqliteRepository(sys.argv[4])
+    users, premium, feedback = repo.import_json(sys.argv[2], sys.argv[3], binary_path=sys.argv[5] if len(sys.argv) == 6 else None)
+    repo.close()
+    logger.info(f"Imported {users} users, {premium} premium, {feedback} feedback into {sys.argv[4]}")
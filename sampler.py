@@ -0,0 +1,72 @@
+import random
+from collections import OrderedDict
+
+
+# Per-user lazily shuffled permutation over the catalog's slot indices
+# (a Fisher-Yates shuffle that only materialises the positions it has touched).
+# Each draw is O(1) amortised: slots that were deleted or already seen through
+# another path are consumed and skipped, so each is paid for at most once.
+# New videos extend the permutation in place; a catalog compaction resets it.
+class UnseenSampler:
+    __slots__ = ("generation", "cursor", "swaps")
+
+    def __init__(self):
+        self.generation = None
+        self.cursor = 0
+        self.swaps = {}
+
+    def draw(self, catalog, seen):
+        if self.generation != catalog.generation:
+            self.generation = catalog.generation
+            self.cursor = 0
+            self.swaps = {}
+        slots = catalog.slots
+        swaps = self.swaps
+        n = len(slots)
+        while self.cursor < n:
+            k = self.cursor
+            j = random.randrange(k, n)
+            picked = swaps.pop(j, j)
+            if j != k:
+                swaps[j] = swaps.pop(k, k)
+            self.cursor = k + 1
+            vid = slots[picked]
+            if vid is not None and vid not in seen:
+                return vid
+        return None  # user has seen everything currently in the catalog
+
+    # Undo the last draw (its video was not delivered), so the slot stays
+    # unseen in this permutation instead of being consumed
+    def put_back(self, catalog, vid):
+        slot = catalog.pos.get(vid)
+        if self.generation != catalog.generation or slot is None or self.cursor == 0:
+            return False
+        k = self.cursor - 1
+        self.cursor = k
+        if slot != k:
+            self.swaps[k] = slot
+        return True
+
+
+# Samplers of recently active users, least recently used evicted past
+# `capacity`. An evicted user's next draw starts a fresh permutation, which
+# costs nothing in correctness: `seen` filters the videos already sent.
+class SamplerCache:
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, uid):
+        sampler = self._data.get(uid)
+        if sampler is None:
+            sampler = self._data[uid] = UnseenSampler()
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._data.move_to_end(uid)
+        return sampler
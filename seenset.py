@@ -0,0 +1,145 @@
+import base64
+from array import array
+from bisect import bisect_left
+
+
+# Compact replacement for a per-user set of seen video ids.
+# Small sets are a sorted array('I') of message ids; once that would be larger
+# than a bitmap over the ids' range, it switches to a bytearray bitmap offset
+# from the lowest id (roaring-style). Encoded for the data file as
+# "a<base64 delta varints>" or "b<lo>:<base64 bitmap>".
+class SeenSet:
+    __slots__ = ("_arr", "_lo", "_bits", "_len")
+
+    def __init__(self, ids=()):
+        self._arr = None
+        self._lo = 0
+        self._bits = None
+        self._len = 0
+        for vid in ids:
+            self.add(vid)
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __contains__(self, vid):
+        if self._bits is not None:
+            off = vid - self._lo
+            return 0 <= off < len(self._bits) * 8 and bool(self._bits[off >> 3] & (1 << (off & 7)))
+        arr = self._arr
+        if not arr:
+            return False
+        i = bisect_left(arr, vid)
+        return i < len(arr) and arr[i] == vid
+
+    def __iter__(self):
+        if self._bits is None:
+            return iter(self._arr or ())
+        return self._iter_bits()
+
+    def _iter_bits(self):
+        lo = self._lo
+        for i, byte in enumerate(self._bits):
+            while byte:
+                low = byte & -byte
+                yield lo + (i << 3) + low.bit_length() - 1
+                byte ^= low
+
+    def add(self, vid):
+        if self._bits is not None:
+            off = vid - self._lo
+            if off < 0:
+                shift = (-off + 7) >> 3
+                self._bits[:0] = bytes(shift)
+                self._lo -= shift << 3
+                off = vid - self._lo
+            elif off >= len(self._bits) * 8:
+                self._bits.extend(bytes((off >> 3) + 1 - len(self._bits)))
+            mask = 1 << (off & 7)
+            if not self._bits[off >> 3] & mask:
+                self._bits[off >> 3] |= mask
+                self._len += 1
+            return
+        if self._arr is None:
+            self._arr = array("I")
+        arr = self._arr
+        i = bisect_left(arr, vid)
+        if i < len(arr) and arr[i] == vid:
+            return
+        arr.insert(i, vid)
+        self._len += 1
+        if self._len * 4 > (arr[-1] - arr[0]) // 8 + 16:
+            self._to_bitmap()
+
+    def discard(self, vid):
+        if vid not in self:
+            return
+        if self._bits is not None:
+            off = vid - self._lo
+            self._bits[off >> 3] &= ~(1 << (off & 7)) & 0xFF
+        else:
+            self._arr.pop(bisect_left(self._arr, vid))
+        self._len -= 1
+
+    def _to_bitmap(self):
+        arr = self._arr
+        self._lo = arr[0] & ~7
+        self._bits = bytearray(((arr[-1] - self._lo) >> 3) + 1)
+        for vid in arr:
+            off = vid - self._lo
+            self._bits[off >> 3] |= 1 << (off & 7)
+        self._arr = None
+
+    # Drop ids of videos that are no longer in the channel
+    def prune(self, valid):
+        kept = [vid for vid in self if vid in valid]
+        if len(kept) != self._len:
+            self.__init__(kept)
+        return self._len
+
+    # On-disk encoding
+    def encode(self):
+        if self._bits is not None:
+            return f"b{self._lo}:" + base64.b64encode(bytes(self._bits)).decode()
+        out = bytearray()
+        prev = 0
+        for vid in self._arr or ():
+            delta = vid - prev
+            prev = vid
+            while delta >= 0x80:
+                out.append((delta & 0x7F) | 0x80)
+                delta >>= 7
+            out.append(delta)
+        return "a" + base64.b64encode(bytes(out)).decode()
+
+    @classmethod
+    def decode(cls, data):
+        s = cls()
+        if not data:
+            return s
+        if isinstance(data, list):  # legacy JSON list of ids
+            for vid in sorted(data):
+                s.add(int(vid))
+            return s
+        if data[0] == "b":
+            lo, _, payload = data[1:].partition(":")
+            s._lo = int(lo)
+            s._bits = bytearray(base64.b64decode(payload))
+            s._len = sum(bin(byte).count("1") for byte in s._bits)
+            return s
+        arr = array("I")
+        vid = shift = delta = 0
+        for byte in base64.b64decode(data[1:]):
+            delta |= (byte & 0x7F) << shift
+            if byte & 0x80:
+                shift += 7
+            else:
+                vid += delta
+                arr.append(vid)
+                delta = shift = 0
+        s._arr = arr
+        s._len = len(arr)
+        return s
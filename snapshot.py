@@ -0,0 +1,118 @@
+import os
+import mmap
+import json
+import struct
+from array import array
+from bisect import bisect_left
+
+# Binary user snapshot, memory-mapped and decoded per user on demand.
+#
+#   header   magic, user count, offset + length of the "extra" JSON blob
+#   columns  one fixed-width array per field below, sorted by uid, each
+#            padded to 8 bytes; uid is bisected in place to find a user
+#   blobs    per-user compact JSON (the record as encode_user() returns it),
+#            then the extra blob (premium entries and feedback)
+#
+# The numeric columns repeat the fields the startup aggregates need (totals,
+# referral counts) so those are computed without decoding any blob.
+MAGIC = b"VHSNAP1\0"
+HEADER = struct.Struct("<8sQQQ")
+COLUMNS = (
+    ("uid", "q"),
+    ("offset", "Q"),
+    ("length", "I"),
+    ("referrals", "i"),
+    ("credits", "i"),
+    ("videos_today", "i"),
+    ("extra_videos_today", "i"),
+    ("last_reset", "i"),   # date ordinal
+    ("favorites", "I"),    # favorite count
+)
+STAT_COLUMNS = tuple(name for name, _ in COLUMNS[3:])
+
+
+def _column_bytes(code, count):
+    size = array(code).itemsize * count
+    return size + (-size) % 8
+
+
+def _layout(count):
+    offsets = {}
+    pos = HEADER.size
+    for name, code in COLUMNS:
+        offsets[name] = pos
+        pos += _column_bytes(code, count)
+    return offsets, pos
+
+
+# records: (uid, blob, stats) in ascending uid order, exactly `count` of them;
+# stats are the STAT_COLUMNS values. Written to a temp file, fsynced, renamed.
+def write(path, count, records, extra):
+    offsets, data_start = _layout(count)
+    columns = {name: array(code) for name, code in COLUMNS}
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.seek(data_start)
+        pos = data_start
+        for uid, blob, stats in records:
+            f.write(blob)
+            columns["uid"].append(uid)
+            columns["offset"].append(pos)
+            columns["length"].append(len(blob))
+            for name, value in zip(STAT_COLUMNS, stats):
+                columns[name].append(value)
+            pos += len(blob)
+        if len(columns["uid"]) != count:
+            raise ValueError(f"Snapshot expected {count} users, got {len(columns['uid'])}")
+        extra_blob = json.dumps(extra, separators=(",", ":")).encode()
+        f.write(extra_blob)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, count, pos, len(extra_blob)))
+        for name, _ in COLUMNS:
+            f.seek(offsets[name])
+            columns[name].tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SnapshotReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._extra_at, self._extra_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a user snapshot")
+        offsets, _ = _layout(self.count)
+        view = memoryview(self._mm)
+        self.columns = {
+            name: view[offsets[name]:offsets[name] + array(code).itemsize * self.count].cast(code)
+            for name, code in COLUMNS
+        }
+        self.uids = self.columns["uid"]
+
+    def __len__(self):
+        return self.count
+
+    def index(self, uid):
+        i = bisect_left(self.uids, uid)
+        return i if i < self.count and self.uids[i] == uid else -1
+
+    def __contains__(self, uid):
+        return self.index(uid) >= 0
+
+    def blob(self, i):
+        start = self.columns["offset"][i]
+        return self._mm[start:start + self.columns["length"][i]]
+
+    def get(self, uid):
+        i = self.index(uid)
+        return self.blob(i) if i >= 0 else None
+
+    # uid plus STAT_COLUMNS, row by row
+    def rows(self):
+        return zip(self.uids, *(self.columns[name] for name in STAT_COLUMNS))
+
+    def extra(self):
+        return json.loads(self._mm[self._extra_at:self._extra_at + self._extra_len])